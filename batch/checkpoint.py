@@ -0,0 +1,289 @@
+import hashlib
+import itertools
+import json
+import logging
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import numpy as np
+
+from workers.process_pool import OUTPUT_DIR, run_work_item
+
+## Instantiate Logger
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+# Batch Default Values
+CONCURRENCY = 8
+FSYNC_EVERY = 100
+FSYNC_INTERVAL_SECONDS = 5.0
+PROGRESS_INTERVAL_SECONDS = 30.0
+
+
+def request_hash(item):
+    """
+    Stable hash of a work item, so that a changed request at the same offset is not skipped on resume
+    """
+    canonical = json.dumps(
+        [item.kind, item.model_id, item.body], sort_keys=True, separators=(",", ":")
+    )
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def _to_json(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class ResultLog:
+    """
+    --> Append-only JSON lines log of a batch job:
+
+        {"type": "header", "concurrency": int, "created": float}
+        {"type": "result", "offset": int, "digest": string, "result": ...}
+        {"type": "error", "offset": int, "digest": string, "error": string}
+
+    Records are flushed on every write and fsync'ed every `fsync_every` records or
+    `fsync_interval_seconds`, whichever comes first. A partially written last line (crash while writing)
+    is ignored when the log is reopened.
+    """
+
+    def __init__(
+        self,
+        path,
+        fsync_every=FSYNC_EVERY,
+        fsync_interval_seconds=FSYNC_INTERVAL_SECONDS,
+    ) -> None:
+        self.path = path
+        self.fsync_every = fsync_every
+        self.fsync_interval_seconds = fsync_interval_seconds
+
+        self.header = None
+        self.completed = set()
+        self._load()
+
+        self.file = open(path, "a", encoding="utf-8")
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+
+        valid_size = 0
+        with open(self.path, "rb") as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                if not line.endswith(b"\n"):
+                    break
+                valid_size += len(line)
+
+                if record["type"] == "header":
+                    self.header = record
+                elif record["type"] == "result":
+                    self.completed.add((record["offset"], record["digest"]))
+
+        ## Drop a torn trailing record so that the next append starts on a fresh line
+        if valid_size < os.path.getsize(self.path):
+            with open(self.path, "r+b") as file:
+                file.truncate(valid_size)
+
+    def is_completed(self, offset, digest):
+        return (offset, digest) in self.completed
+
+    def write_header(self, concurrency):
+        self.header = dict(type="header", concurrency=concurrency, created=time.time())
+        self._write(self.header)
+        self.sync()
+
+    def write_result(self, offset, digest, result):
+        self._write(dict(type="result", offset=offset, digest=digest, result=result))
+        self.completed.add((offset, digest))
+
+    def write_error(self, offset, digest, error):
+        self._write(dict(type="error", offset=offset, digest=digest, error=error))
+
+    def _write(self, record):
+        self.file.write(json.dumps(record, default=_to_json) + "\n")
+        self.file.flush()
+        self.unsynced += 1
+        if (
+            self.unsynced >= self.fsync_every
+            or time.monotonic() - self.last_sync >= self.fsync_interval_seconds
+        ):
+            self.sync()
+
+    def sync(self):
+        os.fsync(self.file.fileno())
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+
+    def close(self):
+        self.sync()
+        self.file.close()
+
+
+class CheckpointedBatch:
+    """
+    --> Resumable batch execution of work items:
+
+    Every completed item is recorded in a ResultLog keyed by its input offset and request digest.
+    Running the same batch again against the same log skips the completed items, retries the failed
+    ones and continues with the concurrency recorded when the batch was first started.
+
+    --> Configuration:
+
+        1. log_path:
+        Path of the append-only result log.
+
+        2. client:
+        bedrock-runtime client used to run the items on local threads, or
+
+        3. pool:
+        BedrockProcessPool used to run the items across worker processes.
+
+        4. concurrency:
+        Items in flight on local threads, defaults to the value recorded in the log or 8.
+
+    --> Progress:
+
+        progress() returns completed, failed, skipped counts, the rate of the current run and the resume
+        point (first offset not yet completed), and is logged every 30 seconds while running.
+    """
+
+    def __init__(
+        self,
+        log_path,
+        client=None,
+        pool=None,
+        concurrency=None,
+        output_dir=OUTPUT_DIR,
+        progress_interval_seconds=PROGRESS_INTERVAL_SECONDS,
+    ) -> None:
+        if client is None and pool is None:
+            raise ValueError("Either a client or a pool is required to run a batch")
+        self.client = client
+        self.pool = pool
+        self.output_dir = output_dir
+        self.progress_interval_seconds = progress_interval_seconds
+
+        self.log = ResultLog(log_path)
+        if self.log.header is None:
+            self.concurrency = concurrency or CONCURRENCY
+            self.log.write_header(self.concurrency)
+        else:
+            self.concurrency = concurrency or self.log.header["concurrency"]
+            logger.info(
+                f"Resuming batch from {log_path}: {len(self.log.completed)} items already completed"
+            )
+
+        self.completed = 0
+        self.failed = 0
+        self.skipped = 0
+        self.started_at = None
+        self.last_progress = 0.0
+        ## Offsets completed beyond the resume point, which advances once the gap is filled
+        self.resume_offset = 0
+        self.done_offsets = set()
+
+    def _pending(self, items):
+        for offset, item in enumerate(items):
+            digest = request_hash(item)
+            if self.log.is_completed(offset, digest):
+                self.skipped += 1
+                self._advance(offset)
+                continue
+            yield offset, digest, item
+
+    def _advance(self, offset):
+        self.done_offsets.add(offset)
+        while self.resume_offset in self.done_offsets:
+            self.done_offsets.discard(self.resume_offset)
+            self.resume_offset += 1
+
+    def _record(self, offset, digest, result=None, error=None):
+        if error is None:
+            self.log.write_result(offset, digest, result)
+            self.completed += 1
+            self._advance(offset)
+        else:
+            self.log.write_error(offset, digest, error)
+            self.failed += 1
+
+        now = time.monotonic()
+        if now - self.last_progress >= self.progress_interval_seconds:
+            self.last_progress = now
+            self.log_progress()
+
+    def _run_on_threads(self, pending):
+        def run(offset, digest, item):
+            try:
+                return offset, digest, run_work_item(self.client, item, self.output_dir), None
+            except Exception as err:
+                return offset, digest, None, f"{type(err).__name__}: {err}"
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            in_flight = set()
+            for offset, digest, item in pending:
+                in_flight.add(executor.submit(run, offset, digest, item))
+                if len(in_flight) >= self.concurrency * 2:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        self._record(*future.result())
+            for future in in_flight:
+                self._record(*future.result())
+
+    def _run_on_pool(self, pending):
+        ## The pool preserves input order, keep the offsets and hashes alongside
+        pending, keys = itertools.tee(pending)
+        items = (item for _, _, item in pending)
+        for (offset, digest, _), work_result in zip(keys, self.pool.map(items)):
+            self._record(offset, digest, work_result.result, work_result.error)
+
+    def run(self, items):
+        """
+        Run every work item not completed yet and return the progress of the batch
+        """
+        self.started_at = time.monotonic()
+        self.last_progress = self.started_at
+        try:
+            if self.pool is not None:
+                self._run_on_pool(self._pending(items))
+            else:
+                self._run_on_threads(self._pending(items))
+        finally:
+            self.log.sync()
+            self.log_progress()
+        return self.progress()
+
+    def progress(self):
+        elapsed = time.monotonic() - self.started_at if self.started_at else 0.0
+        return dict(
+            completed=self.completed,
+            failed=self.failed,
+            skipped=self.skipped,
+            resume_offset=self.resume_offset,
+            items_per_second=self.completed / elapsed if elapsed else 0.0,
+        )
+
+    def log_progress(self):
+        progress = self.progress()
+        logger.info(
+            f"Batch progress: completed={progress['completed']} failed={progress['failed']} "
+            f"skipped={progress['skipped']} resume_offset={progress['resume_offset']} "
+            f"rate={progress['items_per_second']:.2f}/s"
+        )
+
+    def close(self):
+        self.log.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,161 @@
+import json
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+## Instantiate Logger
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+# Pipeline Default Values
+CONCURRENCY = 8
+## Lines held per thread (in flight, or done and waiting to be written) in completion order: the threads
+## go on with the next line while a record is written
+PENDING_PER_THREAD = 2
+## Default size of the reorder buffer in input order, per thread: room for a slow line while the next ones complete
+REORDER_PER_THREAD = 4
+ORDER_COMPLETION = "completion"
+ORDER_INPUT = "input"
+ORDERS = (ORDER_COMPLETION, ORDER_INPUT)
+
+
+def parse_line(line):
+    """
+    (id, values) of an input line: a JSON object of parameters with an optional "id", or the prompt itself
+    """
+    if line.lstrip().startswith("{"):
+        values = json.loads(line)
+        if not isinstance(values, dict):
+            raise ValueError("Input line is not a JSON object")
+        return values.pop("id", None), values
+    return None, dict(prompt=line)
+
+
+class NdjsonPipeline:
+    """
+    --> Concurrent processing of a stream of input lines into NDJSON records, in constant memory:
+
+    A reader thread reads the lines as they arrive and hands them to `concurrency` threads, each calling
+    `handler(values)` with the values of a line (see parse_line) and returning the fields of its record.
+    The calling thread writes one JSON line per input line:
+
+        {"line": int, "id": ..., <fields returned by the handler>, "seconds": float}
+        {"line": int, "id": ..., "error": string, "seconds": float}
+
+    Every line holds a slot from when it is read until its record is written, so that at most `window` lines
+    are in memory whatever the length of the input: when the output is slow (e.g. a slow consumer on a pipe),
+    the writes block, no slot is released and no more input is read.
+
+    --> Configuration:
+
+        1. concurrency:
+        Requests in flight. (default: 8)
+
+        2. order:
+        "completion" writes every record as soon as it is done, "input" in the order of the input lines
+        through a reorder buffer: a slow line holds the records after it, until the window is full.
+
+        3. window:
+        Lines read and not written yet, in flight or in the reorder buffer.
+        (default: 2 per thread in completion order, 4 per thread in input order)
+    """
+
+    def __init__(self, handler, concurrency=CONCURRENCY, order=ORDER_COMPLETION, window=None) -> None:
+        if order not in ORDERS:
+            raise ValueError(f"Unknown order {order!r}, use one of {', '.join(ORDERS)}")
+        self.handler = handler
+        self.concurrency = concurrency
+        self.order = order
+        per_thread = REORDER_PER_THREAD if order == ORDER_INPUT else PENDING_PER_THREAD
+        self.window = max(window or concurrency * per_thread, concurrency)
+        self.slots = threading.Semaphore(self.window)
+        self.stopped = False
+        self.error = None
+        self.records = 0
+        self.failures = 0
+
+    def _process(self, sequence, number, line):
+        started = time.perf_counter()
+        record = dict(line=number)
+        try:
+            record["id"], values = parse_line(line)
+            if record["id"] is None:
+                del record["id"]
+            record.update(self.handler(values))
+        except Exception as err:
+            record["error"] = f"{type(err).__name__}: {getattr(err, 'message', err)}"
+        record["seconds"] = round(time.perf_counter() - started, 3)
+        return sequence, record
+
+    def _read(self, lines, executor, results):
+        """
+        Submit the non blank lines while slots are free, then send the number of lines submitted
+        """
+        sequence = 0
+        try:
+            for number, line in enumerate(lines, start=1):
+                line = line.rstrip("\r\n")
+                if not line.strip():
+                    continue
+                self.slots.acquire()
+                if self.stopped:
+                    break
+                future = executor.submit(self._process, sequence, number, line)
+                future.add_done_callback(lambda future: future.cancelled() or results.put(future.result()))
+                sequence += 1
+        except Exception as err:
+            self.error = err
+        finally:
+            results.put((None, sequence))
+
+    def _write(self, record, output):
+        self.records += 1
+        self.failures += "error" in record
+        output.write(json.dumps(record, separators=(",", ":")) + "\n")
+        self.slots.release()
+
+    def run(self, lines, output):
+        """
+        Process every line of an iterable (e.g. sys.stdin) and write the records to a text file (e.g. sys.stdout),
+        return the counts of the run
+        """
+        started = time.monotonic()
+        results = queue.Queue()
+        executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="ndjson")
+        threading.Thread(target=self._read, args=(lines, executor, results), name="ndjson-reader", daemon=True).start()
+
+        ## Records done before the ones of earlier lines, in input order
+        waiting = {}
+        next_sequence = 0
+        total = None
+        try:
+            while total is None or self.records < total:
+                sequence, record = results.get()
+                if sequence is None:
+                    total = record
+                elif self.order == ORDER_COMPLETION:
+                    self._write(record, output)
+                else:
+                    waiting[sequence] = record
+                    while next_sequence in waiting:
+                        self._write(waiting.pop(next_sequence), output)
+                        next_sequence += 1
+                ## Written out at once when no other record is ready, in one write under load
+                if results.empty():
+                    output.flush()
+        finally:
+            ## On a closed output or an interrupt: no more lines are read, the lines queued are dropped
+            self.stopped = True
+            self.slots.release()
+            executor.shutdown(wait=False, cancel_futures=True)
+        if self.error is not None:
+            raise self.error
+
+        elapsed = time.monotonic() - started
+        logger.info(
+            f"Pipeline: {self.records} records, {self.failures} failed in {elapsed:.2f}s "
+            f"({self.records / elapsed if elapsed else 0.0:.1f}/s)"
+        )
+        return dict(records=self.records, failures=self.failures, seconds=elapsed)
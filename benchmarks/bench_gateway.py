@@ -0,0 +1,153 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+## Instantiate Logger
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+# Benchmark Default Values
+GATEWAY_PORT = 8090
+EMULATOR_PORT = 8091
+CONCURRENT_STREAMS = (10, 50, 100, 200)
+STREAMS_PER_CLIENT = 3
+## Model of the gateway's routes (see cli.py)
+MODEL = "claude"
+PROMPT = "Why do we dream?"
+
+
+def cpu_seconds(pid):
+    """
+    User plus system CPU time of a process, from /proc (Linux)
+    """
+    with open(f"/proc/{pid}/stat") as file:
+        fields = file.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+async def wait_for_port(port, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.1)
+    raise RuntimeError(f"Nothing listening on port {port}")
+
+
+async def one_stream(port, body):
+    """
+    Open one SSE stream through the gateway, return (time to first chunk, total time)
+    """
+    started = time.monotonic()
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(
+        (
+            f"POST /text/{MODEL}/stream HTTP/1.1\r\nHost: localhost\r\n"
+            f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+            "Connection: close\r\n\r\n"
+        ).encode()
+        + body
+    )
+    await writer.drain()
+
+    first_chunk = None
+    buffer = b""
+    while b"event: end" not in buffer:
+        data = await reader.read(65536)
+        if not data:
+            raise RuntimeError("Stream closed before the end event")
+        if first_chunk is None and b"data: " in data:
+            first_chunk = time.monotonic() - started
+        buffer = buffer[-16:] + data
+    writer.close()
+    return first_chunk, time.monotonic() - started
+
+
+async def run_level(port, concurrency, streams_per_client):
+    body = json.dumps(dict(prompt=PROMPT, max_tokens_to_sample=200)).encode()
+    first_chunks, totals = [], []
+
+    async def client():
+        for _ in range(streams_per_client):
+            first_chunk, total = await one_stream(port, body)
+            first_chunks.append(first_chunk)
+            totals.append(total)
+
+    started = time.monotonic()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return first_chunks, totals, time.monotonic() - started
+
+
+async def benchmark(args):
+    environment = dict(
+        os.environ,
+        AWS_ACCESS_KEY_ID="emulator",
+        AWS_SECRET_ACCESS_KEY="emulator",
+        AWS_DEFAULT_REGION="us-east-1",
+    )
+    emulator = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.emulator", "--port", str(args.emulator_port)],
+        env=environment,
+    )
+    gateway = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "gateway.server",
+            "--port",
+            str(args.gateway_port),
+            "--profile",
+            "",
+            "--endpoint-url",
+            f"http://127.0.0.1:{args.emulator_port}",
+            "--max-streams",
+            str(max(args.concurrency)),
+        ],
+        env=environment,
+    )
+    try:
+        await wait_for_port(args.emulator_port)
+        await wait_for_port(args.gateway_port)
+
+        print(f"{'streams':>8} {'streams/s':>10} {'ttft p50':>9} {'ttft p99':>9} {'total p50':>10} {'cpu s':>7} {'streams/cpu-s':>14}")
+        for concurrency in args.concurrency:
+            cpu_before = cpu_seconds(gateway.pid)
+            first_chunks, totals, elapsed = await run_level(
+                args.gateway_port, concurrency, args.streams_per_client
+            )
+            cpu = cpu_seconds(gateway.pid) - cpu_before
+            quantiles = statistics.quantiles(first_chunks, n=100)
+            print(
+                f"{concurrency:>8} {len(totals) / elapsed:>10.1f} {quantiles[49] * 1000:>7.0f}ms "
+                f"{quantiles[98] * 1000:>7.0f}ms {statistics.median(totals) * 1000:>8.0f}ms "
+                f"{cpu:>7.2f} {len(totals) / cpu if cpu else float('inf'):>14.1f}"
+            )
+    finally:
+        gateway.terminate()
+        emulator.terminate()
+        gateway.wait()
+        emulator.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Concurrent SSE streams through the gateway against the local Bedrock emulator"
+    )
+    parser.add_argument("--gateway-port", type=int, default=GATEWAY_PORT)
+    parser.add_argument("--emulator-port", type=int, default=EMULATOR_PORT)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=list(CONCURRENT_STREAMS))
+    parser.add_argument("--streams-per-client", type=int, default=STREAMS_PER_CLIENT)
+    asyncio.run(benchmark(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
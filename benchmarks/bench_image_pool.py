@@ -0,0 +1,73 @@
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+from workers.image_pool import RENDITIONS, ImagePostProcessor, parse_renditions, render
+
+# Benchmark Default Values
+IMAGES = 12
+## Time of one generation, e.g. about 5s for Amazon Titan Image in standard quality
+MODEL_SECONDS = 1.0
+SIZE = 1024
+
+
+def generated_image(index):
+    """
+    Stand-in for a generated image: smooth gradients with noise, which compress like a photograph
+    """
+    y, x = np.mgrid[0:SIZE, 0:SIZE]
+    noise = np.random.default_rng(index).integers(0, 24, (SIZE, SIZE, 3))
+    pixels = np.stack([x * 255 // SIZE, y * 255 // SIZE, (x + y + index * 40) % 256], axis=-1) + noise
+    return Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8), "RGB")
+
+
+def generate(count, model_seconds):
+    for index in range(count):
+        time.sleep(model_seconds)
+        yield index, generated_image(index)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Image throughput with renditions encoded inline or in a process pool")
+    parser.add_argument("--images", type=int, default=IMAGES)
+    parser.add_argument("--model-seconds", type=float, default=MODEL_SECONDS)
+    parser.add_argument("--renditions", default=RENDITIONS)
+    parser.add_argument("--processes", type=int, default=None)
+    args = parser.parse_args()
+
+    renditions = parse_renditions(args.renditions)
+    with tempfile.TemporaryDirectory() as output_dir:
+        started = time.perf_counter()
+        for index, image in generate(args.images, args.model_seconds):
+            render(image, f"inline-{index}", renditions, output_dir)
+        inline = time.perf_counter() - started
+
+        with ImagePostProcessor(renditions, processes=args.processes, output_dir=output_dir) as pool:
+            ## Workers started before the clock, as they are by the first image of a long-running process
+            pool.submit(generated_image(0), "warm-up").result()
+            started = time.perf_counter()
+            for index, image in generate(args.images, args.model_seconds):
+                pool.submit(image, f"pool-{index}")
+        pooled = time.perf_counter() - started
+
+        sizes = {}
+        for name in os.listdir(output_dir):
+            if name.startswith("pool-"):
+                kind = f"{'thumbnail' if name.count('-') > 1 else 'full size'} {name.rsplit('.', 1)[-1]}"
+                sizes.setdefault(kind, []).append(os.path.getsize(os.path.join(output_dir, name)))
+
+    bound = args.images * args.model_seconds
+    print(f"{args.images} images of {SIZE}x{SIZE}, {args.model_seconds:g}s per generation, renditions {args.renditions}")
+    print(f"{'inline':10} {inline:8.2f} s {args.images / inline:8.2f} images/s")
+    print(f"{'pool':10} {pooled:8.2f} s {args.images / pooled:8.2f} images/s")
+    print(f"{'model':10} {bound:8.2f} s {args.images / bound:8.2f} images/s (bound)")
+    for kind, values in sorted(sizes.items()):
+        print(f"{kind:20} {sum(values) / len(values) / 1024:8.1f} KiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import argparse
+import io
+import json
+import logging
+import random
+import time
+
+from utils.log_utils import PayloadSampler, StructuredFormatter, log_payload
+
+# Benchmark Default Values
+CALLS = 2000
+DIMENSIONS = 1024
+CATALOG_MODELS = 60
+
+
+def timed(fn, calls):
+    """
+    Average microseconds per call of fn
+    """
+    started = time.perf_counter()
+    for _ in range(calls):
+        fn()
+    return (time.perf_counter() - started) / calls * 1e6
+
+
+def build_logger(formatter):
+    """
+    Logger writing to an in-memory stream, so that the cost measured is formatting rather than I/O
+    """
+    bench_logger = logging.getLogger("bench_logging")
+    bench_logger.handlers.clear()
+    bench_logger.propagate = False
+    handler = logging.StreamHandler(io.StringIO())
+    handler.setFormatter(formatter)
+    bench_logger.addHandler(handler)
+    bench_logger.setLevel(logging.INFO)
+    return bench_logger
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per call overhead of payload logging")
+    parser.add_argument("--calls", type=int, default=CALLS)
+    args = parser.parse_args()
+
+    embedding = [random.uniform(-1, 1) for _ in range(DIMENSIONS)]
+    catalog = dict(
+        modelSummaries=[
+            dict(
+                modelId=f"provider.model-{index}",
+                modelName=f"Model {index}",
+                inputModalities=["TEXT"],
+                outputModalities=["TEXT"],
+                responseStreamingSupported=True,
+            )
+            for index in range(CATALOG_MODELS)
+        ]
+    )
+    sampled = PayloadSampler(rate=0.01)
+
+    for name, formatter in (
+        ("text", logging.Formatter("%(message)s")),
+        ("json", StructuredFormatter()),
+    ):
+        bench_logger = build_logger(formatter)
+        cases = [
+            ("embedding: eager f-string", lambda: bench_logger.info(f"Generated Embedding: {embedding}")),
+            ("embedding: log_payload", lambda: log_payload(bench_logger, "Generated Embedding", embedding)),
+            (
+                "embedding: log_payload 1% sampled",
+                lambda: log_payload(bench_logger, "Generated Embedding", embedding, sampler=sampled),
+            ),
+            (
+                "embedding: log_payload at DEBUG (disabled)",
+                lambda: log_payload(bench_logger, "Generated Embedding", embedding, level=logging.DEBUG),
+            ),
+            ("catalog: eager json.dumps indent=2", lambda: bench_logger.info(f"Models-\n {json.dumps(catalog, indent=2)}")),
+            ("catalog: log_payload", lambda: log_payload(bench_logger, "Models", catalog)),
+        ]
+
+        print(f"--- {name} formatter, {args.calls} calls")
+        for label, fn in cases:
+            print(f"{label:<45} {timed(fn, args.calls):>10.1f} us/call")
+
+
+if __name__ == "__main__":
+    main()
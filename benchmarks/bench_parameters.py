@@ -0,0 +1,75 @@
+import argparse
+import time
+import tracemalloc
+
+from model_invocation.image.amazon_titan import TitanImageParameters
+from model_invocation.text.anthropic_claude import ClaudeParameters
+from utils.exception_handler import ValidationException
+
+# Benchmark Default Values
+CALLS = 100000
+QUEUED = 200000
+
+
+def timed(fn, calls):
+    """
+    Average microseconds per call of fn
+    """
+    started = time.perf_counter()
+    for _ in range(calls):
+        fn()
+    return (time.perf_counter() - started) / calls * 1e6
+
+
+def rejected(cls, values):
+    try:
+        cls(**values)
+    except ValidationException:
+        return
+    raise AssertionError(f"{values} was accepted")
+
+
+def bytes_per_item(build, count):
+    """
+    Average bytes held per queued item built by build(index)
+    """
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    queue = [build(index) for index in range(count)]
+    used = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+    del queue
+    return used / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cost of local parameter validation and memory of queued requests")
+    parser.add_argument("--calls", type=int, default=CALLS)
+    parser.add_argument("--queued", type=int, default=QUEUED)
+    args = parser.parse_args()
+
+    values = dict(prompt="Why do we dream?", temperature=0.5, max_tokens_to_sample=300)
+    print(f"--- validation, {args.calls} calls")
+    print(f"{'valid Claude parameters':40} {timed(lambda: ClaudeParameters(**values, top_k=250), args.calls):8.2f} us")
+    print(f"{'top_k=900 rejected':40} {timed(lambda: rejected(ClaudeParameters, dict(top_k=900)), args.calls):8.2f} us")
+    print(
+        f"{'Titan image 1000x1000 rejected':40} "
+        f"{timed(lambda: rejected(TitanImageParameters, dict(width=1000, height=1000)), args.calls):8.2f} us"
+    )
+    print(
+        f"{'Titan image 6 images rejected':40} "
+        f"{timed(lambda: rejected(TitanImageParameters, dict(img_counts=6)), args.calls):8.2f} us"
+    )
+
+    ## Prompts are shared, so that only the per-request overhead is measured
+    print(f"--- memory, {args.queued} queued requests")
+    as_dict = bytes_per_item(
+        lambda index: dict(ClaudeParameters(**values, top_k=index % 500).as_dict()), args.queued
+    )
+    as_slots = bytes_per_item(lambda index: ClaudeParameters(**values, top_k=index % 500), args.queued)
+    print(f"{'dict':40} {as_dict:8.0f} bytes per request")
+    print(f"{'ClaudeParameters (__slots__)':40} {as_slots:8.0f} bytes per request")
+
+
+if __name__ == "__main__":
+    main()
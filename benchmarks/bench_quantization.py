@@ -0,0 +1,85 @@
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from retrieval.quantized_index import QuantizedIndex, normalize
+
+# Benchmark Default Values
+VECTORS = 50000
+DIMENSIONS = 1024
+QUERIES = 100
+CLUSTERS = 500
+K = 10
+
+
+def synthetic_embeddings(vectors, dimensions, clusters, seed=7):
+    """
+    Clustered unit vectors, closer to real embeddings than uniform noise, where every neighbour is equally far
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dimensions), dtype=np.float32)
+    labels = rng.integers(0, clusters, vectors)
+    noise = rng.standard_normal((vectors, dimensions), dtype=np.float32)
+    return normalize(centers[labels] + 0.8 * noise)
+
+
+def recall(found, expected):
+    return np.mean([len(set(row) & set(truth)) / len(truth) for row, truth in zip(found, expected)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory, recall and latency of quantized vector search")
+    parser.add_argument("--vectors", type=int, default=VECTORS)
+    parser.add_argument("--dimensions", type=int, default=DIMENSIONS)
+    parser.add_argument("--queries", type=int, default=QUERIES)
+    parser.add_argument("--k", type=int, default=K)
+    args = parser.parse_args()
+
+    corpus = synthetic_embeddings(args.vectors, args.dimensions, CLUSTERS)
+    rng = np.random.default_rng(11)
+    picks = rng.integers(0, args.vectors, args.queries)
+    queries = normalize(corpus[picks] + 0.05 * rng.standard_normal((args.queries, args.dimensions), dtype=np.float32))
+
+    ## Float vectors for re-ranking are read from disk through a memmap, as they would be in production
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "vectors.f32")
+        corpus.tofile(path)
+        on_disk = np.memmap(path, dtype=np.float32, mode="r", shape=corpus.shape)
+
+        baseline = QuantizedIndex(args.dimensions, "float32")
+        baseline.add_float(corpus)
+        expected = [baseline.search(query, args.k)[0] for query in queries]
+
+        print(f"{'index':<22} {'memory MB':>10} {'bytes/vec':>10} {'recall@' + str(args.k):>10} {'ms/query':>9}")
+        for mode, rerank in (
+            ("float32", False),
+            ("int8", False),
+            ("int8", True),
+            ("binary", False),
+            ("binary", True),
+        ):
+            if mode == "float32":
+                index = baseline
+            else:
+                index = QuantizedIndex(args.dimensions, mode)
+                index.add_float(corpus)
+            if rerank:
+                index.attach_float_vectors(on_disk)
+
+            started = time.perf_counter()
+            found = [index.search(query, args.k, rerank=rerank)[0] for query in queries]
+            elapsed = (time.perf_counter() - started) / len(queries) * 1000
+
+            label = f"{mode} + float rerank" if rerank else mode
+            print(
+                f"{label:<22} {index.memory_bytes() / 2**20:>10.1f} {index.memory_bytes() / len(index):>10.0f} "
+                f"{recall(found, expected):>10.3f} {elapsed:>9.2f}"
+            )
+        del on_disk
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import threading
+import time
+
+from benchmarks.emulator import BedrockEmulator
+from utils.client_factory import BedrockClientFactory
+from utils.warmup import warm_up
+
+# Benchmark Default Values
+ROUNDS = 5
+STEADY_REQUESTS = 5
+MODEL_ID = "anthropic.claude-v2"
+BODY = json.dumps(dict(prompt="\n\nHuman: Why do we dream?\n\nAssistant:", max_tokens_to_sample=50))
+
+
+def invoke(client):
+    started = time.perf_counter()
+    client.invoke_model(body=BODY, modelId=MODEL_ID, accept="application/json", contentType="application/json")
+    return time.perf_counter() - started
+
+
+def first_request(client_factory, warm):
+    """
+    Latency of the first request of a new session and client, with or without a completed warm-up
+    """
+    client = client_factory.runtime_client()
+    if warm:
+        warmer = warm_up(client, keepalive_seconds=0)
+        warmer.wait()
+    first = invoke(client)
+    steady = statistics.median(invoke(client) for _ in range(STEADY_REQUESTS))
+    return first, steady
+
+
+def main():
+    parser = argparse.ArgumentParser(description="First request latency with and without connection warm-up")
+    parser.add_argument("--rounds", type=int, default=ROUNDS)
+    parser.add_argument("--endpoint-url", help="bedrock-runtime endpoint, defaults to a local emulator")
+    parser.add_argument("--profile", default="", help='AWS profile, "" for the default credential chain')
+    args = parser.parse_args()
+
+    if args.endpoint_url is None:
+        for name in ("AWS_ACCESS_KEY_ID", "AWS_SECRET_ACCESS_KEY"):
+            os.environ.setdefault(name, "emulator")
+        os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+        loop = asyncio.new_event_loop()
+        emulator = BedrockEmulator(port=0, first_byte_latency_ms=0)
+        loop.run_until_complete(emulator.start())
+        threading.Thread(target=loop.run_forever, daemon=True).start()
+        args.endpoint_url = emulator.endpoint_url
+
+    client_factory = BedrockClientFactory(profile_name=args.profile or None, endpoint_url=args.endpoint_url)
+    print(f"{'':<10} {'first request':>14} {'steady state':>13}")
+    for warm in (False, True):
+        rounds = [first_request(client_factory, warm) for _ in range(args.rounds)]
+        first = statistics.median(first for first, _ in rounds)
+        steady = statistics.median(steady for _, steady in rounds)
+        print(f"{'warm' if warm else 'cold':<10} {first * 1000:>12.1f}ms {steady * 1000:>11.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
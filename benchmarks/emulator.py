@@ -0,0 +1,290 @@
+import argparse
+import asyncio
+import base64
+import json
+import logging
+import struct
+import time
+import zlib
+from io import BytesIO
+from urllib.parse import unquote
+
+from PIL import Image
+
+from gateway.http import HttpError, read_request, response_head, write_response
+from model_invocation.families import family_of, prompt_of
+
+## Instantiate Logger
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+# Emulator Default Values
+HOST = "127.0.0.1"
+PORT = 8089
+FIRST_BYTE_LATENCY_MS = 200
+CHUNK_INTERVAL_MS = 20
+STREAM_CHUNKS = 20
+EMBEDDING_DIMENSIONS = 1024
+WORD = "lorem "
+
+
+def encode_event(payload, event_type="chunk", message_type="event"):
+    """
+    Encode one message of the AWS event stream format used by invoke_model_with_response_stream:
+    prelude (total length, headers length, prelude crc), headers, payload and message crc.
+    With message_type "exception", event_type is the error code, e.g. throttlingException.
+    """
+    headers = b""
+    for name, value in (
+        (":exception-type" if message_type == "exception" else ":event-type", event_type),
+        (":content-type", "application/json"),
+        (":message-type", message_type),
+    ):
+        name, value = name.encode(), value.encode()
+        headers += struct.pack(">B", len(name)) + name
+        headers += struct.pack(">BH", 7, len(value)) + value
+
+    total_length = 12 + len(headers) + len(payload) + 4
+    prelude = struct.pack(">II", total_length, len(headers))
+    prelude += struct.pack(">I", zlib.crc32(prelude))
+    message = prelude + headers + payload
+    return message + struct.pack(">I", zlib.crc32(message))
+
+
+def _chunk_event(data):
+    payload = json.dumps(dict(bytes=base64.b64encode(json.dumps(data).encode()).decode()))
+    return encode_event(payload.encode())
+
+
+def _tiny_png():
+    buffer = BytesIO()
+    Image.new("RGB", (64, 64), (90, 140, 200)).save(buffer, format="PNG")
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+class BedrockEmulator:
+    """
+    --> Local stand-in for the bedrock-runtime endpoint, for benchmarks without network access or cost.
+
+    Serves POST /model/{modelId}/invoke and /model/{modelId}/invoke-with-response-stream with canned responses
+    in the response format of each model family, after a configurable first byte latency and chunk interval.
+    Point a client at it with BedrockClientFactory(endpoint_url="http://127.0.0.1:8089"), any credentials work.
+    """
+
+    def __init__(
+        self,
+        host=HOST,
+        port=PORT,
+        first_byte_latency_ms=FIRST_BYTE_LATENCY_MS,
+        chunk_interval_ms=CHUNK_INTERVAL_MS,
+        stream_chunks=STREAM_CHUNKS,
+    ) -> None:
+        self.host = host
+        self.port = port
+        self.first_byte_latency = first_byte_latency_ms / 1000
+        self.chunk_interval = chunk_interval_ms / 1000
+        self.stream_chunks = stream_chunks
+        self.server = None
+        self.image = _tiny_png()
+        self.requests = 0
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        logger.info(f"Bedrock emulator listening on http://{self.host}:{self.port}")
+
+    async def stop(self):
+        self.server.close()
+
+    @property
+    def endpoint_url(self):
+        return f"http://{self.host}:{self.port}"
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                request = await read_request(reader)
+                if request is None:
+                    break
+                self.requests += 1
+                await self._dispatch(request, writer)
+        except (ConnectionError, asyncio.CancelledError, HttpError):
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, request, writer):
+        parts = request.path.strip("/").split("/")
+        if len(parts) != 3 or parts[0] != "model":
+            await write_response(writer, 404, dict(message="Unknown operation"))
+            return
+
+        model_id = unquote(parts[1])
+        body = request.json()
+        input_tokens = max(1, len(prompt_of(model_id, body)) // 4)
+        await asyncio.sleep(self.first_byte_latency)
+
+        if parts[2] == "invoke":
+            response = self._response(model_id, body, input_tokens)
+            await write_response(
+                writer,
+                200,
+                response,
+                headers={
+                    "x-amzn-bedrock-input-token-count": str(input_tokens),
+                    "x-amzn-bedrock-output-token-count": str(self.stream_chunks),
+                    "x-amzn-bedrock-invocation-latency": str(
+                        int(self.first_byte_latency * 1000)
+                    ),
+                },
+            )
+        else:
+            await self._stream(model_id, input_tokens, writer)
+
+    def _response(self, model_id, body, input_tokens):
+        family = family_of(model_id)["name"]
+        text = WORD * self.stream_chunks
+        if family == "titan-text":
+            return dict(
+                inputTextTokenCount=input_tokens,
+                results=[dict(tokenCount=self.stream_chunks, outputText=text, completionReason="FINISH")],
+            )
+        if family == "claude":
+            return dict(completion=text, stop_reason="stop_sequence", stop="\n\nHuman:")
+        if family == "llama2":
+            return dict(
+                generation=text,
+                prompt_token_count=input_tokens,
+                generation_token_count=self.stream_chunks,
+                stop_reason="stop",
+            )
+        if family == "jurassic2":
+            return dict(completions=[dict(data=dict(text=text), finishReason=dict(reason="endoftext"))])
+        if family == "cohere-command":
+            return dict(
+                id="emulated",
+                generations=[
+                    dict(id=str(index), text=text, finish_reason="COMPLETE", likelihood=-1.0 - index)
+                    for index in range(body.get("num_generations", 1))
+                ],
+            )
+        if family == "titan-embed":
+            vector = self._vector(body.get("inputText", ""))
+            response = dict(embedding=vector, inputTextTokenCount=input_tokens)
+            if "embeddingTypes" in body:
+                response["embeddingsByType"] = {
+                    embedding_type: self._typed(vector, embedding_type, packed=False)
+                    for embedding_type in body["embeddingTypes"]
+                }
+            return response
+        if family == "cohere-embed":
+            texts = body.get("texts", [])
+            vectors = [self._vector(text) for text in texts]
+            if "embedding_types" in body:
+                return dict(
+                    id="emulated",
+                    response_type="embeddings_by_type",
+                    embeddings={
+                        embedding_type: [self._typed(vector, embedding_type, packed=True) for vector in vectors]
+                        for embedding_type in body["embedding_types"]
+                    },
+                    texts=texts,
+                )
+            return dict(id="emulated", response_type="embeddings_floats", embeddings=vectors, texts=texts)
+        if model_id.startswith("stability."):
+            return dict(result="success", artifacts=[dict(seed=0, base64=self.image, finishReason="SUCCESS")])
+        if model_id.startswith("amazon.titan-image"):
+            count = body.get("imageGenerationConfig", {}).get("numberOfImages", 1)
+            return dict(images=[self.image] * count)
+        return dict(completion=text)
+
+    def _vector(self, text):
+        ## Deterministic per text, so that equal texts embed to equal vectors
+        seed = zlib.crc32(text.encode())
+        return [((seed * (index + 1)) % 1000) / 1000 - 0.5 for index in range(EMBEDDING_DIMENSIONS)]
+
+    def _typed(self, vector, embedding_type, packed):
+        """
+        Compressed embedding types: int8 codes, and sign bits either one 0/1 value per dimension (Titan)
+        or packed 8 per byte (Cohere ubinary unsigned, binary signed)
+        """
+        if embedding_type == "int8":
+            return [round(value * 254) for value in vector]
+        if embedding_type not in ("binary", "ubinary"):
+            return vector
+        bits = [int(value > 0) for value in vector]
+        if not packed:
+            return bits
+        values = [int("".join(map(str, bits[start : start + 8])), 2) for start in range(0, len(bits), 8)]
+        if embedding_type == "binary":
+            return [value - 256 if value > 127 else value for value in values]
+        return values
+
+    def _chunk(self, family, index, last):
+        if family == "titan-text":
+            return dict(outputText=WORD, index=0, completionReason="FINISH" if last else None)
+        if family == "llama2":
+            return dict(generation=WORD, stop_reason="stop" if last else None)
+        if family == "cohere-command":
+            if last:
+                return dict(is_finished=True, finish_reason="COMPLETE", text="")
+            return dict(is_finished=False, text=WORD)
+        return dict(completion=WORD, stop_reason="stop_sequence" if last else None)
+
+    async def _stream(self, model_id, input_tokens, writer):
+        family = family_of(model_id)["name"]
+        writer.write(
+            response_head(
+                200,
+                {
+                    "Content-Type": "application/vnd.amazon.eventstream",
+                    "Transfer-Encoding": "chunked",
+                    "x-amzn-bedrock-content-type": "application/json",
+                },
+            )
+        )
+        started = time.monotonic()
+        for index in range(self.stream_chunks):
+            last = index == self.stream_chunks - 1
+            data = self._chunk(family, index, last)
+            if last:
+                data["amazon-bedrock-invocationMetrics"] = dict(
+                    inputTokenCount=input_tokens,
+                    outputTokenCount=self.stream_chunks,
+                    invocationLatency=int((time.monotonic() - started) * 1000),
+                    firstByteLatency=int(self.first_byte_latency * 1000),
+                )
+            event = _chunk_event(data)
+            writer.write(f"{len(event):x}\r\n".encode() + event + b"\r\n")
+            await writer.drain()
+            if not last:
+                await asyncio.sleep(self.chunk_interval)
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the bedrock-runtime endpoint")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--first-byte-latency-ms", type=int, default=FIRST_BYTE_LATENCY_MS)
+    parser.add_argument("--chunk-interval-ms", type=int, default=CHUNK_INTERVAL_MS)
+    parser.add_argument("--stream-chunks", type=int, default=STREAM_CHUNKS)
+    args = parser.parse_args()
+
+    async def serve():
+        emulator = BedrockEmulator(
+            args.host,
+            args.port,
+            args.first_byte_latency_ms,
+            args.chunk_interval_ms,
+            args.stream_chunks,
+        )
+        await emulator.start()
+        await emulator.server.serve_forever()
+
+    asyncio.run(serve())
+
+
+if __name__ == "__main__":
+    main()
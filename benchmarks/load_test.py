@@ -0,0 +1,449 @@
+import argparse
+import importlib
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+
+from recording.cassette import MATCH_MODEL, MATCHES
+from utils.client_factory import BedrockClientFactory
+
+## Instantiate Logger
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+# Load Test Default Values
+RATES = (50, 200, 1000)
+DURATION_SECONDS = 60.0
+INTERVAL_SECONDS = 10.0
+MIX = "text=60,stream=20,embedding=15,image=5"
+PROCESSES = 1
+## Requests running at once per process; arrivals beyond wait in a queue, and the wait counts in their latency
+MAX_IN_FLIGHT = 256
+## Time left to the requests still running after the last arrival, the requests not started by then are cancelled
+DRAIN_SECONDS = 30.0
+EMULATOR_PORT = 8092
+## Samples are sent from the worker processes to the report in batches, every REPORT_SECONDS
+REPORT_SECONDS = 0.5
+PERCENTILES = (50, 95, 99)
+## Waits for a free thread beyond this mean that the load generator, not the service, is the bottleneck
+QUEUE_WARNING_MS = 100
+
+## Error codes of requests refused for exceeding quotas, counted apart from the other errors
+THROTTLE_ERROR_CODES = frozenset(["ThrottlingException", "TooManyRequestsException", "ServiceQuotaExceededException"])
+
+OUTCOME_OK = "ok"
+OUTCOME_THROTTLED = "throttled"
+
+## Workload name -> (generator class, method, parameters); any generator can be given as module:Class[.method]
+WORKLOADS = {
+    "text": ("model_invocation.text.anthropic_claude:AnthropicClaudeTextGenerator", "generate", {}),
+    "stream": ("model_invocation.text.anthropic_claude:AnthropicClaudeTextGenerator", "stream", {}),
+    "embedding": ("model_invocation.embedding.amazon_titan:AmazonTitanEmbeddeing", "generate", {}),
+    "image": ("model_invocation.image.amazon_titan:AmazonTitanImageGenerator", "generate", dict(img_counts=1)),
+}
+
+
+class Workload:
+    """
+    --> One kind of request of the mix:
+
+        1. name: name in the report
+        2. generator: generator class as "module:Class"
+        3. method: "generate", or "stream" for streaming generators (time to first token is then measured)
+        4. params: parameters of every call, missing ones take the default of the generator
+        5. weight: share of the arrivals
+    """
+
+    __slots__ = ("name", "generator", "method", "params", "weight")
+
+    def __init__(self, name, generator, method, params, weight) -> None:
+        self.name = name
+        self.generator = generator
+        self.method = method
+        self.params = params
+        self.weight = weight
+
+    def build(self, client):
+        module, name = self.generator.split(":")
+        return getattr(getattr(importlib.import_module(module), name)(bedrock_client=client), self.method)
+
+
+def parse_mix(mix, params=()):
+    """
+    Workloads from "name=weight,..." where a name is a key of WORKLOADS or module:Class[.method];
+    params are "name=<json object>" overrides of the parameters of a workload
+    """
+    overrides = {}
+    for override in params:
+        name, _, values = override.partition("=")
+        overrides[name.strip()] = json.loads(values)
+
+    workloads = []
+    for entry in mix.split(","):
+        name, _, weight = entry.strip().rpartition("=")
+        if name in WORKLOADS:
+            generator, method, defaults = WORKLOADS[name]
+        elif ":" in name:
+            module, _, generator = name.partition(":")
+            generator, _, method = generator.partition(".")
+            generator, method, defaults = f"{module}:{generator}", method or "generate", {}
+        else:
+            raise ValueError(f"Unknown workload {name!r}, use one of {', '.join(WORKLOADS)} or module:Class[.method]")
+        workloads.append(Workload(name, generator, method, {**defaults, **overrides.get(name, {})}, float(weight)))
+    return workloads
+
+
+def _outcome(err):
+    if isinstance(err, ClientError):
+        code = err.response.get("Error", {}).get("Code", "")
+        ## Errors inside event streams use lower camel case codes (throttlingException)
+        code = code[:1].upper() + code[1:]
+        return OUTCOME_THROTTLED if code in THROTTLE_ERROR_CODES else code or type(err).__name__
+    return type(err).__name__
+
+
+def _worker(index, processes, client_factory, workloads, rates, duration, max_in_flight, seed, samples, go, start_at):
+    """
+    Open-loop arrivals of one worker process: Poisson at rate / processes, which sum to Poisson at `rate`.
+
+    Every request is timed from its scheduled arrival, not from when a thread was free to send it: when the
+    service or this process falls behind, the wait shows in the latency instead of slowing the arrivals down
+    (coordinated omission). Samples are (workload, scheduled, completed, latency, ttft, queued, outcome) with
+    times in seconds from the start of the test.
+    """
+    client = client_factory.runtime_client()
+    ## Generators keep no state between calls: one per workload serves every thread
+    calls = [workload.build(client) for workload in workloads]
+    streaming = [workload.method == "stream" for workload in workloads]
+    choices = range(len(workloads))
+    cumulative = list(itertools.accumulate(workload.weight for workload in workloads))
+    rng = random.Random(seed * 1000 + index)
+
+    batch = []
+    lock = threading.Lock()
+    state = dict(queued=0, in_flight=0)
+    done = threading.Event()
+
+    def report():
+        nonlocal batch
+        while not done.wait(REPORT_SECONDS):
+            with lock:
+                batch, sent = [], batch
+            if sent:
+                samples.put(("samples", sent))
+
+    def invoke(choice, scheduled):
+        started = time.monotonic()
+        with lock:
+            state["queued"] -= 1
+        first = None
+
+        def on_chunk(chunk):
+            nonlocal first
+            if first is None:
+                first = time.monotonic()
+
+        try:
+            if streaming[choice]:
+                calls[choice](workloads[choice].params, (on_chunk,))
+            else:
+                calls[choice](workloads[choice].params)
+            outcome = OUTCOME_OK
+        except Exception as err:
+            outcome = _outcome(err)
+        completed = time.monotonic()
+        sample = (
+            workloads[choice].name,
+            scheduled - origin,
+            completed - origin,
+            completed - scheduled,
+            first - scheduled if first is not None else None,
+            started - scheduled,
+            outcome,
+        )
+        with lock:
+            batch.append(sample)
+            state["in_flight"] -= 1
+
+    executor = ThreadPoolExecutor(max_workers=max_in_flight)
+    reporter = threading.Thread(target=report, daemon=True)
+    samples.put(("ready", index))
+    go.wait()
+    time.sleep(max(0.0, start_at.value - time.time()))
+    origin = time.monotonic()
+    reporter.start()
+
+    for stage, rate in enumerate(rates):
+        arrival, end = stage * duration, (stage + 1) * duration
+        while True:
+            arrival += rng.expovariate(rate / processes)
+            if arrival >= end:
+                break
+            delay = origin + arrival - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            choice = rng.choices(choices, cum_weights=cumulative)[0]
+            with lock:
+                state["queued"] += 1
+                state["in_flight"] += 1
+            executor.submit(invoke, choice, origin + arrival)
+
+    drain_until = time.monotonic() + DRAIN_SECONDS
+    while state["in_flight"] and time.monotonic() < drain_until:
+        time.sleep(0.05)
+    executor.shutdown(wait=True, cancel_futures=True)
+    done.set()
+    reporter.join()
+    with lock:
+        samples.put(("samples", batch))
+        samples.put(("done", state["queued"]))
+
+
+def _percentile(values, percent):
+    """
+    Nearest-rank percentile of sorted values
+    """
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+def _summary(samples, seconds):
+    """
+    Throughput, error and throttle rates, latency and TTFT percentiles (ms) of a set of samples
+    """
+    ok = [sample for sample in samples if sample[6] == OUTCOME_OK]
+    latencies = sorted(sample[3] for sample in ok)
+    ttfts = sorted(sample[4] for sample in ok if sample[4] is not None)
+    throttled = sum(sample[6] == OUTCOME_THROTTLED for sample in samples)
+    summary = dict(
+        requests=len(samples),
+        throughput=len(ok) / seconds,
+        error_rate=(len(samples) - len(ok) - throttled) / len(samples) if samples else 0.0,
+        throttle_rate=throttled / len(samples) if samples else 0.0,
+    )
+    for percent in PERCENTILES:
+        summary[f"p{percent}"] = _percentile(latencies, percent) * 1000 if latencies else None
+        summary[f"ttft_p{percent}"] = _percentile(ttfts, percent) * 1000 if ttfts else None
+    summary["queued_p99"] = _percentile(sorted(sample[5] for sample in samples), 99) * 1000 if samples else None
+    return summary
+
+
+def _ms(value):
+    return f"{value:9.0f}" if value is not None else f"{'-':>9}"
+
+
+def _header(width):
+    return (
+        f"{'':>{width}} {'reqs':>7} {'ok/s':>8} {'err %':>6} {'thr %':>6} "
+        + " ".join(f"{f'p{percent} ms':>9}" for percent in PERCENTILES)
+        + " "
+        + " ".join(f"{f'ttft p{percent}':>9}" for percent in PERCENTILES)
+        + f" {'queue p99':>9}"
+    )
+
+
+def _line(label, samples, seconds, width):
+    summary = _summary(samples, seconds)
+    return (
+        f"{label:>{width}} {summary['requests']:7} {summary['throughput']:8.1f} {summary['error_rate']:6.1%} "
+        f"{summary['throttle_rate']:6.1%} "
+        + " ".join(_ms(summary[f"p{percent}"]) for percent in PERCENTILES)
+        + " "
+        + " ".join(_ms(summary[f"ttft_p{percent}"]) for percent in PERCENTILES)
+        + f" {_ms(summary['queued_p99'])}"
+    )
+
+
+def run(client_factory, workloads, rates, duration, interval, processes, max_in_flight, seed):
+    """
+    Drive the workloads at every rate in turn for `duration` seconds each, print the requests completed in every
+    interval as they finish, then a summary per rate and workload by arrival; return the samples
+    """
+    context = multiprocessing.get_context("spawn")
+    samples = context.Queue()
+    go = context.Event()
+    start_at = context.Value("d", 0.0)
+    workers = [
+        context.Process(
+            target=_worker,
+            args=(
+                index, processes, client_factory, workloads, rates, duration, max_in_flight, seed, samples, go, start_at
+            ),
+            daemon=True,
+        )
+        for index in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+    ready = 0
+    while ready < len(workers):
+        try:
+            ready += samples.get(timeout=1.0)[0] == "ready"
+        except queue.Empty:
+            if any(worker.exitcode is not None for worker in workers):
+                raise RuntimeError("A worker process failed to start")
+
+    start_at.value = time.time() + 0.5
+    go.set()
+    origin = time.monotonic() + (start_at.value - time.time())
+
+    print(f"Open-loop Poisson arrivals at {', '.join(f'{rate:g}' for rate in rates)} RPS, {duration:g}s each, "
+          f"{processes} process(es) of {max_in_flight} threads")
+    width = max([14] + [len(workload.name.rpartition(":")[2]) for workload in workloads])
+    print(f"--- completed per {interval:g}s (latency of successful requests)")
+    print(_header(width))
+    collected, window, reported = [], {}, 0
+    finished, cancelled = 0, 0
+    while finished < len(workers):
+        try:
+            kind, payload = samples.get(timeout=REPORT_SECONDS)
+        except queue.Empty:
+            if not any(worker.is_alive() for worker in workers):
+                logger.error("Worker processes exited before reporting all their samples")
+                break
+            kind, payload = None, None
+        if kind == "samples":
+            collected += payload
+            for sample in payload:
+                window.setdefault(int(sample[2] // interval), []).append(sample)
+        elif kind == "done":
+            finished += 1
+            cancelled += payload
+        ## An interval is printed once the batches of all its samples have arrived
+        elapsed = time.monotonic() - origin
+        while (reported + 1) * interval + 2 * REPORT_SECONDS < elapsed or (finished == len(workers) and window):
+            stage = min(len(rates) - 1, int(reported * interval // duration))
+            label = f"{reported * interval:g}s @{rates[stage]:g}"
+            if reported in window:
+                print(_line(label, window.pop(reported), interval, width))
+            reported += 1
+    for worker in workers:
+        worker.join()
+
+    print("--- by arrival rate (requests arrived at that rate, wherever they completed)")
+    print(_header(width))
+    overloaded = []
+    for stage, rate in enumerate(rates):
+        arrived = [sample for sample in collected if stage * duration <= sample[1] < (stage + 1) * duration]
+        ## Throughput over the time these requests took, from the first arrival to the last completion
+        seconds = max(sample[2] for sample in arrived) - stage * duration if arrived else duration
+        print(_line(f"{rate:g} RPS", arrived, seconds, width))
+        for workload in workloads:
+            selected = [sample for sample in arrived if sample[0] == workload.name]
+            print(_line(workload.name.rpartition(":")[2], selected, seconds, width))
+        if arrived and _summary(arrived, seconds)["queued_p99"] > QUEUE_WARNING_MS:
+            overloaded.append(f"{rate:g}")
+    errors = {}
+    for sample in collected:
+        if sample[6] != OUTCOME_OK:
+            errors[sample[6]] = errors.get(sample[6], 0) + 1
+    if errors or cancelled:
+        print("--- errors")
+        for outcome, count in sorted(errors.items(), key=lambda item: -item[1]):
+            print(f"{outcome:40} {count:8}")
+        if cancelled:
+            print(f"{'not started before the end of the drain':40} {cancelled:8}")
+    if overloaded:
+        logger.warning(
+            f"The load generator fell behind at {', '.join(overloaded)} RPS (queue p99 above {QUEUE_WARNING_MS}ms): "
+            "the latencies include its own delay, add --processes or --max-in-flight"
+        )
+    return collected
+
+
+def wait_for_port(port, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1.0).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Nothing listening on port {port}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Open-loop load test of the generators at target arrival rates, against a local emulator "
+        "(default), a recorded cassette (--replay), another stand-in endpoint (--endpoint-url) or the Amazon "
+        "Bedrock service (--service)"
+    )
+    parser.add_argument("--rates", type=float, nargs="+", default=list(RATES), help="arrivals per second, in turn")
+    parser.add_argument("--duration", type=float, default=DURATION_SECONDS, help="seconds per rate")
+    parser.add_argument("--interval", type=float, default=INTERVAL_SECONDS, help="seconds per reported interval")
+    parser.add_argument("--mix", default=MIX, help="name=weight,... of text, stream, embedding, image or "
+                        "module:Class[.method] workloads")
+    parser.add_argument("--params", action="append", default=[], help='parameters of a workload, e.g. '
+                        'text=\'{"max_tokens_to_sample": 50}\'')
+    parser.add_argument("--processes", type=int, default=PROCESSES, help="worker processes sharing the rate")
+    parser.add_argument("--max-in-flight", type=int, default=MAX_IN_FLIGHT, help="concurrent requests per process")
+    parser.add_argument("--retry-attempts", type=int, default=None, help="attempts per call, default botocore's")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--service", action="store_true", help="call the Amazon Bedrock service")
+    parser.add_argument("--endpoint-url", help="bedrock-runtime endpoint of a stand-in already running")
+    parser.add_argument("--profile", default="", help='AWS profile, "" for the default credential chain')
+    parser.add_argument("--region", default=None)
+    parser.add_argument("--emulator-port", type=int, default=EMULATOR_PORT)
+    parser.add_argument("--first-byte-latency-ms", type=int, default=None, help="of the local emulator")
+    parser.add_argument("--replay", default=None, help="serve this cassette instead of the emulator, e.g. in CI")
+    parser.add_argument("--time-scale", type=float, default=None, help="of the replayed cassette")
+    parser.add_argument("--match", choices=MATCHES, default=MATCH_MODEL, help="of the replayed cassette")
+    args = parser.parse_args()
+
+    workloads = parse_mix(args.mix, args.params)
+    emulator = None
+    if not args.service and args.endpoint_url is None:
+        for name in ("AWS_ACCESS_KEY_ID", "AWS_SECRET_ACCESS_KEY"):
+            os.environ.setdefault(name, "emulator")
+        os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+        if args.replay:
+            command = [sys.executable, "-m", "recording.replay", args.replay, "--match", args.match]
+            if args.time_scale is not None:
+                command += ["--time-scale", str(args.time_scale)]
+        else:
+            command = [sys.executable, "-m", "benchmarks.emulator"]
+            if args.first_byte_latency_ms is not None:
+                command += ["--first-byte-latency-ms", str(args.first_byte_latency_ms)]
+        command += ["--port", str(args.emulator_port)]
+        ## A process of its own, so that serving does not take CPU time from the load generator
+        emulator = subprocess.Popen(command)
+        wait_for_port(args.emulator_port)
+        args.endpoint_url = f"http://127.0.0.1:{args.emulator_port}"
+
+    client_factory = BedrockClientFactory(
+        profile_name=args.profile or None,
+        region_name=args.region,
+        endpoint_url=args.endpoint_url,
+        max_pool_connections=args.max_in_flight,
+        retry_attempts=args.retry_attempts,
+    )
+    try:
+        run(
+            client_factory,
+            workloads,
+            args.rates,
+            args.duration,
+            args.interval,
+            args.processes,
+            args.max_in_flight,
+            args.seed,
+        )
+    finally:
+        if emulator is not None:
+            emulator.terminate()
+            emulator.wait()
+
+
+if __name__ == "__main__":
+    main()
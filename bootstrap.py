@@ -0,0 +1,245 @@
+import atexit
+import logging
+import os
+
+## Instantiate Logger
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+
+def _flag(name, default=""):
+    return os.environ.get(name, default).strip().lower() in ("1", "true", "yes")
+
+
+def start_profiler():
+    """
+    Optional profiling of the invocation hot path, enabled with BEDROCK_PROFILE=sample|cprofile; the reports are
+    written on exit to BEDROCK_PROFILE_DIR (default: profiles), BEDROCK_PROFILE_MEMORY=0 turns tracemalloc off
+    """
+    profile_mode = os.environ.get("BEDROCK_PROFILE", "").strip().lower()
+    if not profile_mode:
+        return None
+
+    from profiling.profiler import OUTPUT_DIR, Profiler
+
+    profiler = Profiler(
+        os.environ.get("BEDROCK_PROFILE_DIR", OUTPUT_DIR),
+        mode=profile_mode,
+        trace_memory=_flag("BEDROCK_PROFILE_MEMORY", "1"),
+    ).start()
+    atexit.register(profiler.stop)
+    return profiler
+
+
+def build_clients(profiler=None, control=True, max_pool_connections=None):
+    """
+    Build the Amazon Bedrock clients, the runtime client wrapped with the optional features enabled by the
+    environment. Return (control client, runtime client, token estimator); the control client is None
+    with control=False, for the commands which only invoke models, and when replaying a cassette.
+    Concurrent callers need as many max_pool_connections as requests in flight.
+    """
+    from utils.client_factory import BedrockClientFactory, MAX_POOL_CONNECTIONS
+    from utils.token_estimator import TokenCountingClient, TokenEstimator
+
+    ## Optional circuit breakers per model with a shared retry budget, enabled with BEDROCK_CIRCUIT_BREAKER=1
+    circuit_breaker = _flag("BEDROCK_CIRCUIT_BREAKER")
+
+    ## Optional deadline of every invocation, streams included, enabled with BEDROCK_DEADLINE_SECONDS=<seconds>;
+    ## with BEDROCK_DEADLINE_PARTIAL=return a stream cut short returns its text so far instead of raising
+    deadline_seconds = float(os.environ.get("BEDROCK_DEADLINE_SECONDS") or 0)
+    connect_timeout = None
+    if deadline_seconds:
+        from resilience.deadline import CONNECT_TIMEOUT_SECONDS
+
+        connect_timeout = min(deadline_seconds, CONNECT_TIMEOUT_SECONDS)
+
+    ## Retries come from the budget of the circuit breakers rather than from botocore
+    retry_attempts = 1 if circuit_breaker else None
+    max_pool_connections = max(max_pool_connections or 0, MAX_POOL_CONNECTIONS)
+    token_estimator = TokenEstimator()
+
+    ## Optional offline replay of a cassette instead of calling Amazon Bedrock, enabled with
+    ## BEDROCK_REPLAY=<cassette>; BEDROCK_REPLAY_TIME_SCALE=0.5 replays twice as fast, 0 without waits, and
+    ## BEDROCK_REPLAY_MATCH=model answers the requests not in the cassette with another one of the same model
+    replay_cassette = os.environ.get("BEDROCK_REPLAY", "").strip()
+    if replay_cassette:
+        from recording.cassette import Cassette, MATCH_BODY
+        from recording.replay import ReplayServer
+
+        ## No AWS profile, session nor control client is resolved, e.g. on a CI runner without credentials
+        replay_server = ReplayServer(
+            Cassette.load(replay_cassette),
+            port=0,
+            time_scale=float(os.environ.get("BEDROCK_REPLAY_TIME_SCALE") or 1),
+            match=os.environ.get("BEDROCK_REPLAY_MATCH", "").strip().lower() or MATCH_BODY,
+        ).start_background()
+        control_client = None
+        runtime_client = replay_server.runtime_client(
+            retry_attempts=retry_attempts,
+            connect_timeout=connect_timeout,
+            max_pool_connections=max_pool_connections,
+        )
+    else:
+        ## Creating session with AWS profile, credentials shared with the other processes of the host
+        ## when enabled with BEDROCK_SHARED_CREDENTIALS=1
+        client_factory = BedrockClientFactory(
+            profile_name="bedrock-profile",
+            shared_credentials=_flag("BEDROCK_SHARED_CREDENTIALS"),
+            retry_attempts=retry_attempts,
+            connect_timeout=connect_timeout,
+            max_pool_connections=max_pool_connections,
+        )
+        session = client_factory.session()
+
+        # bedrock – Contains control plane APIs for managing, training, and deploying models
+        control_client = client_factory.control_client(session) if control else None
+
+        # bedrock-runtime – Contains runtime plane APIs for making inference requests for models hosted in
+        # Amazon Bedrock
+        runtime_client = client_factory.runtime_client(session)
+
+    ## Optional warm-up of credentials and pooled connections while the menu starts,
+    ## enabled with BEDROCK_WARMUP_CONNECTIONS=<connections>
+    if os.environ.get("BEDROCK_WARMUP_CONNECTIONS"):
+        from utils.warmup import warm_up
+
+        warm_up(runtime_client, connections=int(os.environ["BEDROCK_WARMUP_CONNECTIONS"]))
+
+    ## Optional recording of every invocation into a cassette written on exit, enabled with BEDROCK_RECORD=<cassette>;
+    ## innermost, so that the requests are recorded as sent and the timings without local waits
+    record_cassette = os.environ.get("BEDROCK_RECORD", "").strip()
+    if record_cassette:
+        from recording.cassette import RecordingClient
+
+        runtime_client = RecordingClient(runtime_client)
+        atexit.register(runtime_client.cassette.save, record_cassette)
+
+    ## Innermost, so that the network stages do not include admission waits and retry backoffs
+    if profiler is not None:
+        from profiling.profiler import ProfiledClient
+
+        runtime_client = ProfiledClient(runtime_client)
+
+    ## Optional RPM/TPM admission, enabled with BEDROCK_REQUESTS_PER_MINUTE and/or BEDROCK_TOKENS_PER_MINUTE
+    if "BEDROCK_REQUESTS_PER_MINUTE" in os.environ or "BEDROCK_TOKENS_PER_MINUTE" in os.environ:
+        from scheduling.scheduler import (
+            ScheduledClient,
+            TokenRateScheduler,
+            REQUESTS_PER_MINUTE,
+            TOKENS_PER_MINUTE,
+        )
+
+        scheduler = TokenRateScheduler(
+            requests_per_minute=int(
+                os.environ.get("BEDROCK_REQUESTS_PER_MINUTE", REQUESTS_PER_MINUTE)
+            ),
+            tokens_per_minute=int(
+                os.environ.get("BEDROCK_TOKENS_PER_MINUTE", TOKENS_PER_MINUTE)
+            ),
+        )
+        runtime_client = ScheduledClient(runtime_client, scheduler, token_estimator)
+
+    ## Checked before the scheduler, so that calls to a model whose circuit is open do not wait for admission;
+    ## the time waiting for admission is not counted in the latency of the model
+    if circuit_breaker:
+        from resilience.circuit_breaker import ResilientClient
+
+        runtime_client = ResilientClient(runtime_client)
+
+    ## Around the circuit breakers, so that their retries stop at the deadline
+    if deadline_seconds:
+        from resilience.deadline import DeadlineClient, PARTIAL_RAISE
+
+        runtime_client = DeadlineClient(
+            runtime_client,
+            deadline_seconds,
+            partial=os.environ.get("BEDROCK_DEADLINE_PARTIAL", PARTIAL_RAISE).strip().lower(),
+        )
+        atexit.register(runtime_client.log_stats)
+
+    ## Wrapped to reject oversize prompts locally and calibrate the token estimator from every response
+    runtime_client = TokenCountingClient(runtime_client, token_estimator)
+    return control_client, runtime_client, token_estimator
+
+
+def build_text_arguments(runtime_client, token_estimator):
+    """
+    Semantic cache and retriever of the text generators, as their keyword arguments (None when disabled)
+    """
+    ## Optional semantic cache for the text generators, enabled with BEDROCK_SEMANTIC_CACHE=titan|cohere;
+    ## BEDROCK_SEMANTIC_CACHE_NAMESPACE=<name> keeps the entries apart from other applications
+    semantic_cache = None
+    cache_embedder = os.environ.get("BEDROCK_SEMANTIC_CACHE", "").strip().lower()
+    if cache_embedder:
+        from caching.semantic_cache import NAMESPACE, SemanticCache, SIMILARITY_THRESHOLD
+
+        if cache_embedder == "cohere":
+            from model_invocation.embedding.cohere import CohereEmbeddeing as Embedder
+        else:
+            from model_invocation.embedding.amazon_titan import AmazonTitanEmbeddeing as Embedder
+
+        semantic_cache = SemanticCache(
+            Embedder(bedrock_client=runtime_client),
+            threshold=float(
+                os.environ.get("BEDROCK_SEMANTIC_CACHE_THRESHOLD", SIMILARITY_THRESHOLD)
+            ),
+            namespace=os.environ.get("BEDROCK_SEMANTIC_CACHE_NAMESPACE", "").strip() or NAMESPACE,
+        )
+        atexit.register(semantic_cache.log_stats)
+
+    ## Optional retrieval-augmented generation over a corpus ingested with `python -m retrieval.ingestion`,
+    ## enabled with BEDROCK_RAG_STORE=<store directory> and BEDROCK_RAG_EMBEDDER=titan|cohere (the corpus embedder)
+    retriever = None
+    rag_store = os.environ.get("BEDROCK_RAG_STORE", "").strip()
+    if rag_store:
+        from retrieval.rag import Retriever
+        from retrieval.vector_store import VectorStore
+        from utils.exception_handler import ValidationException
+
+        ## VectorStore creates a missing directory, which would hide a mistyped path
+        if not os.path.isdir(rag_store):
+            raise ValidationException(
+                f"BEDROCK_RAG_STORE {rag_store} is not a directory, ingest a corpus with python -m retrieval.ingestion"
+            )
+
+        if os.environ.get("BEDROCK_RAG_EMBEDDER", "titan").strip().lower() == "cohere":
+            from model_invocation.embedding.cohere import CohereEmbeddeing, MODEL_ID_COHERE
+
+            rag_embedder = CohereEmbeddeing(bedrock_client=runtime_client)
+            rag_model_id = MODEL_ID_COHERE
+            rag_arguments = dict(input_type="search_query")
+        else:
+            from model_invocation.embedding.amazon_titan import AmazonTitanEmbeddeing, MODEL_ID_TITAN
+
+            rag_embedder = AmazonTitanEmbeddeing(bedrock_client=runtime_client)
+            rag_model_id = MODEL_ID_TITAN
+            rag_arguments = None
+
+        retriever = Retriever(
+            VectorStore(rag_store),
+            rag_embedder,
+            os.environ.get("BEDROCK_RAG_MODEL_ID", rag_model_id),
+            embed_arguments=rag_arguments,
+            estimator=token_estimator,
+        )
+    return dict(semantic_cache=semantic_cache, retriever=retriever)
+
+
+def build_image_post_processor():
+    """
+    Optional WebP/JPEG renditions and thumbnails of the generated images, encoded in worker processes while
+    the next image is generated, enabled with BEDROCK_IMAGE_RENDITIONS=<format:quality[:max size],...>
+    (e.g. webp:80,jpeg:85,webp:75:256) and BEDROCK_IMAGE_WORKERS=<processes> (default: number of cores)
+    """
+    image_renditions = os.environ.get("BEDROCK_IMAGE_RENDITIONS", "").strip()
+    if not image_renditions:
+        return None
+
+    from workers.image_pool import ImagePostProcessor
+
+    image_post_processor = ImagePostProcessor(
+        image_renditions, processes=int(os.environ.get("BEDROCK_IMAGE_WORKERS") or 0) or None
+    )
+    ## Registered after the profiler, so that the images still in the pool are written before its report
+    atexit.register(image_post_processor.close)
+    return image_post_processor
@@ -0,0 +1,274 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+
+import numpy as np
+
+## Instantiate Logger
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+# Cache Configuration Default Values
+SIMILARITY_THRESHOLD = 0.92
+MAX_ENTRIES = 1024
+TTL_SECONDS = 3600
+EVICTION_POLICY = "lru"
+EVICTION_POLICIES = ("lru", "fifo")
+NAMESPACE = "default"
+
+
+class _Namespace:
+    """
+    Cached prompts of a single namespace (one per model id and inference parameters, see namespace_of).
+    Normalized prompt vectors are held in one contiguous matrix so that a lookup is a single
+    matrix-vector product, the payloads live in parallel lists indexed by matrix row.
+    """
+
+    def __init__(self, dimensions, capacity) -> None:
+        self.vectors = np.empty((capacity, dimensions), dtype=np.float32)
+        self.prompts = []
+        self.responses = []
+        self.latencies = []
+        self.created_at = np.empty(capacity, dtype=np.float64)
+        self.last_used = np.empty(capacity, dtype=np.float64)
+
+    def __len__(self):
+        return len(self.prompts)
+
+    def append(self, vector, prompt, response, latency, now):
+        size = len(self.prompts)
+        if size == self.vectors.shape[0]:
+            grown = max(16, size * 2)
+            self.vectors = np.resize(self.vectors, (grown, self.vectors.shape[1]))
+            self.created_at = np.resize(self.created_at, grown)
+            self.last_used = np.resize(self.last_used, grown)
+
+        self.vectors[size] = vector
+        self.created_at[size] = now
+        self.last_used[size] = now
+        self.prompts.append(prompt)
+        self.responses.append(response)
+        self.latencies.append(latency)
+
+    def remove(self, row):
+        """
+        Remove a row by moving the last row into its place, keeping the matrix dense
+        """
+        last = len(self.prompts) - 1
+        if row != last:
+            self.vectors[row] = self.vectors[last]
+            self.created_at[row] = self.created_at[last]
+            self.last_used[row] = self.last_used[last]
+            self.prompts[row] = self.prompts[last]
+            self.responses[row] = self.responses[last]
+            self.latencies[row] = self.latencies[last]
+        self.prompts.pop()
+        self.responses.pop()
+        self.latencies.pop()
+
+
+class SemanticCache:
+    """
+    --> Semantic response cache for the text generators:
+
+    Prompts are embedded with one of the embedding classes (AmazonTitanEmbeddeing or CohereEmbeddeing)
+    and compared by cosine similarity against the prompts already cached for the same namespace: the same
+    model with the same inference parameters (temperature, top_p, max tokens, stop sequences...), since a
+    response generated with other parameters is not an answer to the request.
+    When the closest cached prompt is at least as similar as the threshold, its response is returned
+    instead of invoking the foundation model.
+
+    --> Configuration:
+
+        1. embedder:
+        Instance of AmazonTitanEmbeddeing or CohereEmbeddeing used to embed prompts.
+
+        2. threshold:
+        Minimum cosine similarity for a cached prompt to be considered a hit. (default 0.92, range 0-1)
+
+        3. max_entries:
+        Maximum number of cached prompts per namespace before eviction kicks in. (default 1024)
+
+        4. ttl_seconds:
+        Age after which a cached response is no longer served. 0 disables expiry. (default 3600)
+
+        5. eviction_policy:
+        Entry to evict when a namespace is full. Values: lru, fifo (default lru)
+
+        6. namespace:
+        Prefix of the namespaces, e.g. one per application or tenant sharing the cache. (default "default")
+
+    --> Statistics:
+
+        hits, misses, hit_rate, latency_saved (seconds of generation calls avoided, net of embedding time)
+    """
+
+    def __init__(
+        self,
+        embedder,
+        threshold=SIMILARITY_THRESHOLD,
+        max_entries=MAX_ENTRIES,
+        ttl_seconds=TTL_SECONDS,
+        eviction_policy=EVICTION_POLICY,
+        embedding_model_id=None,
+        namespace=NAMESPACE,
+    ) -> None:
+        if eviction_policy not in EVICTION_POLICIES:
+            raise ValueError(
+                f"Unsupported eviction policy: {eviction_policy}. Values: {EVICTION_POLICIES}"
+            )
+        self.embedder = embedder
+        self.embedding_model_id = embedding_model_id
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.eviction_policy = eviction_policy
+        self.namespace = namespace
+
+        self.namespaces = {}
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.latency_saved = 0.0
+
+    def namespace_of(self, params):
+        """
+        Namespace of a generation from its Parameters: the namespace prefix, the model id and a hash of the
+        inference parameters other than the prompt
+        """
+        values = params.as_dict()
+        model_id = values.pop("model_id")
+        values.pop("prompt")
+        digest = hashlib.sha1(json.dumps(values, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+        return f"{self.namespace}/{model_id}/{digest}"
+
+    def embed(self, prompt):
+        """
+        Embed a prompt and return it as a unit-length float32 vector
+        """
+        if self.embedding_model_id is None:
+            vector = self.embedder.embed([prompt])[0]
+        else:
+            vector = self.embedder.embed([prompt], model_id=self.embedding_model_id)[0]
+
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector /= norm
+        return vector
+
+    def _expire(self, namespace, now):
+        if self.ttl_seconds <= 0 or len(namespace) == 0:
+            return
+        size = len(namespace)
+        expired = np.nonzero(namespace.created_at[:size] < now - self.ttl_seconds)[0]
+        ## Remove from the highest row down so that swapped-in rows are already checked
+        for row in expired[::-1]:
+            namespace.remove(int(row))
+
+    def _evict(self, namespace):
+        size = len(namespace)
+        if self.eviction_policy == "lru":
+            row = int(np.argmin(namespace.last_used[:size]))
+        else:
+            row = int(np.argmin(namespace.created_at[:size]))
+        namespace.remove(row)
+
+    def _search(self, namespace_key, vector, now):
+        """
+        Return the row of the nearest cached prompt above the threshold, or None
+        """
+        namespace = self.namespaces.get(namespace_key)
+        if namespace is None:
+            return None, None
+
+        self._expire(namespace, now)
+        size = len(namespace)
+        if size == 0:
+            return namespace, None
+
+        similarities = namespace.vectors[:size] @ vector
+        row = int(np.argmax(similarities))
+        if similarities[row] < self.threshold:
+            return namespace, None
+        return namespace, row
+
+    def lookup(self, namespace_key, prompt):
+        """
+        Return (response, vector). The response is None on a miss, the vector can be passed
+        to store() to avoid embedding the prompt twice.
+        """
+        start = time.perf_counter()
+        vector = self.embed(prompt)
+        now = time.time()
+        with self.lock:
+            namespace, row = self._search(namespace_key, vector, now)
+            if row is None:
+                self.misses += 1
+                return None, vector
+
+            namespace.last_used[row] = now
+            self.hits += 1
+            ## Time saved is the original generation latency less the cost of this lookup
+            self.latency_saved += namespace.latencies[row] - (time.perf_counter() - start)
+            return namespace.responses[row], vector
+
+    def store(self, namespace_key, prompt, response, latency, vector=None):
+        """
+        Cache the response of a generation call which took `latency` seconds
+        """
+        if vector is None:
+            vector = self.embed(prompt)
+        now = time.time()
+        with self.lock:
+            namespace = self.namespaces.get(namespace_key)
+            if namespace is None:
+                namespace = _Namespace(len(vector), min(self.max_entries, 64))
+                self.namespaces[namespace_key] = namespace
+
+            self._expire(namespace, now)
+            while len(namespace) >= self.max_entries:
+                self._evict(namespace)
+            namespace.append(vector, prompt, response, latency, now)
+
+    def get_or_generate(self, namespace_key, prompt, generate):
+        """
+        Serve the response from cache, or call generate() and cache its result
+        """
+        response, vector = self.lookup(namespace_key, prompt)
+        if response is not None:
+            return response
+
+        start = time.perf_counter()
+        response = generate()
+        latency = time.perf_counter() - start
+        self.store(namespace_key, prompt, response, latency, vector=vector)
+        return response
+
+    def clear(self, namespace_key=None):
+        with self.lock:
+            if namespace_key is None:
+                self.namespaces.clear()
+            else:
+                self.namespaces.pop(namespace_key, None)
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return dict(
+                hits=self.hits,
+                misses=self.misses,
+                hit_rate=self.hits / lookups if lookups else 0.0,
+                latency_saved=self.latency_saved,
+                entries={key: len(ns) for key, ns in self.namespaces.items()},
+            )
+
+    def log_stats(self):
+        stats = self.stats()
+        logger.info(
+            f"Semantic Cache: hits={stats['hits']} misses={stats['misses']} "
+            f"hit_rate={stats['hit_rate']:.2%} latency_saved={stats['latency_saved']:.3f}s"
+        )
@@ -0,0 +1,372 @@
+import argparse
+import json
+import logging
+import os
+import sys
+from importlib import import_module
+
+from batch.pipeline import CONCURRENCY as PIPE_CONCURRENCY, ORDER_COMPLETION, ORDERS
+
+## Instantiate Logger
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+# CLI Default Values
+## Exit statuses, following the shell conventions
+EXIT_OK = 0
+## The service or the model failed the request
+EXIT_FAILURE = 1
+## Invalid arguments or parameters, nothing was sent (the status of argparse usage errors)
+EXIT_USAGE = 2
+## 128 + SIGINT
+EXIT_INTERRUPTED = 130
+## 128 + SIGPIPE: the reader of the output went away, e.g. `| head -1`
+EXIT_BROKEN_PIPE = 141
+## Prompt argument read from stdin
+STDIN = "-"
+IMAGE_PREFIX = "generated_image"
+
+
+class Model:
+    """
+    --> One model of the command line:
+
+        1. module / generator / parameters: names of the generator and Parameters classes in the module, which
+           is only imported when the model is chosen
+        2. options: command line option -> parameter field of the model; the other options are rejected
+        3. defaults: parameters set unless given with --param
+    """
+
+    __slots__ = ("module", "generator", "parameters", "options", "defaults")
+
+    def __init__(self, module, generator, parameters, options=None, defaults=None) -> None:
+        self.module = module
+        self.generator = generator
+        self.parameters = parameters
+        self.options = options or {}
+        self.defaults = defaults or {}
+
+    def load(self):
+        """
+        (generator class, Parameters class) of the model
+        """
+        module = import_module(self.module)
+        return getattr(module, self.generator), getattr(module, self.parameters)
+
+
+TEXT_OPTIONS = ("temperature", "top_p", "top_k", "max_tokens", "stop")
+TEXT_MODELS = {
+    "titan": Model(
+        "model_invocation.text.amazon_titan",
+        "AmazonTitanTextGenerator",
+        "TitanTextParameters",
+        dict(temperature="temperature", top_p="top_p", max_tokens="max_token_count", stop="stop_sequences"),
+    ),
+    "claude": Model(
+        "model_invocation.text.anthropic_claude",
+        "AnthropicClaudeTextGenerator",
+        "ClaudeParameters",
+        dict(
+            temperature="temperature",
+            top_p="top_p",
+            top_k="top_k",
+            max_tokens="max_tokens_to_sample",
+            stop="stop_sequences",
+        ),
+    ),
+    "llama2": Model(
+        "model_invocation.text.meta_llama2",
+        "MetaLlama2TextGenerator",
+        "Llama2Parameters",
+        dict(temperature="temperature", top_p="top_p", max_tokens="max_gen_len"),
+    ),
+    "jurassic2": Model(
+        "model_invocation.text.ai21_jurassic",
+        "AI21Jurassic2TextGenerator",
+        "Jurassic2Parameters",
+        dict(temperature="temperature", top_p="top_p", max_tokens="max_tokens", stop="stop_sequences"),
+    ),
+    "cohere": Model(
+        "model_invocation.text.cohere_command",
+        "CohereCommandTextGenerator",
+        "CommandParameters",
+        dict(temperature="temperature", top_p="top_p", top_k="top_k", max_tokens="max_tokens", stop="stop_sequences"),
+        ## Only the first generation is written out
+        defaults=dict(num_generations=1),
+    ),
+}
+
+IMAGE_OPTIONS = ("width", "height", "seed", "count")
+IMAGE_MODELS = {
+    "titan": Model(
+        "model_invocation.image.amazon_titan",
+        "AmazonTitanImageGenerator",
+        "TitanImageParameters",
+        dict(width="width", height="height", seed="seed", count="img_counts"),
+    ),
+    "sdxl": Model(
+        "model_invocation.image.stability_diffusion",
+        "StabilityDiffusionImageGenerator",
+        "StableDiffusionParameters",
+        dict(width="width", height="height", seed="seed"),
+    ),
+}
+
+EMBEDDING_MODELS = {
+    "titan": Model("model_invocation.embedding.amazon_titan", "AmazonTitanEmbeddeing", "TitanEmbeddingParameters"),
+    "cohere": Model("model_invocation.embedding.cohere", "CohereEmbeddeing", "CohereEmbeddingParameters"),
+}
+
+
+class UsageError(Exception):
+    ## Invalid command line, reported with EXIT_USAGE before any request is sent
+    def __init__(self, message) -> None:
+        self.message = message
+
+
+def read_prompt(prompt):
+    """
+    Prompt argument, read from stdin when it is "-" (without the trailing newline of `echo`)
+    """
+    if prompt == STDIN:
+        prompt = sys.stdin.read().rstrip("\n")
+    if not prompt.strip():
+        raise UsageError("Empty prompt")
+    return prompt
+
+
+def parse_param(text):
+    """
+    (field, value) from "field=value": the value is read as JSON (numbers, lists, true/false), else as a string
+    """
+    name, separator, value = text.partition("=")
+    if not separator or not name.strip():
+        raise argparse.ArgumentTypeError(f"Invalid parameter {text!r}, use field=value")
+    try:
+        value = json.loads(value)
+    except ValueError:
+        pass
+    return name.strip(), value
+
+
+def model_values(models, options, args):
+    """
+    Parameter values of the chosen model from the options and --param fields, without the prompt
+    """
+    model = models[args.model]
+    for option in options:
+        if getattr(args, option) is not None and option not in model.options:
+            raise UsageError(f"--{option.replace('_', '-')} is not a parameter of {args.model}, see --param")
+
+    values = dict(model.defaults)
+    values.update(
+        (field, getattr(args, option)) for option, field in model.options.items() if getattr(args, option) is not None
+    )
+    values.update(args.param)
+    if args.model_id:
+        values["model_id"] = args.model_id
+    return values
+
+
+def prepare(models, options, args):
+    """
+    Generator class of the chosen model and its validated parameters, from the options and --param fields
+    """
+    values = model_values(models, options, args)
+    values["prompt"] = read_prompt(args.prompt)
+
+    generator_class, parameters_class = models[args.model].load()
+    ## Invalid parameters fail here, before any client is built
+    return generator_class, parameters_class(**values)
+
+
+def runtime_client(profiler, max_pool_connections=None):
+    """
+    bedrock-runtime client with the optional features enabled by the environment, and its token estimator
+    """
+    from bootstrap import build_clients
+
+    _, client, token_estimator = build_clients(profiler, control=False, max_pool_connections=max_pool_connections)
+    return client, token_estimator
+
+
+def models_command(args, profiler):
+    from bootstrap import build_clients
+
+    control_client = build_clients(profiler)[0]
+    if control_client is None:
+        raise UsageError("Listing the models needs Amazon Bedrock: a cassette is replayed (BEDROCK_REPLAY)")
+    filters = dict(byOutputModality=args.modality.upper()) if args.modality else {}
+    for summary in control_client.list_foundation_models(**filters)["modelSummaries"]:
+        print(summary["modelId"])
+    return EXIT_OK
+
+
+def text_command(args, profiler):
+    from bootstrap import build_text_arguments
+    from model_invocation.conversation import completion_text
+    from model_invocation.streaming import print_chunk
+
+    generator_class, params = prepare(TEXT_MODELS, TEXT_OPTIONS, args)
+    if args.stream and not hasattr(generator_class, "stream"):
+        raise UsageError(f"{args.model} does not support streaming")
+
+    client, token_estimator = runtime_client(profiler)
+    generator = generator_class(bedrock_client=client, **build_text_arguments(client, token_estimator))
+    if args.stream:
+        text = generator.stream(params, callbacks=[print_chunk]).text
+    else:
+        text = completion_text(params.model_id, generator.generate(params))
+        sys.stdout.write(text)
+    if not text.endswith("\n"):
+        sys.stdout.write("\n")
+    return EXIT_OK
+
+
+def pipe_command(args, profiler):
+    from batch.pipeline import NdjsonPipeline
+    from bootstrap import build_text_arguments
+    from model_invocation.conversation import completion_text
+
+    values = model_values(TEXT_MODELS, TEXT_OPTIONS, args)
+    generator_class, parameters_class = TEXT_MODELS[args.model].load()
+    ## The values of every line are validated with its prompt; the ones of the command line once, before any client
+    parameters_class(**values)
+
+    client, token_estimator = runtime_client(profiler, max_pool_connections=args.concurrency)
+    generator = generator_class(bedrock_client=client, **build_text_arguments(client, token_estimator))
+
+    def generate(line_values):
+        params = parameters_class(**{**values, **line_values})
+        return dict(text=completion_text(params.model_id, generator.generate(params)))
+
+    pipeline = NdjsonPipeline(generate, concurrency=args.concurrency, order=args.order, window=args.window)
+    return EXIT_FAILURE if pipeline.run(sys.stdin, sys.stdout)["failures"] else EXIT_OK
+
+
+def embed_command(args, profiler):
+    generator_class, params = prepare(EMBEDDING_MODELS, (), args)
+    generator = generator_class(bedrock_client=runtime_client(profiler)[0])
+    print(json.dumps(generator.generate(params), separators=(",", ":")))
+    return EXIT_OK
+
+
+def image_command(args, profiler):
+    from bootstrap import build_image_post_processor
+
+    generator_class, params = prepare(IMAGE_MODELS, IMAGE_OPTIONS, args)
+    post_processor = build_image_post_processor()
+    generator = generator_class(bedrock_client=runtime_client(profiler)[0], post_processor=post_processor)
+    for number, image in enumerate(generator.generate(params), start=1):
+        name = f"{args.output}-{number}"
+        image.save(f"{name}.png")
+        if post_processor is not None:
+            post_processor.submit(image, name)
+        print(f"{name}.png")
+    return EXIT_OK
+
+
+def _common_arguments(parser, models):
+    parser.add_argument("--model", choices=sorted(models), required=True)
+    parser.add_argument("--model-id", help="model id, e.g. another version of the model (default: the generator's)")
+    parser.add_argument("--param", type=parse_param, action="append", default=[], metavar="FIELD=VALUE",
+                        help="any parameter of the model, repeatable, e.g. --param top_k=50")
+    parser.add_argument("prompt", nargs="?", default=STDIN, help="the prompt, or - to read it from stdin (default)")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="main.py",
+        description="Run one Amazon Bedrock command without prompts; without a command, the interactive menus",
+    )
+    parser.add_argument("-q", "--quiet", action="store_true", help="log warnings and errors only")
+    commands = parser.add_subparsers(dest="command", required=True, metavar="command")
+
+    models = commands.add_parser("models", help="list the ids of the foundation models")
+    models.add_argument("--modality", choices=("text", "image", "embedding"), help="only the models of this output")
+    models.set_defaults(handler=models_command)
+
+    text = commands.add_parser("text", help="generate text, written to stdout")
+    _common_arguments(text, TEXT_MODELS)
+    text.add_argument("--stream", action="store_true", help="write the text as it is generated")
+    text.add_argument("--temperature", type=float)
+    text.add_argument("--top-p", type=float)
+    text.add_argument("--top-k", type=int)
+    text.add_argument("--max-tokens", type=int)
+    text.add_argument("--stop", action="append", help="stop sequence, repeatable")
+    text.set_defaults(handler=text_command)
+
+    pipe = commands.add_parser(
+        "pipe",
+        help="generate text for every line of stdin (a prompt, or a JSON object of parameters with an optional id), "
+        "concurrently, one JSON record per line written to stdout",
+    )
+    pipe.add_argument("--model", choices=sorted(TEXT_MODELS), required=True)
+    pipe.add_argument("--model-id", help="model id, e.g. another version of the model (default: the generator's)")
+    pipe.add_argument("--param", type=parse_param, action="append", default=[], metavar="FIELD=VALUE",
+                      help="any parameter of the model, repeatable, e.g. --param top_k=50")
+    pipe.add_argument("--temperature", type=float)
+    pipe.add_argument("--top-p", type=float)
+    pipe.add_argument("--top-k", type=int)
+    pipe.add_argument("--max-tokens", type=int)
+    pipe.add_argument("--stop", action="append", help="stop sequence, repeatable")
+    pipe.add_argument("--concurrency", type=int, default=PIPE_CONCURRENCY,
+                      help="requests in flight (default: %(default)s)")
+    pipe.add_argument("--order", choices=ORDERS, default=ORDER_COMPLETION,
+                      help="write the records as they complete, or in the order of the input lines")
+    pipe.add_argument("--window", type=int,
+                      help="lines read and not written yet, e.g. the size of the reorder buffer in input order")
+    pipe.set_defaults(handler=pipe_command)
+
+    embed = commands.add_parser("embed", help="embedding vector of a text, written to stdout as a JSON array")
+    _common_arguments(embed, EMBEDDING_MODELS)
+    embed.set_defaults(handler=embed_command)
+
+    image = commands.add_parser("image", help="generate images, their paths written to stdout")
+    _common_arguments(image, IMAGE_MODELS)
+    image.add_argument("--width", type=int)
+    image.add_argument("--height", type=int)
+    image.add_argument("--seed", type=int)
+    image.add_argument("--count", type=int, help="number of images")
+    image.add_argument("--output", default=IMAGE_PREFIX, help="path prefix of the images (default: %(default)s)")
+    image.set_defaults(handler=image_command)
+    return parser
+
+
+def run(argv=None):
+    """
+    Run the command of the command line, return the exit status
+    """
+    args = build_parser().parse_args(argv)
+    if args.quiet:
+        logging.getLogger().setLevel(logging.WARNING)
+
+    from botocore.exceptions import BotoCoreError, ClientError
+
+    from bootstrap import start_profiler
+    from utils.exception_handler import BedrockException, ImageException, ValidationException
+
+    try:
+        profiler = start_profiler()
+        if profiler is None:
+            return args.handler(args, profiler)
+        with profiler.operation(args.command):
+            return args.handler(args, profiler)
+    except (UsageError, ValidationException) as err:
+        logger.error(err.message)
+        return EXIT_USAGE
+    except ClientError as err:
+        logger.error(f"Client Error: {err.response['Error']['Message']}")
+        return EXIT_FAILURE
+    except (BedrockException, ImageException) as err:
+        logger.error(err.message)
+        return EXIT_FAILURE
+    except BotoCoreError as err:
+        logger.error(f"Client Error: {err}")
+        return EXIT_FAILURE
+    except KeyboardInterrupt:
+        return EXIT_INTERRUPTED
+    except BrokenPipeError:
+        ## Output the interpreter would still flush on exit goes nowhere, rather than failing again
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return EXIT_BROKEN_PIPE
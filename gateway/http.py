@@ -0,0 +1,113 @@
+import asyncio
+import json
+
+# HTTP Default Values
+MAX_HEADER_BYTES = 64 * 1024
+MAX_BODY_BYTES = 16 * 1024 * 1024
+
+REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    411: "Length Required",
+    413: "Payload Too Large",
+    429: "Too Many Requests",
+    500: "Internal Server Error",
+    502: "Bad Gateway",
+    503: "Service Unavailable",
+    504: "Gateway Timeout",
+}
+
+
+class HttpError(Exception):
+    def __init__(self, status, message) -> None:
+        self.status = status
+        self.message = message
+
+
+class Request:
+    """
+    Minimal HTTP/1.1 request: method, path, query, lower-cased headers and body bytes
+    """
+
+    __slots__ = ("method", "path", "query", "headers", "body")
+
+    def __init__(self, method, path, query, headers, body) -> None:
+        self.method = method
+        self.path = path
+        self.query = query
+        self.headers = headers
+        self.body = body
+
+    @property
+    def keep_alive(self):
+        return self.headers.get("connection", "").lower() != "close"
+
+    def json(self):
+        try:
+            return json.loads(self.body or b"{}")
+        except ValueError as err:
+            raise HttpError(400, f"Invalid JSON body: {err}")
+
+
+async def read_request(reader):
+    """
+    Read one request from the connection, or return None once the client closed it
+    """
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.IncompleteReadError:
+        return None
+    except asyncio.LimitOverrunError:
+        raise HttpError(413, "Request header too large")
+
+    lines = head.decode("latin-1").split("\r\n")
+    try:
+        method, target, _ = lines[0].split(" ", 2)
+    except ValueError:
+        raise HttpError(400, "Malformed request line")
+
+    headers = {}
+    for line in lines[1:]:
+        if line:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+    path, _, query_string = target.partition("?")
+    query = dict(
+        part.partition("=")[::2] for part in query_string.split("&") if part
+    )
+
+    body = b""
+    if "transfer-encoding" in headers:
+        raise HttpError(411, "Chunked request bodies are not supported")
+    length = int(headers.get("content-length", 0))
+    if length > MAX_BODY_BYTES:
+        raise HttpError(413, "Request body too large")
+    if length:
+        body = await reader.readexactly(length)
+
+    return Request(method, path, query, headers, body)
+
+
+def response_head(status, headers):
+    lines = [f"HTTP/1.1 {status} {REASONS.get(status, 'Unknown')}"]
+    lines.extend(f"{name}: {value}" for name, value in headers.items())
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+
+async def write_response(writer, status, body, content_type="application/json", keep_alive=True, headers=None):
+    """
+    Write a complete response with a Content-Length body
+    """
+    if not isinstance(body, bytes):
+        body = json.dumps(body).encode()
+    all_headers = {
+        "Content-Type": content_type,
+        "Content-Length": str(len(body)),
+        "Connection": "keep-alive" if keep_alive else "close",
+    }
+    all_headers.update(headers or {})
+    writer.write(response_head(status, all_headers) + body)
+    await writer.drain()
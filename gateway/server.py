@@ -0,0 +1,562 @@
+import argparse
+import asyncio
+import base64
+import json
+import logging
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from io import BytesIO
+from urllib.parse import unquote
+
+from botocore.exceptions import ClientError
+
+from bootstrap import build_text_arguments
+from cli import EMBEDDING_MODELS, IMAGE_MODELS, TEXT_MODELS
+from gateway.http import HttpError, read_request, response_head, write_response
+from model_invocation.conversation import completion_text
+from profiling.profiler import MODES, OUTPUT_DIR, Profiler, ProfiledClient
+from recording.cassette import Cassette, RecordingClient
+from resilience.circuit_breaker import ResilientClient
+from resilience.deadline import CONNECT_TIMEOUT_SECONDS, DeadlineClient, deadline
+from utils.client_factory import BedrockClientFactory, PROFILE_NAME
+from utils.exception_handler import (
+    BedrockException,
+    CircuitOpenException,
+    DeadlineExceededException,
+    ImageException,
+    ValidationException,
+)
+from utils.token_estimator import TokenEstimator
+from utils.warmup import warm_up
+
+## Instantiate Logger
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+# Gateway Default Values
+HOST = "127.0.0.1"
+PORT = 8080
+MAX_WORKERS = 64
+## Streams open at once, each holding a thread of its own pool while it relays the chunks
+MAX_STREAMS = 64
+## Chunks buffered per stream before the Bedrock stream stops being read for a slow client
+STREAM_BUFFER_CHUNKS = 16
+DRAIN_TIMEOUT_SECONDS = 30.0
+CREDIT_POLL_SECONDS = 0.5
+
+## Routes: kind -> models of the command line
+MODELS = dict(text=TEXT_MODELS, image=IMAGE_MODELS, embedding=EMBEDDING_MODELS)
+
+## Request header shortening the deadline of one request, in seconds
+DEADLINE_HEADER = "x-deadline-seconds"
+
+
+class _StreamEnd:
+    ## Last item of a relay: the StreamAccumulator of the stream, once consumed
+    __slots__ = ("accumulator",)
+
+    def __init__(self, accumulator) -> None:
+        self.accumulator = accumulator
+
+
+class _StreamCancelled(Exception):
+    ## Raised from the callback of a stream whose client went away, which ends the generator's stream
+    pass
+
+
+class _StreamRelay:
+    """
+    Relay the chunks of a generator's stream from a worker thread to the connection coroutine.
+    The stream callback takes a credit before handing over every chunk and the coroutine returns it once
+    the chunk is written and drained to the client, so at most `buffer_chunks` chunks are ever buffered.
+    """
+
+    def __init__(self, loop, buffer_chunks) -> None:
+        self.loop = loop
+        self.queue = asyncio.Queue()
+        self.credits = threading.Semaphore(buffer_chunks)
+        self.cancelled = threading.Event()
+
+    def put(self, chunk):
+        """
+        Stream callback, called in the worker thread with every StreamChunk
+        """
+        while not self.credits.acquire(timeout=CREDIT_POLL_SECONDS):
+            if self.cancelled.is_set():
+                raise _StreamCancelled()
+        if self.cancelled.is_set():
+            raise _StreamCancelled()
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, chunk)
+
+    def produce(self, stream):
+        """
+        Run stream(callbacks) -> StreamAccumulator, relaying its chunks then its end or its error
+        """
+        try:
+            item = _StreamEnd(stream([self.put]))
+        except Exception as err:
+            item = err
+        if not self.cancelled.is_set():
+            self.loop.call_soon_threadsafe(self.queue.put_nowait, item)
+
+    def finished(self, producer):
+        ## A producer which failed without relaying its error, e.g. on a pool shut down while it waited
+        if not producer.cancelled() and producer.exception() is not None:
+            self.queue.put_nowait(producer.exception())
+
+    async def next(self):
+        """
+        Next StreamChunk, a _StreamEnd or the error of the stream
+        """
+        item = await self.queue.get()
+        if not isinstance(item, (_StreamEnd, Exception)):
+            self.credits.release()
+        return item
+
+    def cancel(self):
+        ## The worker stops at its next chunk
+        self.cancelled.set()
+
+
+def png_base64(image):
+    """
+    Base64 PNG of a generated image
+    """
+    buffer = BytesIO()
+    image.save(buffer, format="PNG")
+    return base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+def sse_event(data, event=None):
+    """
+    Server-Sent Event with one `data:` line per line of the payload, so that newlines keep the framing
+    """
+    lines = [f"event: {event}"] if event else []
+    lines.extend(f"data: {line}" for line in data.split("\n"))
+    return ("\n".join(lines) + "\n\n").encode("utf-8")
+
+
+def http_error(err):
+    """
+    HttpError answering an error of a generator
+    """
+    if isinstance(err, HttpError):
+        return err
+    if isinstance(err, ClientError):
+        status = err.response.get("ResponseMetadata", {}).get("HTTPStatusCode", 502)
+        return HttpError(status, err.response["Error"]["Message"])
+    if isinstance(err, ValidationException):
+        return HttpError(400, err.message)
+    if isinstance(err, CircuitOpenException):
+        return HttpError(503, err.message)
+    if isinstance(err, DeadlineExceededException):
+        return HttpError(504, err.message)
+    if isinstance(err, (BedrockException, ImageException)):
+        return HttpError(502, err.message)
+    logger.error(f"Unexpected error: {err!r}")
+    return HttpError(500, str(err))
+
+
+class BedrockGateway:
+    """
+    --> Asyncio HTTP gateway in front of the Amazon Bedrock generators:
+
+        POST /{text|image|embedding}/{model}            Request body is the JSON of the model's parameters,
+                                                        e.g. {"prompt": "...", "temperature": 0.5}.
+                                                        Text: {"text": ..., "response": <model response>},
+                                                        image: {"images": [<base64 PNG>, ...]},
+                                                        embedding: {"embedding": [...]}.
+        POST /text/{model}/stream                       Server-Sent Events, one `data: {"text": ...}` event
+                                                        per chunk followed by `event: end`.
+        GET  /health
+
+    {model} is a model of the command line (see cli.py): titan, claude, llama2, jurassic2, cohere for text,
+    titan, sdxl for images, titan, cohere for embeddings. Every model has one generator shared by all the
+    requests, which validates the parameters (400 when invalid) and fills in their defaults; with
+    `text_arguments` (e.g. `lambda client: build_text_arguments(client, token_estimator)` from bootstrap)
+    the text generators get the semantic cache and the retriever built over the gateway's client.
+
+    All requests share one pooled bedrock-runtime client, whose blocking calls run on a bounded thread pool
+    of `max_workers` threads. Streams run on a pool of their own: at most `max_streams` are open at once, the
+    next ones wait for one to end, so that slow readers never hold the threads of the other requests.
+    Streams apply per-connection backpressure: when a client reads slowly, at most `stream_buffer_chunks`
+    chunks are buffered before the Bedrock stream stops being read; a stream whose client goes away ends at
+    its next chunk. On SIGINT/SIGTERM the gateway stops accepting connections and drains in-flight requests
+    for up to `drain_timeout` seconds.
+    With `circuit_breaker`, requests for a model whose circuit is open are answered 503 at once.
+    With `deadline_seconds`, every request (a stream until its last chunk) is bounded by a deadline, which
+    an X-Deadline-Seconds header can shorten; a request which misses it is answered 504, a stream which
+    misses it ends with an `event: error`.
+    With a started `profiler`, the calls to the model are profiled as "invoke" and "stream" operations.
+    With a `cassette`, every call to the model is recorded into it, for offline replay (see recording.replay).
+    """
+
+    def __init__(
+        self,
+        client_factory=None,
+        host=HOST,
+        port=PORT,
+        max_workers=MAX_WORKERS,
+        max_streams=MAX_STREAMS,
+        stream_buffer_chunks=STREAM_BUFFER_CHUNKS,
+        drain_timeout=DRAIN_TIMEOUT_SECONDS,
+        runtime_client=None,
+        warmup_connections=0,
+        circuit_breaker=False,
+        deadline_seconds=None,
+        profiler=None,
+        cassette=None,
+        text_arguments=None,
+    ) -> None:
+        self.host = host
+        self.port = port
+        self.stream_buffer_chunks = stream_buffer_chunks
+        self.drain_timeout = drain_timeout
+
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="gateway"
+        )
+        ## A stream holds one of these threads from its request to its last chunk; the slots are taken in the
+        ## event loop, so that the streams waiting for one hold no thread
+        self.stream_executor = ThreadPoolExecutor(max_workers=max_streams, thread_name_prefix="gateway-stream")
+        self.max_streams = max_streams
+        self.stream_slots = None
+        if runtime_client is None:
+            client_factory = client_factory or BedrockClientFactory(
+                max_pool_connections=max_workers + max_streams
+            )
+            runtime_client = client_factory.runtime_client()
+        ## The raw client is warmed up, so that the warm-up pings stay out of the circuit breakers
+        self.raw_client = runtime_client
+        if cassette is not None:
+            runtime_client = RecordingClient(runtime_client, cassette)
+        self.profiler = profiler
+        if profiler is not None:
+            runtime_client = ProfiledClient(runtime_client)
+        if circuit_breaker:
+            runtime_client = ResilientClient(runtime_client)
+        self.deadline_seconds = deadline_seconds
+        if deadline_seconds:
+            runtime_client = DeadlineClient(runtime_client, deadline_seconds)
+        self.runtime_client = runtime_client
+        self.generators = self._build_generators(text_arguments(runtime_client) if text_arguments else {})
+        self.warmup_connections = warmup_connections
+        self.warmer = None
+
+        self.server = None
+        self.draining = False
+        self.idle_connections = set()
+        self.busy_connections = set()
+        self.stopped = None
+
+    def _build_generators(self, text_arguments):
+        """
+        (kind, model) -> (generator, Parameters class, defaults of the model), one generator per model
+        """
+        generators = {}
+        for kind, models in MODELS.items():
+            for name, model in models.items():
+                generator_class, parameters_class = model.load()
+                arguments = dict(bedrock_client=self.runtime_client)
+                if kind == "text":
+                    arguments.update(text_arguments)
+                generators[kind, name] = (generator_class(**arguments), parameters_class, model.defaults)
+        return generators
+
+    async def start(self):
+        ## Connections are opened in the background while the listener starts
+        if self.warmup_connections:
+            self.warmer = warm_up(self.raw_client, self.warmup_connections)
+        self.stopped = asyncio.Event()
+        self.stream_slots = asyncio.Semaphore(self.max_streams)
+        self.server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        logger.info(f"Bedrock gateway listening on http://{self.host}:{self.port}")
+
+    async def serve_forever(self):
+        await self.start()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, lambda: asyncio.ensure_future(self.shutdown()))
+        await self.stopped.wait()
+
+    async def shutdown(self):
+        """
+        Stop accepting connections, close idle keep-alive connections and wait for in-flight requests
+        """
+        if self.draining:
+            return
+        self.draining = True
+        logger.info(f"Draining {len(self.busy_connections)} in-flight requests")
+        self.server.close()
+        for task in list(self.idle_connections):
+            task.cancel()
+
+        if self.busy_connections:
+            _, pending = await asyncio.wait(
+                list(self.busy_connections), timeout=self.drain_timeout
+            )
+            for task in pending:
+                task.cancel()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.stream_executor.shutdown(wait=False, cancel_futures=True)
+        if self.warmer is not None:
+            self.warmer.stop()
+        self.stopped.set()
+
+    async def _handle_connection(self, reader, writer):
+        task = asyncio.current_task()
+        try:
+            while not self.draining:
+                self.idle_connections.add(task)
+                try:
+                    request = await read_request(reader)
+                finally:
+                    self.idle_connections.discard(task)
+                if request is None:
+                    break
+
+                self.busy_connections.add(task)
+                try:
+                    keep_alive = request.keep_alive and not self.draining
+                    await self._dispatch(request, writer, keep_alive)
+                finally:
+                    self.busy_connections.discard(task)
+                if not keep_alive:
+                    break
+        except HttpError as err:
+            await write_response(writer, err.status, dict(error=err.message), keep_alive=False)
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, request, writer, keep_alive):
+        parts = request.path.strip("/").split("/")
+        try:
+            if request.method == "GET" and parts == ["health"]:
+                await write_response(writer, 200, dict(status="ok"), keep_alive=keep_alive)
+                return
+            route = (parts[0], unquote(parts[1])) if len(parts) > 1 else None
+            if route not in self.generators:
+                raise HttpError(404, f"Unknown route: {request.path}")
+            generator, parameters_class, defaults = self.generators[route]
+            streaming = parts[2:] == ["stream"] and hasattr(generator, "stream")
+            if parts[2:] and not streaming:
+                raise HttpError(404, f"Unknown route: {request.path}")
+            if request.method != "POST":
+                raise HttpError(405, "Use POST")
+
+            params = self._params_of(request, parameters_class, defaults)
+            seconds = self._deadline_of(request)
+            if streaming:
+                await self._stream(generator, params, seconds, writer, keep_alive)
+            else:
+                await self._invoke(route[0], generator, params, seconds, writer, keep_alive)
+        except HttpError as err:
+            await write_response(writer, err.status, dict(error=err.message), keep_alive=keep_alive)
+
+    def _params_of(self, request, parameters_class, defaults):
+        """
+        Validated parameters of a request, from its JSON body over the defaults of the model
+        """
+        try:
+            values = json.loads(request.body or b"{}")
+        except ValueError as err:
+            raise HttpError(400, f"Invalid JSON body: {err}")
+        if not isinstance(values, dict):
+            raise HttpError(400, "The body must be a JSON object of parameters")
+        try:
+            return parameters_class(**{**defaults, **values})
+        except ValidationException as err:
+            raise HttpError(400, err.message)
+
+    def _deadline_of(self, request):
+        """
+        Deadline of a request in seconds: the gateway's, or the X-Deadline-Seconds header when shorter
+        """
+        if not self.deadline_seconds:
+            return None
+        header = request.headers.get(DEADLINE_HEADER)
+        if header is None:
+            return self.deadline_seconds
+        try:
+            seconds = float(header)
+        except ValueError:
+            raise HttpError(400, f"Invalid {DEADLINE_HEADER}: {header}")
+        if seconds <= 0:
+            raise HttpError(400, f"Invalid {DEADLINE_HEADER}: {header}")
+        return min(seconds, self.deadline_seconds)
+
+    async def _call(self, fn, seconds=None, operation=None, executor=None):
+        def call():
+            with ExitStack() as stack:
+                if self.profiler is not None:
+                    stack.enter_context(self.profiler.operation(operation))
+                ## Set in the worker thread, where the DeadlineClient picks it up
+                if seconds is not None:
+                    stack.enter_context(deadline(seconds))
+                return fn()
+
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(executor or self.executor, call)
+        except Exception as err:
+            raise http_error(err)
+
+    async def _invoke(self, kind, generator, params, seconds, writer, keep_alive):
+        def invoke():
+            result = generator.generate(params)
+            if kind == "text":
+                return dict(text=completion_text(params.model_id, result), response=result)
+            if kind == "image":
+                return dict(images=[png_base64(image) for image in result])
+            return dict(embedding=result)
+
+        response = await self._call(invoke, seconds, "invoke")
+        await write_response(writer, 200, response, keep_alive=keep_alive)
+
+    async def _stream(self, generator, params, seconds, writer, keep_alive):
+        async with self.stream_slots:
+            relay = _StreamRelay(asyncio.get_running_loop(), self.stream_buffer_chunks)
+
+            def stream():
+                return relay.produce(lambda callbacks: generator.stream(params, callbacks=callbacks))
+
+            producer = asyncio.ensure_future(self._call(stream, seconds, "stream", self.stream_executor))
+            producer.add_done_callback(relay.finished)
+            try:
+                await self._relay(relay, writer, keep_alive)
+            finally:
+                relay.cancel()
+                await asyncio.wait([producer])
+
+    async def _relay(self, relay, writer, keep_alive):
+        ## Errors before the first chunk are answered with their status, as for the other requests
+        item = await relay.next()
+        if isinstance(item, Exception):
+            raise http_error(item)
+
+        writer.write(
+            response_head(
+                200,
+                {
+                    "Content-Type": "text/event-stream",
+                    "Cache-Control": "no-cache",
+                    "Connection": "keep-alive" if keep_alive else "close",
+                    "Transfer-Encoding": "chunked",
+                },
+            )
+        )
+        while not isinstance(item, (_StreamEnd, Exception)):
+            await self._write_chunk(writer, sse_event(json.dumps(dict(text=item.text))))
+            item = await relay.next()
+        if isinstance(item, Exception):
+            message = json.dumps(dict(error=http_error(item).message))
+            await self._write_chunk(writer, sse_event(message, event="error"))
+        else:
+            await self._write_chunk(
+                writer, sse_event(json.dumps(dict(finish_reason=item.accumulator.finish_reason)), event="end")
+            )
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    async def _write_chunk(self, writer, data):
+        writer.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        ## Waits while the client's socket buffer is full, which holds back the relay credits
+        await writer.drain()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Asyncio HTTP gateway for Amazon Bedrock")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument(
+        "--profile",
+        default=PROFILE_NAME,
+        help="AWS profile, empty for the default credential chain",
+    )
+    parser.add_argument("--region", default=None)
+    parser.add_argument("--endpoint-url", default=None, help="bedrock-runtime endpoint override")
+    parser.add_argument("--max-workers", type=int, default=MAX_WORKERS, help="Threads of the invocations")
+    parser.add_argument(
+        "--max-streams", type=int, default=MAX_STREAMS, help="Streams open at once, the next ones wait"
+    )
+    parser.add_argument("--stream-buffer-chunks", type=int, default=STREAM_BUFFER_CHUNKS)
+    parser.add_argument(
+        "--warmup-connections",
+        type=int,
+        default=0,
+        help="Connections to open to the runtime endpoint at startup and keep alive",
+    )
+    parser.add_argument(
+        "--circuit-breaker",
+        action="store_true",
+        help="Fail fast on unhealthy models, with a circuit breaker per model and a shared retry budget",
+    )
+    parser.add_argument(
+        "--deadline-seconds",
+        type=float,
+        default=None,
+        help="Deadline of every request, streams included, which the X-Deadline-Seconds header can shorten",
+    )
+    parser.add_argument(
+        "--shared-credentials",
+        action="store_true",
+        help="Share the credentials of the profile with the other processes of the host through a cache file",
+    )
+    parser.add_argument(
+        "--profiler",
+        choices=MODES,
+        default=None,
+        help="Profile the gateway, reports are written to --profiler-dir on shutdown",
+    )
+    parser.add_argument("--profiler-dir", default=OUTPUT_DIR)
+    parser.add_argument(
+        "--record",
+        default=None,
+        help="Record every invocation into this cassette, written on shutdown (replay with python -m recording.replay)",
+    )
+    args = parser.parse_args()
+
+    ## Without tracemalloc: a snapshot per request would slow every request down
+    cassette = Cassette() if args.record else None
+    token_estimator = TokenEstimator()
+    profiler = Profiler(args.profiler_dir, mode=args.profiler, trace_memory=False).start() if args.profiler else None
+
+    gateway = BedrockGateway(
+        client_factory=BedrockClientFactory(
+            profile_name=args.profile or None,
+            region_name=args.region,
+            endpoint_url=args.endpoint_url,
+            max_pool_connections=args.max_workers + args.max_streams,
+            shared_credentials=args.shared_credentials,
+            retry_attempts=1 if args.circuit_breaker else None,
+            connect_timeout=min(args.deadline_seconds, CONNECT_TIMEOUT_SECONDS) if args.deadline_seconds else None,
+        ),
+        host=args.host,
+        port=args.port,
+        max_workers=args.max_workers,
+        max_streams=args.max_streams,
+        stream_buffer_chunks=args.stream_buffer_chunks,
+        warmup_connections=args.warmup_connections,
+        circuit_breaker=args.circuit_breaker,
+        deadline_seconds=args.deadline_seconds,
+        profiler=profiler,
+        cassette=cassette,
+        ## The semantic cache and the retriever enabled by the environment, as for main.py
+        text_arguments=lambda client: build_text_arguments(client, token_estimator),
+    )
+    try:
+        asyncio.run(gateway.serve_forever())
+    finally:
+        if profiler is not None:
+            profiler.stop()
+        if cassette is not None:
+            cassette.save(args.record)
+
+
+if __name__ == "__main__":
+    main()
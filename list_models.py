@@ -1,8 +1,6 @@
-import boto3
-import json
 import logging
 
-from botocore.exceptions import ClientError
+from utils.log_utils import log_payload
 
 ## Instantiate Logger
 logger = logging.getLogger(__name__)
@@ -20,5 +18,9 @@ class FoundationModels:
         counts = len(model_list["modelSummaries"])
         logger.info(f"Total Models- {counts}")
 
-        # Print Model Details
-        logger.info(f"Models-\n {json.dumps(model_list, indent=2)}")
+        # Print Model Ids, the full catalog only at DEBUG level
+        logger.info(
+            "Models- %s",
+            ", ".join(summary["modelId"] for summary in model_list["modelSummaries"]),
+        )
+        log_payload(logger, "Model Details", model_list["modelSummaries"], level=logging.DEBUG)
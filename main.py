@@ -1,22 +1,33 @@
-import boto3
 import logging
+import sys
 
-from operations import Operations
+from utils.log_utils import configure_logging
 
 ## Instantiate Logger
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO, format="%(message)s")
 
-## Creating session with AWS profile
-session = boto3.Session(profile_name="bedrock-profile")
 
-# bedrock – Contains runtime plane APIs for making inference requests for models hosted in Amazon Bedrock
-control_client = session.client("bedrock")
-
-# bedrock-runtime – Contains runtime plane APIs for making inference requests for models hosted in Amazon Bedrock
-runtime_client = session.client("bedrock-runtime")
-
-operations = Operations(control_client, runtime_client)
+def build_operations():
+    """
+    Build the clients and the Operations of the playgrounds, with the optional features enabled by the
+    environment (see bootstrap). Kept out of module level: the worker processes of the image pool import this module.
+    """
+    from bootstrap import build_clients, build_image_post_processor, build_text_arguments, start_profiler
+    from operations import Operations
+
+    profiler = start_profiler()
+    control_client, runtime_client, token_estimator = build_clients(profiler)
+    operations = Operations(
+        control_client,
+        runtime_client,
+        **build_text_arguments(runtime_client, token_estimator),
+        image_post_processor=build_image_post_processor(),
+    )
+    ## Every menu action is profiled as one operation
+    if profiler is not None:
+        operations = profiler.wrap(operations)
+    return operations
 
 
 def text_playground_menu():
@@ -35,6 +46,8 @@ def text_playground_menu():
     print("7. Test AI21 Jurrasic 2 Text Model")
     print("8. Test Cohere Command Text Model")
     print("9. Test Cohere Command Text Model (with streaming)")
+    print("10. Test Best-of-N Text Generation (any text model)")
+    print("11. Test Multi-turn Chat (any text model)")
     print("99. Exit")
 
     valid = False
@@ -128,7 +141,7 @@ def text_playground():
 
     while choice != 99:
         if choice == 0:
-            return
+            return False
         elif choice == 1:
             operations.generate_text_using_amazon_titan()
         elif choice == 2:
@@ -147,14 +160,17 @@ def text_playground():
             operations.generate_text_using_cohere_command()
         elif choice == 9:
             operations.generate_text_using_cohere_command(streaming=True)
+        elif choice == 10:
+            operations.generate_text_best_of_n()
+        elif choice == 11:
+            operations.chat()
         else:
             print(
                 "Looks like you have not choosen available options. Please try again."
             )
 
         choice = text_playground_menu()
-    logger.info("Thanks for using Amazon Bedrock!!!")
-    exit()
+    return True
 
 
 def image_playground():
@@ -162,7 +178,7 @@ def image_playground():
 
     while choice != 99:
         if choice == 0:
-            return
+            return False
         elif choice == 1:
             operations.generate_image_using_amazon_titan()
         elif choice == 2:
@@ -173,8 +189,7 @@ def image_playground():
             )
 
         choice = image_playground_menu()
-    logger.info("Thanks for using Amazon Bedrock!!!")
-    exit()
+    return True
 
 
 def embedding_playground():
@@ -182,7 +197,7 @@ def embedding_playground():
 
     while choice != 99:
         if choice == 0:
-            return
+            return False
         elif choice == 1:
             operations.generate_embedding_using_amazon_titan()
         elif choice == 2:
@@ -193,31 +208,43 @@ def embedding_playground():
             )
 
         choice = embedding_playground_menu()
-    logger.info("Thanks for using Amazon Bedrock!!!")
-    exit()
+    return True
 
 
 def main():
+    """
+    Interactive menus, until the user exits from the main menu or a playground
+    """
     choice = main_menu()
 
     while choice != 99:
+        exiting = False
         if choice == 1:
             operations.list_models()
         elif choice == 2:
-            text_playground()
+            exiting = text_playground()
         elif choice == 3:
-            image_playground()
+            exiting = image_playground()
         elif choice == 4:
-            embedding_playground()
+            exiting = embedding_playground()
         else:
             print(
                 "Looks like you have not choosen available options. Please try again."
             )
+        if exiting:
+            break
 
         choice = main_menu()
 
     logger.info("Thanks for using Amazon Bedrock!!!")
-    exit()
 
 
-main()
+if __name__ == "__main__":
+    configure_logging()
+    ## With arguments, one command without any prompt (see cli); without, the interactive menus
+    if len(sys.argv) > 1:
+        from cli import run
+
+        sys.exit(run())
+    operations = build_operations()
+    main()
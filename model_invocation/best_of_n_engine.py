@@ -0,0 +1,259 @@
+import json
+import logging
+import re
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from model_invocation.families import family_of
+from model_invocation.streaming import StreamAccumulator, iter_chunks
+
+## Instantiate Logger
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+# Best-of-N Default Values
+CANDIDATES = 3
+## Cohere Command returns at most 5 generations per request
+MAX_NATIVE_GENERATIONS = 5
+## Families whose models stream, the others are invoked without streaming (and cannot be cut short)
+STREAMING_FAMILIES = ("titan-text", "claude", "llama2", "cohere-command")
+
+
+class Candidate:
+    """
+    One generation of a best-of-N request: its text, finish reason, score, Cohere likelihood (when returned),
+    latency in seconds and whether it was cancelled before finishing
+    """
+
+    __slots__ = ("index", "text", "finish_reason", "likelihood", "score", "latency", "cancelled")
+
+    def __init__(self, index, text="", finish_reason=None, likelihood=None, latency=None) -> None:
+        self.index = index
+        self.text = text
+        self.finish_reason = finish_reason
+        self.likelihood = likelihood
+        self.score = None
+        self.latency = latency
+        self.cancelled = False
+
+    def __repr__(self):
+        return f"Candidate(index={self.index}, score={self.score!r}, finish_reason={self.finish_reason!r})"
+
+
+class LikelihoodScorer:
+    """
+    Score a candidate by the likelihood Cohere returns with return_likelihoods=GENERATION
+    (higher is better). Candidates without a likelihood score -inf.
+    """
+
+    ## Request parameters the scorer needs, merged into the request body
+    request_parameters = dict(return_likelihoods="GENERATION")
+
+    def __call__(self, candidate):
+        if candidate.likelihood is None:
+            return float("-inf")
+        return candidate.likelihood
+
+
+class RegexScorer:
+    """
+    Validate a candidate against a regular expression: 1.0 when it matches, 0.0 otherwise.
+    With fullmatch=True the whole (stripped) text must match, e.g. to accept well formed JSON or a single label.
+    """
+
+    request_parameters = {}
+
+    def __init__(self, pattern, flags=re.DOTALL, fullmatch=False) -> None:
+        self.pattern = re.compile(pattern, flags)
+        self.fullmatch = fullmatch
+
+    def __call__(self, candidate):
+        text = candidate.text.strip()
+        match = self.pattern.fullmatch(text) if self.fullmatch else self.pattern.search(text)
+        return 1.0 if match else 0.0
+
+
+class BestOfN:
+    """
+    --> Best-of-N generation for any text model:
+
+    1. Cohere Command: one request with num_generations=N (N <= 5), all candidates are scored
+    2. Models which stream (Titan, Claude, Llama2, Cohere): N concurrent streams. Each candidate is scored as
+       soon as its stream finishes, and once one reaches the acceptance threshold the other streams are closed
+       and it is returned, so an acceptable answer costs about the latency of a single call.
+    3. Other models (Jurassic2): N concurrent invocations, the ones not started yet are cancelled on acceptance
+
+    Without a threshold (or when no candidate reaches it) the highest scoring candidate is returned once all
+    candidates finished. The diversity between candidates comes from the sampling parameters of the request
+    body (temperature, top_p, ...), which should not be greedy.
+
+    A scorer is any callable taking a Candidate and returning a float (higher is better); an optional
+    `request_parameters` attribute is merged into the request body of Cohere Command, to ask for likelihoods
+    (the other families reject the field and return no likelihood).
+    """
+
+    def __init__(self, bedrock_client, scorer, candidates=CANDIDATES, threshold=None, native=True) -> None:
+        self.bedrock_client = bedrock_client
+        self.scorer = scorer
+        self.candidates = candidates
+        self.threshold = threshold
+        self.native = native
+        self.executor = ThreadPoolExecutor(max_workers=candidates, thread_name_prefix="best-of-n")
+
+    def generate(self, model_id, body):
+        """
+        Generate N candidates for a request body (JSON, or dict), return (best candidate, all candidates)
+        """
+        if isinstance(body, (str, bytes)):
+            body = json.loads(body)
+        family = family_of(model_id)["name"]
+        if family == "cohere-command":
+            body = dict(body, **getattr(self.scorer, "request_parameters", {}))
+            body["stream"] = not (self.native and self.candidates <= MAX_NATIVE_GENERATIONS)
+        started = time.monotonic()
+
+        if self.native and family == "cohere-command" and self.candidates <= MAX_NATIVE_GENERATIONS:
+            accepted, candidates = None, self._native(model_id, body)
+        elif family in STREAMING_FAMILIES:
+            accepted, candidates = self._parallel(model_id, body, self._stream)
+        else:
+            accepted, candidates = self._parallel(model_id, body, self._invoke)
+
+        best = accepted or max(
+            (candidate for candidate in candidates if candidate.score is not None),
+            key=lambda candidate: candidate.score,
+        )
+        logger.info(
+            f"Best-of-{self.candidates} for {model_id}: candidate {best.index} (score {best.score}) "
+            f"in {time.monotonic() - started:.2f}s, "
+            f"{sum(candidate.cancelled for candidate in candidates)} cancelled"
+        )
+        return best, candidates
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def _score(self, candidate):
+        candidate.score = self.scorer(candidate)
+        return candidate
+
+    def _accepted(self, candidate):
+        return self.threshold is not None and candidate.score is not None and candidate.score >= self.threshold
+
+    def _native(self, model_id, body):
+        started = time.monotonic()
+        output = self.bedrock_client.invoke_model(
+            body=json.dumps(dict(body, num_generations=self.candidates)),
+            modelId=model_id,
+            accept="application/json",
+            contentType="application/json",
+        )
+        response = json.loads(output["body"].read())
+        latency = time.monotonic() - started
+        return [
+            self._score(
+                Candidate(
+                    index,
+                    generation["text"],
+                    generation.get("finish_reason"),
+                    generation.get("likelihood"),
+                    latency,
+                )
+            )
+            for index, generation in enumerate(response["generations"])
+        ]
+
+    def _invoke(self, model_id, body, candidate, cancelled, streams):
+        started = time.monotonic()
+        output = self.bedrock_client.invoke_model(
+            body=json.dumps(body),
+            modelId=model_id,
+            accept="application/json",
+            contentType="application/json",
+        )
+        response = json.loads(output["body"].read())
+        if "completions" in response:
+            ## AI21 Jurassic2 response format
+            completion = response["completions"][0]
+            candidate.text = completion["data"]["text"]
+            candidate.finish_reason = completion.get("finishReason", {}).get("reason")
+        else:
+            candidate.text = response.get("completion", "")
+            candidate.finish_reason = response.get("stop_reason")
+        candidate.latency = time.monotonic() - started
+        return self._score(candidate)
+
+    def _stream(self, model_id, body, candidate, cancelled, streams):
+        started = time.monotonic()
+        output = self.bedrock_client.invoke_model_with_response_stream(
+            body=json.dumps(body),
+            modelId=model_id,
+            accept="application/json",
+            contentType="application/json",
+        )
+        stream = output["body"]
+        streams[candidate.index] = stream
+        accumulator = StreamAccumulator()
+        try:
+            for chunk in iter_chunks(model_id, stream):
+                if cancelled.is_set():
+                    break
+                accumulator.add(chunk)
+                if candidate.likelihood is None and chunk.data:
+                    candidate.likelihood = chunk.data.get("likelihood")
+        except Exception:
+            ## Closing a stream from the accepting thread makes the blocked read fail
+            if not cancelled.is_set():
+                raise
+        finally:
+            stream.close()
+
+        candidate.text = accumulator.text
+        candidate.finish_reason = accumulator.finish_reason
+        candidate.latency = time.monotonic() - started
+        if cancelled.is_set() and candidate.finish_reason is None:
+            candidate.cancelled = True
+            return candidate
+        return self._score(candidate)
+
+    def _parallel(self, model_id, body, run):
+        """
+        Run the N candidates concurrently, return (accepted candidate or None, candidates)
+        """
+        candidates = [Candidate(index) for index in range(self.candidates)]
+        cancelled = threading.Event()
+        streams = {}
+        pending = {
+            self.executor.submit(run, model_id, body, candidate, cancelled, streams)
+            for candidate in candidates
+        }
+
+        errors = []
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.cancelled():
+                    continue
+                if future.exception() is not None:
+                    errors.append(future.exception())
+                    continue
+                candidate = future.result()
+                if self._accepted(candidate):
+                    ## Stop the remaining candidates, without waiting for them to wind down
+                    cancelled.set()
+                    for other_future in pending:
+                        other_future.cancel()
+                    for index, stream in list(streams.items()):
+                        if index != candidate.index:
+                            stream.close()
+                    for other in candidates:
+                        if other.score is None and other is not candidate:
+                            other.cancelled = True
+                    return candidate, candidates
+
+        if all(candidate.score is None for candidate in candidates):
+            raise errors[0]
+        for error in errors:
+            logger.warning(f"Best-of-N candidate failed: {error}")
+        return None, candidates
@@ -0,0 +1,276 @@
+import json
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from model_invocation.families import family_of, set_max_tokens
+from model_invocation.streaming import StreamAccumulator, iter_chunks
+from utils.token_estimator import TokenEstimator
+
+## Instantiate Logger
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+# Conversation Default Values
+HISTORY_TOKENS = 2000
+MAX_TOKENS = 512
+SUMMARY_TOKENS = 200
+SUMMARY_INSTRUCTION = (
+    "Summarize the conversation below in a few sentences, keeping names, facts and decisions "
+    "needed to continue it."
+)
+
+
+class _ClaudeFormat:
+    """
+    \\n\\nHuman: ...\\n\\nAssistant: ... turns, the system prompt leads the conversation
+    """
+
+    stop_sequences = ["\n\nHuman:"]
+
+    def prefix(self, system):
+        return system or ""
+
+    def turn(self, user, assistant):
+        return f"\n\nHuman: {user}\n\nAssistant: {assistant}"
+
+    def question(self, user):
+        return f"\n\nHuman: {user}\n\nAssistant:"
+
+
+class _Llama2Format:
+    """
+    <s>[INST] <<SYS>> system <</SYS>> user [/INST] assistant </s><s>[INST] user [/INST] ...
+    Every turn ends by opening the next [INST], so that turns can be dropped from the front.
+    """
+
+    stop_sequences = []
+
+    def prefix(self, system):
+        return f"<s>[INST] <<SYS>>\n{system}\n<</SYS>>\n\n" if system else "<s>[INST] "
+
+    def turn(self, user, assistant):
+        return f"{user} [/INST] {assistant} </s><s>[INST] "
+
+    def question(self, user):
+        return f"{user} [/INST]"
+
+
+class _TranscriptFormat:
+    """
+    Plain transcript for the models without a chat format (Titan, Cohere Command, Jurassic2)
+    """
+
+    def __init__(self, user_label, assistant_label) -> None:
+        self.user_label = user_label
+        self.assistant_label = assistant_label
+        self.stop_sequences = [f"{user_label}:"]
+
+    def prefix(self, system):
+        return f"{system}\n\n" if system else ""
+
+    def turn(self, user, assistant):
+        return f"{self.user_label}: {user}\n{self.assistant_label}: {assistant}\n"
+
+    def question(self, user):
+        return f"{self.user_label}: {user}\n{self.assistant_label}:"
+
+
+PROMPT_FORMATS = {
+    "claude": _ClaudeFormat(),
+    "llama2": _Llama2Format(),
+    "titan-text": _TranscriptFormat("User", "Bot"),
+    "cohere-command": _TranscriptFormat("User", "Chatbot"),
+    "jurassic2": _TranscriptFormat("User", "Assistant"),
+}
+## Request field of each family for the stop sequences
+STOP_SEQUENCES_PATH = {
+    "claude": ("stop_sequences",),
+    "titan-text": ("textGenerationConfig", "stopSequences"),
+    "cohere-command": ("stop_sequences",),
+    "jurassic2": ("stopSequences",),
+}
+
+
+def completion_text(model_id, response):
+    """
+    Generated text of a (non streaming) text generation response, whatever the family
+    """
+    family = family_of(model_id)["name"]
+    if family == "titan-text":
+        return response["results"][0]["outputText"]
+    if family == "llama2":
+        return response["generation"]
+    if family == "cohere-command":
+        return response["generations"][0]["text"]
+    if family == "jurassic2":
+        return response["completions"][0]["data"]["text"]
+    return response["completion"]
+
+
+class ConversationSession:
+    """
+    --> Multi-turn conversation with a text model, in the prompt format of its family:
+
+    1. Claude: Human/Assistant turns
+    2. Llama2: [INST] ... [/INST] turns with the <<SYS>> system prompt
+    3. Titan, Cohere Command, Jurassic2: User/Bot transcript
+
+    Every turn is rendered once, when it is appended, and its estimated tokens are kept alongside, so a
+    new question only costs joining the rendered turns rather than formatting the history again.
+
+    --> History budget:
+
+    When the rendered history exceeds `history_tokens`, the oldest turns leave it:
+
+        1. summarize=False: they are dropped
+        2. summarize=True: they are folded into a running summary by the same model, in the background after
+           the answer was returned, so that the next question does not wait for it (unless it arrives first)
+
+    Either way the prompt stays within the budget, and the latency per turn stays flat in long chats.
+    """
+
+    def __init__(
+        self,
+        bedrock_client,
+        model_id,
+        system=None,
+        history_tokens=HISTORY_TOKENS,
+        max_tokens=MAX_TOKENS,
+        inference_parameters=None,
+        summarize=False,
+        estimator=None,
+    ) -> None:
+        self.bedrock_client = bedrock_client
+        self.model_id = model_id
+        self.family = family_of(model_id)["name"]
+        self.format = PROMPT_FORMATS.get(self.family, PROMPT_FORMATS["claude"])
+        self.system = system
+        self.history_tokens = history_tokens
+        self.max_tokens = max_tokens
+        self.inference_parameters = inference_parameters or {}
+        self.summarize = summarize
+        self.estimator = estimator or TokenEstimator()
+
+        ## Rendered turns and their estimated tokens, oldest first
+        self.turns = deque()
+        self.turn_tokens = deque()
+        self.total_tokens = 0
+        self.summary = None
+        self.prefix = self.format.prefix(system)
+        self.lock = threading.Lock()
+        self.summarizer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="summarizer") if summarize else None
+        self.pending_summary = None
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self.turns)
+
+    def prompt(self, question):
+        """
+        Prompt for the next question: system prompt (and summary), history and the question
+        """
+        with self.lock:
+            history = "".join(self.turns)
+        return f"{self.prefix}{history}{self.format.question(question)}"
+
+    def body(self, question):
+        """
+        Request body of the next question for the family of the model
+        """
+        family = family_of(self.model_id)
+        body = {family["prompt_key"]: self.prompt(question)}
+        for key, value in self.inference_parameters.items():
+            body[key] = value
+        set_max_tokens(self.model_id, body, self.max_tokens)
+
+        path = STOP_SEQUENCES_PATH.get(self.family)
+        if path and self.format.stop_sequences:
+            value = body
+            for key in path[:-1]:
+                value = value.setdefault(key, {})
+            value.setdefault(path[-1], list(self.format.stop_sequences))
+        return body
+
+    def append(self, user, assistant):
+        """
+        Add a completed turn to the history, trimming the history to its token budget
+        """
+        rendered = self.format.turn(user, assistant.strip())
+        tokens = self.estimator.estimate(self.model_id, rendered)
+        with self.lock:
+            self.turns.append(rendered)
+            self.turn_tokens.append(tokens)
+            self.total_tokens += tokens
+            evicted = []
+            ## The last turn always stays, even if larger than the budget on its own
+            while self.total_tokens > self.history_tokens and len(self.turns) > 1:
+                evicted.append(self.turns.popleft())
+                self.total_tokens -= self.turn_tokens.popleft()
+            self.dropped += len(evicted)
+
+        if evicted and self.summarize:
+            self.pending_summary = self.summarizer.submit(self._summarize, "".join(evicted))
+
+    def ask(self, question, streaming=False, callbacks=()):
+        """
+        Send a question with the conversation history, record the turn and return the answer
+        """
+        if self.pending_summary is not None:
+            self.pending_summary.result()
+            self.pending_summary = None
+
+        body = self.body(question)
+        if streaming and self.family == "cohere-command":
+            body["stream"] = True
+        body = json.dumps(body)
+        if streaming:
+            output = self.bedrock_client.invoke_model_with_response_stream(
+                body=body,
+                modelId=self.model_id,
+                accept="application/json",
+                contentType="application/json",
+            )
+            answer = StreamAccumulator(callbacks).consume(iter_chunks(self.model_id, output["body"])).text
+        else:
+            output = self.bedrock_client.invoke_model(
+                body=body,
+                modelId=self.model_id,
+                accept="application/json",
+                contentType="application/json",
+            )
+            answer = completion_text(self.model_id, json.loads(output["body"].read()))
+
+        self.append(question, answer)
+        return answer
+
+    def _summarize(self, evicted):
+        """
+        Fold evicted turns into the running summary, which becomes part of the prompt prefix
+        """
+        previous = f"Summary so far: {self.summary}\n\n" if self.summary else ""
+        request = f"{SUMMARY_INSTRUCTION}\n\n{previous}{evicted}"
+        family = family_of(self.model_id)
+        body = {family["prompt_key"]: f"{self.format.prefix(None)}{self.format.question(request)}"}
+        set_max_tokens(self.model_id, body, SUMMARY_TOKENS)
+        try:
+            output = self.bedrock_client.invoke_model(
+                body=json.dumps(body),
+                modelId=self.model_id,
+                accept="application/json",
+                contentType="application/json",
+            )
+            summary = completion_text(self.model_id, json.loads(output["body"].read())).strip()
+        except Exception as err:
+            logger.warning(f"Conversation summary failed, the oldest turns are dropped: {err}")
+            return
+
+        system = f"{self.system}\n\n" if self.system else ""
+        with self.lock:
+            self.summary = summary
+            self.prefix = self.format.prefix(f"{system}Summary of the earlier conversation: {summary}")
+
+    def close(self):
+        if self.summarizer is not None:
+            self.summarizer.shutdown(wait=False, cancel_futures=True)
@@ -1,19 +1,35 @@
 import json
 import logging
 
+from utils.log_utils import log_payload
+from model_invocation.parameters import Field, Parameters
+from profiling.profiler import stage
+
 ## Instantiate Logger
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO, format="%(message)s")
 
 MODEL_ID_TITAN = "amazon.titan-embed-g1-text-02"
+MODEL_ID_TITAN_V2 = "amazon.titan-embed-text-v2:0"
 DEFAULT_PROMPT = "Why do we dream?"
 
 
+class TitanEmbeddingParameters(Parameters):
+    """
+    Parameters of Amazon Titan Embedding
+    """
+
+    MODEL = "Amazon Titan Embedding"
+    FIELDS = dict(model_id=Field(str, MODEL_ID_TITAN), prompt=Field(str, DEFAULT_PROMPT))
+    __slots__ = tuple(FIELDS)
+
+
 class AmazonTitanEmbeddeing:
     """
     --> Amazon Titan Embedding models:
 
     1. amazon.titan-embed-g1-text-02:
+    2. amazon.titan-embed-text-v2:0: Supports dimensions (256, 512, 1024), normalize and embeddingTypes
 
     --> Request Structure: Json with following propertis
 
@@ -26,13 +42,20 @@ class AmazonTitanEmbeddeing:
 
         Request Body
         {
-            "inputText": string
+            "inputText": string,
+            "dimensions": int,                  ## v2 only
+            "normalize": boolean,               ## v2 only
+            "embeddingTypes": ["float|binary"]  ## v2 only
         }
 
     --> Response Structure: Json with following properties
 
         {
             "embedding": [float, float, ...],   ## An array that represents the vector of embeddings
+            "embeddingsByType": {               ## v2 only, one array per requested embedding type
+                "float": [float, ...],
+                "binary": [int, ...]            ## 0 or 1 per dimension
+            },
             "inputTextTokenCount": int          ## The number of tokens in the input.
         }
     """
@@ -41,37 +64,69 @@ class AmazonTitanEmbeddeing:
         self.bedrock_client = bedrock_client
 
     def prepare_input(self):
-        self.model_id = (
+        """
+        Collect the parameters of an embedding from the user
+        """
+        values = {}
+        values["model_id"] = (
             input(f"Please input modelId [{MODEL_ID_TITAN}]: ").strip()
             or MODEL_ID_TITAN
         )
-        self.prompt = (
+        values["prompt"] = (
             input(f"Please input Question [{DEFAULT_PROMPT}]: ").strip()
             or DEFAULT_PROMPT
         )
+        return TitanEmbeddingParameters(**values)
+
+    def embed(self, texts, model_id=MODEL_ID_TITAN, embedding_types=None, dimensions=None):
+        """
+        Generate embedding vectors for a list of texts without any user interaction.
+        Titan embeds a single input text per invocation.
+        With embedding_types (v2 models, e.g. ["binary"]) a dict of vectors per type is returned.
+        """
+        request = {}
+        if embedding_types:
+            request["embeddingTypes"] = list(embedding_types)
+        if dimensions:
+            request["dimensions"] = dimensions
+
+        embeddings = {embedding_type: [] for embedding_type in embedding_types} if embedding_types else []
+        for text in texts:
+            ## Invoke the model
+            output = self.bedrock_client.invoke_model(
+                body=json.dumps(dict(request, inputText=text)),
+                modelId=model_id,
+                accept="application/json",
+                contentType="application/json",
+            )
+
+            ## Read the response
+            raw = output["body"].read()
+            with stage("parse"):
+                response = json.loads(raw)
+            if embedding_types:
+                for embedding_type in embedding_types:
+                    embeddings[embedding_type].append(response["embeddingsByType"][embedding_type])
+            else:
+                embeddings.append(response["embedding"])
+        return embeddings
+
+    def generate(self, params):
+        """
+        Embedding vector (list of floats) of the prompt of the parameters
+        """
+        params = TitanEmbeddingParameters.of(params)
+        return self.embed([params.prompt], model_id=params.model_id)[0]
 
     def process(self):
         """
         Generate a embeddings vector for a text input
         """
         ## Prepare the input for model invocation
-        self.prepare_input()
-
-        ## Prepare the input for FM invocation
-        input = json.dumps(dict(inputText=self.prompt))
+        params = self.prepare_input()
 
         ## Invoke the model
-        output = self.bedrock_client.invoke_model(
-            body=input,
-            modelId=self.model_id,
-            accept="application/json",
-            contentType="application/json",
-        )
-
-        ## Read the response
-        response = json.loads(output["body"].read())
-
-        embedding = response["embedding"]
+        embedding = self.generate(params)
 
-        ## Print the embedding generated
-        logger.info(embedding)
+        ## Print a summary (dimensions, norm) of the embedding generated
+        log_payload(logger, "Embedding", embedding, model_id=params.model_id)
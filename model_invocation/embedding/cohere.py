@@ -1,6 +1,10 @@
 import json
 import logging
 
+from utils.log_utils import log_payload
+from model_invocation.parameters import Field, Parameters
+from profiling.profiler import stage
+
 ## Instantiate Logger
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO, format="%(message)s")
@@ -8,10 +12,26 @@ logging.basicConfig(level=logging.INFO, format="%(message)s")
 MODEL_ID_COHERE = "cohere.embed-english-v3"
 
 INPUT_TYPE = "classification"
+INPUT_TYPES = ("search_document", "search_query", "classification", "clustering")
 TRUNCATE_HANDLING = "NONE"
 DEFAULT_PROMPT = "Why do we dream?"
 
 
+class CohereEmbeddingParameters(Parameters):
+    """
+    Parameters of Cohere Embedding, validated against the values documented in CohereEmbeddeing
+    """
+
+    MODEL = "Cohere Embedding"
+    FIELDS = dict(
+        model_id=Field(str, MODEL_ID_COHERE),
+        input_type=Field(str, INPUT_TYPE, choices=INPUT_TYPES),
+        truncate_handling=Field(str, TRUNCATE_HANDLING, choices=("NONE", "START", "END")),
+        prompt=Field(str, DEFAULT_PROMPT),
+    )
+    __slots__ = tuple(FIELDS)
+
+
 class CohereEmbeddeing:
     """
     --> Cohere Embedding models:
@@ -31,7 +51,8 @@ class CohereEmbeddeing:
         {
             "texts":[string],                                                           ## Aray of text to embed
             "input_type": "search_document|search_query|classification|clustering",     ## Prepends special tokens to differentiate each type from one another.
-            "truncate": "NONE|LEFT|RIGHT"                                               ## Specifies how the API handles inputs longer than the maximum token length
+            "truncate": "NONE|START|END",                                               ## Specifies how the API handles inputs longer than the maximum token length
+            "embedding_types": ["float|int8|uint8|binary|ubinary"]                      ## Optional, compressed embedding types to return
         }
 
     --> Response Structure: Json with following properties
@@ -44,64 +65,104 @@ class CohereEmbeddeing:
             "response_type" : "embeddings_floats,
             "texts": [string]
         }
+
+        ## With embedding_types, "embeddings" holds one array per requested type
+        {
+            "embeddings": {
+                "float": [[float, ...]],
+                "int8": [[int, ...]],           ## 1024 values in -128..127
+                "ubinary": [[int, ...]]         ## 128 bytes, 8 dimensions (sign bits) packed per byte
+            },
+            "response_type" : "embeddings_by_type",
+            ...
+        }
     """
 
     def __init__(self, bedrock_client) -> None:
         self.bedrock_client = bedrock_client
 
     def prepare_input(self):
-        self.model_id = (
+        """
+        Collect the parameters of an embedding from the user
+        """
+        values = {}
+        values["model_id"] = (
             input(f"Please input modelId [{MODEL_ID_COHERE}]: ").strip()
             or MODEL_ID_COHERE
         )
-        self.input_type = (
+        values["input_type"] = (
             input(f"Please input input_type [{INPUT_TYPE}]: ").strip() or INPUT_TYPE
         )
-        self.truncate_handling = (
+        values["truncate_handling"] = (
             input(f"Please input value for truncate [{TRUNCATE_HANDLING}]: ").strip()
             or TRUNCATE_HANDLING
         )
 
-        self.prompt = (
+        values["prompt"] = (
             input(f"Please input Question [{DEFAULT_PROMPT}]: ").strip()
             or DEFAULT_PROMPT
         )
+        return CohereEmbeddingParameters(**values)
 
-    def process(self):
+    def invoke(self, texts, model_id, input_type, truncate_handling, embedding_types=None):
         """
-        Generate a embeddings vector for a text input
+        Invoke the Cohere embedding model for a batch of texts and return the parsed response
         """
-        ## Prepare the input for model invocation
-        self.prepare_input()
-
         ## Prepare the input for FM invocation
-        input = json.dumps(
-            dict(
-                texts=[self.prompt],
-                input_type=self.input_type,
-                truncate=self.truncate_handling,
-            )
+        request = dict(
+            texts=texts,
+            input_type=input_type,
+            truncate=truncate_handling,
         )
+        if embedding_types:
+            request["embedding_types"] = list(embedding_types)
+        input = json.dumps(request)
 
         ## Invoke the model
         output = self.bedrock_client.invoke_model(
             body=input,
-            modelId=self.model_id,
+            modelId=model_id,
             accept="application/json",
             contentType="application/json",
         )
 
         ## Read the response
-        response = json.loads(output["body"].read())
+        raw = output["body"].read()
+        with stage("parse"):
+            return json.loads(raw)
+
+    def embed(
+        self,
+        texts,
+        model_id=MODEL_ID_COHERE,
+        input_type=INPUT_TYPE,
+        truncate_handling=TRUNCATE_HANDLING,
+        embedding_types=None,
+    ):
+        """
+        Generate embedding vectors for a list of texts without any user interaction.
+        With embedding_types (e.g. ["int8", "ubinary"]) a dict of vectors per type is returned.
+        """
+        response = self.invoke(texts, model_id, input_type, truncate_handling, embedding_types)
+        return response["embeddings"]
+
+    def generate(self, params):
+        """
+        Embedding vector (list of floats) of the prompt of the parameters
+        """
+        params = CohereEmbeddingParameters.of(params)
+        return self.embed(
+            [params.prompt], params.model_id, params.input_type, params.truncate_handling
+        )[0]
 
-        ## Print the embedding generated
-        logger.info(f"ID: {response.get('id')}")
-        logger.info(f"Response type: {response.get('response_type')}")
+    def process(self):
+        """
+        Generate a embeddings vector for a text input
+        """
+        ## Prepare the input for model invocation
+        params = self.prepare_input()
 
-        logger.info("Embeddings...")
-        embedding = response["embeddings"]
-        logger.info(f"Generated Embedding: {embedding}")
+        embedding = self.generate(params)
 
-        logger.info("Texts...")
-        texts = response["texts"]
-        logger.info(f"Texts: {texts}")
+        ## Print a summary (dimensions, norm) of the embedding generated
+        log_payload(logger, "Generated Embedding", embedding, model_id=params.model_id)
@@ -0,0 +1,154 @@
+"""
+--> Model families available through Amazon Bedrock and the request fields which differ between them.
+
+    Every model id starts with the provider and model name (e.g. anthropic.claude-v2, meta.llama2-13b-chat-v1),
+    so the family is resolved by the longest matching model id prefix.
+
+    1. prompt_key:
+    Request body field carrying the input text.
+
+    2. max_tokens_path:
+    Path to the request body field limiting the generated tokens (empty for embedding models).
+
+    3. context_window:
+    Maximum number of input plus generated tokens supported by the family.
+
+    4. temperature_path / top_p_path:
+    Paths to the request body fields of the sampling parameters (empty for embedding models).
+"""
+
+MODEL_FAMILIES = {
+    "amazon.titan-text": dict(
+        name="titan-text",
+        prompt_key="inputText",
+        max_tokens_path=("textGenerationConfig", "maxTokenCount"),
+        temperature_path=("textGenerationConfig", "temperature"),
+        top_p_path=("textGenerationConfig", "topP"),
+        context_window=8000,
+    ),
+    "amazon.titan-embed": dict(
+        name="titan-embed",
+        prompt_key="inputText",
+        max_tokens_path=(),
+        temperature_path=(),
+        top_p_path=(),
+        context_window=8192,
+    ),
+    "anthropic.claude": dict(
+        name="claude",
+        prompt_key="prompt",
+        max_tokens_path=("max_tokens_to_sample",),
+        temperature_path=("temperature",),
+        top_p_path=("top_p",),
+        context_window=100000,
+    ),
+    "meta.llama2": dict(
+        name="llama2",
+        prompt_key="prompt",
+        max_tokens_path=("max_gen_len",),
+        temperature_path=("temperature",),
+        top_p_path=("top_p",),
+        context_window=4096,
+    ),
+    "ai21.j2": dict(
+        name="jurassic2",
+        prompt_key="prompt",
+        max_tokens_path=("maxTokens",),
+        temperature_path=("temperature",),
+        top_p_path=("topP",),
+        context_window=8191,
+    ),
+    "cohere.command": dict(
+        name="cohere-command",
+        prompt_key="prompt",
+        max_tokens_path=("max_tokens",),
+        temperature_path=("temperature",),
+        top_p_path=("p",),
+        context_window=4000,
+    ),
+    "cohere.embed": dict(
+        name="cohere-embed",
+        prompt_key="texts",
+        max_tokens_path=(),
+        temperature_path=(),
+        top_p_path=(),
+        context_window=512,
+    ),
+}
+
+DEFAULT_FAMILY = dict(
+    name="default",
+    prompt_key="prompt",
+    max_tokens_path=(),
+    temperature_path=(),
+    top_p_path=(),
+    context_window=4096,
+)
+
+_PREFIXES = sorted(MODEL_FAMILIES, key=len, reverse=True)
+
+
+def family_of(model_id):
+    """
+    Return the family description of a model id
+    """
+    for prefix in _PREFIXES:
+        if model_id.startswith(prefix):
+            return MODEL_FAMILIES[prefix]
+    return DEFAULT_FAMILY
+
+
+def prompt_of(model_id, body):
+    """
+    Return the input text of a request body, multiple texts (Cohere embeddings) are joined
+    """
+    prompt = body.get(family_of(model_id)["prompt_key"], "")
+    if isinstance(prompt, list):
+        return "\n".join(prompt)
+    return prompt
+
+
+def texts_of(model_id, body):
+    """
+    Return the input texts of a request body: one per text of a batch (Cohere embeddings), else the prompt
+    """
+    prompt = body.get(family_of(model_id)["prompt_key"], "")
+    if isinstance(prompt, list):
+        return prompt
+    return [prompt]
+
+
+def max_tokens_of(model_id, body):
+    """
+    Return the requested number of generated tokens of a request body, or 0 if not set
+    """
+    value = body
+    for key in family_of(model_id)["max_tokens_path"]:
+        if not isinstance(value, dict) or key not in value:
+            return 0
+        value = value[key]
+    return value if isinstance(value, int) else 0
+
+
+def _set(body, path, value):
+    if not path:
+        return
+    for key in path[:-1]:
+        body = body.setdefault(key, {})
+    body[path[-1]] = value
+
+
+def set_max_tokens(model_id, body, max_tokens):
+    """
+    Overwrite the requested number of generated tokens in a request body
+    """
+    _set(body, family_of(model_id)["max_tokens_path"], max_tokens)
+
+
+def set_sampling(model_id, body, temperature, top_p):
+    """
+    Overwrite the temperature and top_p (nucleus sampling) in a request body
+    """
+    family = family_of(model_id)
+    _set(body, family["temperature_path"], temperature)
+    _set(body, family["top_p_path"], top_p)
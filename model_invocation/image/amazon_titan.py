@@ -4,7 +4,10 @@ import base64
 from io import BytesIO
 from PIL import Image
 
-from utils.exception_handler import BedrockException
+from utils.exception_handler import BedrockException, ValidationException
+from utils.log_utils import log_payload
+from model_invocation.parameters import IMAGE_SIZES, Field, Parameters
+from profiling.profiler import stage
 
 ## Instantiate Logger
 logger = logging.getLogger(__name__)
@@ -24,6 +27,56 @@ NEGATIVE_TEXT = ""
 DEFAULT_PROMOPT = "A boy is playing with dog in the park."
 
 
+class TitanImageParameters(Parameters):
+    """
+    Parameters of Amazon Titan Image, validated against the values documented in AmazonTitanImageGenerator
+    """
+
+    MODEL = "Amazon Titan Image"
+    FIELDS = dict(
+        model_id=Field(str, MODEL_ID_TITAN),
+        img_counts=Field(int, int(IMAGE_COUNTS), 1, 5),
+        quality=Field(str, QUALITY, choices=("standard", "premium")),
+        width=Field(int, int(IMG_WIDTH)),
+        height=Field(int, int(IMG_HEIGHT)),
+        cfg_scale=Field(float, float(CFG_SCALE), 1.1, 10.0),
+        seed=Field(int, int(SEED), 0, 2147483646),
+        prompt=Field(str, DEFAULT_PROMOPT),
+        negative_text=Field(str, NEGATIVE_TEXT),
+    )
+    __slots__ = tuple(FIELDS)
+
+    def check(self):
+        if (self.width, self.height) not in IMAGE_SIZES:
+            raise ValidationException(f"Invalid size for {self.MODEL}: {self.width}x{self.height} is not supported")
+
+
+def build_request(params):
+    """
+    Request body for Amazon Titan Image, built from the parameters only (missing ones take their default)
+    """
+    params = TitanImageParameters.of(params)
+    if params.negative_text == "":
+        textToImageParams = dict(text=params.prompt)
+    else:
+        textToImageParams = dict(text=params.prompt, negativeText=params.negative_text)
+
+    return json.dumps(
+        dict(
+            taskType="TEXT_IMAGE",
+            textToImageParams=textToImageParams,
+            imageGenerationConfig=dict(
+                numberOfImages=params.img_counts,
+                quality=params.quality,
+                width=params.width,
+                height=params.height,
+                cfgScale=params.cfg_scale,
+                seed=params.seed,
+            ),
+        )
+    )
+
+
 class AmazonTitanImageGenerator:
     """
     --> Amazon Titan Image models:
@@ -105,89 +158,98 @@ class AmazonTitanImageGenerator:
 
     """
 
-    def __init__(self, bedrock_client) -> None:
+    def __init__(self, bedrock_client, post_processor=None) -> None:
         self.bedrock_client = bedrock_client
+        ## Optional ImagePostProcessor writing WebP/JPEG renditions and thumbnails of the saved images
+        self.post_processor = post_processor
 
     def prepare_input(self):
-        self.model_id = (
+        """
+        Collect the parameters of a generation from the user
+        """
+        values = {}
+        values["model_id"] = (
             input(f"Please input modelId [{MODEL_ID_TITAN}]: ").strip()
             or MODEL_ID_TITAN
         )
-        self.img_counts = int(
+        values["img_counts"] = int(
             input(f"Please input numberOfImages [{IMAGE_COUNTS}]: ").strip()
             or IMAGE_COUNTS
         )
-        self.quality = input(f"Please input quality [{QUALITY}]: ").strip() or QUALITY
-        self.width = int(
+        values["quality"] = input(f"Please input quality [{QUALITY}]: ").strip() or QUALITY
+        values["width"] = int(
             input(f"Please input width [{IMG_WIDTH}]: ").strip() or IMG_WIDTH
         )
-        self.height = int(
+        values["height"] = int(
             input(f"Please input height [{IMG_HEIGHT}]: ").strip() or IMG_HEIGHT
         )
 
-        self.cfg_scale = float(
+        values["cfg_scale"] = float(
             input(f"Please input cfgScale [{CFG_SCALE}]: ").strip() or CFG_SCALE
         )
-        self.seed = int(input(f"Please input seed [{SEED}]: ").strip() or SEED)
+        values["seed"] = int(input(f"Please input seed [{SEED}]: ").strip() or SEED)
 
-        self.prompt = (
+        values["prompt"] = (
             input(f"Please input text [{DEFAULT_PROMOPT}]: ").strip()
             or DEFAULT_PROMOPT
         )
-        self.negative_text = (
+        values["negative_text"] = (
             input(f"Please input negativeText [{NEGATIVE_TEXT}]: ").strip()
             or NEGATIVE_TEXT
         )
+        return TitanImageParameters(**values)
 
-    def process(self):
+    def generate(self, params):
         """
-        Invoke Amazon Titan Image Model
+        Invoke Amazon Titan Image Model, return the generated images
         """
-        ## Collect user Inputs
-        self.prepare_input()
+        params = TitanImageParameters.of(params)
 
         ### Prepare Input for the FM invocation
-        if self.negative_text == "":
-            textToImageParams = dict(text=self.prompt)
-        else:
-            textToImageParams = dict(text=self.prompt, negativeText=self.negative_text)
-
-        input = json.dumps(
-            dict(
-                taskType="TEXT_IMAGE",
-                textToImageParams=textToImageParams,
-                imageGenerationConfig=dict(
-                    numberOfImages=self.img_counts,
-                    quality=self.quality,
-                    width=self.width,
-                    height=self.height,
-                    cfgScale=self.cfg_scale,
-                    seed=self.seed,
-                ),
-            )
-        )
-        print(input)
+        with stage("build"):
+            body = build_request(params)
+        log_payload(logger, "Request", body, level=logging.DEBUG)
 
         ### Invoke Foundation Model
         output = self.bedrock_client.invoke_model(
-            body=input,
-            modelId=self.model_id,
+            body=body,
+            modelId=params.model_id,
             accept="application/json",
             contentType="application/json",
         )
 
         ### Read Response
-        response = json.loads(output["body"].read())
+        raw = output["body"].read()
+        with stage("parse"):
+            response = json.loads(raw)
 
         error = response.get("error")
         if error is not None:
             raise BedrockException(f"Image Generation Error: {error}")
 
-        images = [
-            Image.open(BytesIO(base64.b64decode(base64_image)))
-            for base64_image in response.get("images")
-        ]
+        with stage("post-process"):
+            images = [
+                Image.open(BytesIO(base64.b64decode(base64_image)))
+                for base64_image in response.get("images")
+            ]
+            ## Decoded now rather than on first use, so that the decoding is part of this stage
+            for image in images:
+                image.load()
+        return images
+
+    def process(self):
+        """
+        Invoke Amazon Titan Image Model with parameters collected from the user, save the images
+        """
+        ## Collect user Inputs
+        params = self.prepare_input()
+
+        images = self.generate(params)
         num_image = 1
         for image in images:
-            image.save(f"generated_image-{num_image}.png")
+            with stage("save"):
+                image.save(f"generated_image-{num_image}.png")
+            ## Renditions encoded in the background, while the next request is generated
+            if self.post_processor is not None:
+                self.post_processor.submit(image, f"generated_image-{num_image}")
             num_image = num_image + 1
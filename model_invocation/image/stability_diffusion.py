@@ -4,7 +4,9 @@ import base64
 from io import BytesIO
 from PIL import Image
 
-from utils.exception_handler import ImageException
+from utils.exception_handler import ImageException, ValidationException
+from model_invocation.parameters import IMAGE_SIZES, Field, Parameters
+from profiling.profiler import stage
 
 ## Instantiate Logger
 logger = logging.getLogger(__name__)
@@ -20,9 +22,55 @@ CFG_SCALE = "7"
 SEED = "0"
 STEPS = "50"
 STYLE_PRESET = "photographic"
+STYLE_PRESETS = (
+    "3d-model", "analog-film", "anime", "cinematic", "comic-book", "digital-art", "enhance", "fantasy-art",
+    "isometric", "line-art", "low-poly", "modeling-compound", "neon-punk", "origami", "photographic",
+    "pixel-art", "tile-texture",
+)
 DEFAULT_PROMOPT = "A boy is playing with dog in the park."
 
 
+class StableDiffusionParameters(Parameters):
+    """
+    Parameters of Stability Diffusion, validated against the values documented in StabilityDiffusionImageGenerator
+    """
+
+    MODEL = "Stability Diffusion"
+    FIELDS = dict(
+        model_id=Field(str, MODEL_ID_COMMAND),
+        width=Field(int, int(IMG_WIDTH)),
+        height=Field(int, int(IMG_HEIGHT)),
+        cfg_scale=Field(int, int(CFG_SCALE), 0, 35),
+        seed=Field(int, int(SEED), 0, 4294967295),
+        steps=Field(int, int(STEPS), 0, 150),
+        style_preset=Field(str, STYLE_PRESET, choices=STYLE_PRESETS),
+        prompt=Field(str, DEFAULT_PROMOPT),
+    )
+    __slots__ = tuple(FIELDS)
+
+    def check(self):
+        if (self.width, self.height) not in IMAGE_SIZES:
+            raise ValidationException(f"Invalid size for {self.MODEL}: {self.width}x{self.height} is not supported")
+
+
+def build_request(params):
+    """
+    Request body for Stability Diffusion, built from the parameters only (missing ones take their default)
+    """
+    params = StableDiffusionParameters.of(params)
+    return json.dumps(
+        dict(
+            text_prompts=[dict(text=params.prompt)],
+            width=params.width,
+            height=params.height,
+            cfg_scale=params.cfg_scale,
+            seed=params.seed,
+            steps=params.steps,
+            style_preset=params.style_preset,
+        )
+    )
+
+
 class StabilityDiffusionImageGenerator:
     """
     --> Stability AI Diffusion Image models:
@@ -122,76 +170,93 @@ class StabilityDiffusionImageGenerator:
 
     """
 
-    def __init__(self, bedrock_client) -> None:
+    def __init__(self, bedrock_client, post_processor=None) -> None:
         self.bedrock_client = bedrock_client
+        ## Optional ImagePostProcessor writing WebP/JPEG renditions and thumbnails of the saved images
+        self.post_processor = post_processor
 
     def prepare_input(self):
-        self.model_id = (
+        """
+        Collect the parameters of a generation from the user
+        """
+        values = {}
+        values["model_id"] = (
             input(f"Please input modelId [{MODEL_ID_COMMAND}]: ").strip()
             or MODEL_ID_COMMAND
         )
 
-        self.width = int(
+        values["width"] = int(
             input(f"Please input width [{IMG_WIDTH}]: ").strip() or IMG_WIDTH
         )
-        self.height = int(
+        values["height"] = int(
             input(f"Please input height [{IMG_HEIGHT}]: ").strip() or IMG_HEIGHT
         )
 
-        self.cfg_scale = int(
+        values["cfg_scale"] = int(
             input(f"Please input cfg_scale [{CFG_SCALE}]: ").strip() or CFG_SCALE
         )
-        self.seed = int(input(f"Please input seed [{SEED}]: ").strip() or SEED)
-        self.steps = int(input(f"Please input steps [{STEPS}]: ").strip() or STEPS)
-        self.style_preset = (
+        values["seed"] = int(input(f"Please input seed [{SEED}]: ").strip() or SEED)
+        values["steps"] = int(input(f"Please input steps [{STEPS}]: ").strip() or STEPS)
+        values["style_preset"] = (
             input(f"Please input style_preset [{STYLE_PRESET}]: ").strip()
             or STYLE_PRESET
         )
 
-        self.prompt = (
+        values["prompt"] = (
             input(f"Please input Question [{DEFAULT_PROMOPT}]: ").strip()
             or DEFAULT_PROMOPT
         )
+        return StableDiffusionParameters(**values)
 
-    def process(self):
+    def generate(self, params):
         """
-        Invoke Stability Diffusion Image Model
+        Invoke Stability Diffusion Image Model, return the generated images
         """
-        ## Collect user Inputs
-        self.prepare_input()
-
-        ### Prepare Input for the FM invocation
-        input = json.dumps(
-            dict(
-                text_prompts=[dict(text=self.prompt)],
-                width=self.width,
-                height=self.height,
-                cfg_scale=self.cfg_scale,
-                seed=self.seed,
-                steps=self.steps,
-                style_preset=self.style_preset,
-            )
-        )
+        params = StableDiffusionParameters.of(params)
+
+        with stage("build"):
+            body = build_request(params)
 
         ### Invoke Foundation Model
         output = self.bedrock_client.invoke_model(
-            body=input,
-            modelId=self.model_id,
+            body=body,
+            modelId=params.model_id,
             accept="application/json",
             contentType="application/json",
         )
 
         ### Read Response
-        response = json.loads(output["body"].read())
+        raw = output["body"].read()
+        with stage("parse"):
+            response = json.loads(raw)
 
+        images = []
         for artifact in response["artifacts"]:
             finish_reason = artifact["finishReason"]
             if finish_reason == "ERROR" or finish_reason == "CONTENT_FILTERED":
                 raise ImageException(f"Error in Image Generation: {finish_reason}")
 
-            base64_img = artifact["base64"]
-            base64_bytes = base64_img.encode("ascii")
-            img_bytes = base64.b64decode(base64_bytes)
+            with stage("post-process"):
+                base64_img = artifact["base64"]
+                base64_bytes = base64_img.encode("ascii")
+                img_bytes = base64.b64decode(base64_bytes)
+
+                image = Image.open(BytesIO(img_bytes))
+                ## Decoded now rather than on first use, so that the decoding is part of this stage
+                image.load()
+                images.append(image)
+        return images
 
-            image = Image.open(BytesIO(img_bytes))
-            image.save("generated_image.png")
+    def process(self):
+        """
+        Invoke Stability Diffusion Image Model with parameters collected from the user, save the image
+        """
+        ## Collect user Inputs
+        params = self.prepare_input()
+
+        for image in self.generate(params):
+            with stage("save"):
+                image.save("generated_image.png")
+            ## Renditions encoded in the background, while the next request is generated
+            if self.post_processor is not None:
+                self.post_processor.submit(image, "generated_image")
@@ -0,0 +1,168 @@
+import json
+from io import StringIO
+
+from model_invocation.families import family_of
+
+# Final stream chunk carrying the token counts of a streaming invocation
+INVOCATION_METRICS_KEY = "amazon-bedrock-invocationMetrics"
+## Event ending a stream cut short by its deadline, when the partial result is returned (see resilience.deadline)
+DEADLINE_EVENT_KEY = "deadlineExceeded"
+FINISH_REASON_DEADLINE = "deadline"
+
+
+class StreamChunk:
+    """
+    One typed chunk of a streaming invocation, whatever the provider:
+
+        1. text: generated text delta ("" when the chunk only carries metadata)
+        2. finish_reason: set on the chunk which ends the generation
+        3. input_tokens / output_tokens: token counts, when reported by the chunk
+        4. data: the provider's raw chunk
+    """
+
+    __slots__ = ("text", "finish_reason", "input_tokens", "output_tokens", "data")
+
+    def __init__(self, text, finish_reason=None, input_tokens=None, output_tokens=None, data=None) -> None:
+        self.text = text
+        self.finish_reason = finish_reason
+        self.input_tokens = input_tokens
+        self.output_tokens = output_tokens
+        self.data = data
+
+    def __repr__(self):
+        return f"StreamChunk(text={self.text!r}, finish_reason={self.finish_reason!r})"
+
+
+def _titan_chunk(data):
+    return StreamChunk(
+        data.get("outputText") or "",
+        data.get("completionReason"),
+        data.get("inputTextTokenCount"),
+        data.get("totalOutputTextTokenCount"),
+    )
+
+
+def _claude_chunk(data):
+    return StreamChunk(data.get("completion") or "", data.get("stop_reason"))
+
+
+def _llama2_chunk(data):
+    return StreamChunk(
+        data.get("generation") or "",
+        data.get("stop_reason"),
+        data.get("prompt_token_count"),
+        data.get("generation_token_count"),
+    )
+
+
+def _cohere_chunk(data):
+    finish_reason = data.get("finish_reason") if data.get("is_finished") else None
+    return StreamChunk(data.get("text") or "", finish_reason)
+
+
+CHUNK_PARSERS = {
+    "titan-text": _titan_chunk,
+    "claude": _claude_chunk,
+    "llama2": _llama2_chunk,
+    "cohere-command": _cohere_chunk,
+}
+
+
+def parse_chunk(model_id, data):
+    """
+    Convert the decoded JSON of a provider's stream chunk to a StreamChunk
+    """
+    chunk = CHUNK_PARSERS.get(family_of(model_id)["name"], _claude_chunk)(data)
+    metrics = data.get(INVOCATION_METRICS_KEY)
+    if metrics:
+        chunk.input_tokens = metrics.get("inputTokenCount", chunk.input_tokens)
+        chunk.output_tokens = metrics.get("outputTokenCount", chunk.output_tokens)
+    chunk.data = data
+    return chunk
+
+
+def iter_chunks(model_id, response_stream):
+    """
+    Yield a StreamChunk for every event of the `body` returned by invoke_model_with_response_stream
+    """
+    parser = CHUNK_PARSERS.get(family_of(model_id)["name"], _claude_chunk)
+    metrics_marker = INVOCATION_METRICS_KEY.encode()
+    for event in response_stream:
+        payload = event.get("chunk")
+        if payload is None:
+            if DEADLINE_EVENT_KEY in event:
+                yield StreamChunk("", FINISH_REASON_DEADLINE)
+            continue
+        raw = payload["bytes"]
+        data = json.loads(raw)
+        if metrics_marker in raw:
+            yield parse_chunk(model_id, data)
+        else:
+            chunk = parser(data)
+            chunk.data = data
+            yield chunk
+
+
+class StreamAccumulator:
+    """
+    --> Accumulates the chunks of a stream:
+
+    The generated text is written to a single buffer rather than concatenated chunk by chunk, and the finish
+    reason and token counts are kept from the chunks which carry them. Callbacks subscribed with subscribe()
+    are called with every StreamChunk as it arrives.
+    """
+
+    def __init__(self, callbacks=()) -> None:
+        self.buffer = StringIO()
+        self.callbacks = list(callbacks)
+        self.chunks = 0
+        self.finish_reason = None
+        self.input_tokens = None
+        self.output_tokens = None
+
+    def subscribe(self, callback):
+        self.callbacks.append(callback)
+        return callback
+
+    def add(self, chunk):
+        self.chunks += 1
+        if chunk.text:
+            self.buffer.write(chunk.text)
+        if chunk.finish_reason is not None:
+            self.finish_reason = chunk.finish_reason
+        if chunk.input_tokens is not None:
+            self.input_tokens = chunk.input_tokens
+        if chunk.output_tokens is not None:
+            self.output_tokens = chunk.output_tokens
+        for callback in self.callbacks:
+            callback(chunk)
+
+    def consume(self, chunks):
+        """
+        Add every chunk of an iterable of StreamChunks, return the accumulator
+        """
+        for chunk in chunks:
+            self.add(chunk)
+        return self
+
+    @property
+    def text(self):
+        return self.buffer.getvalue()
+
+
+def stream_text(model_id, response_stream, accumulator=None):
+    """
+    Yield the chunks of a response stream while accumulating them, for consumers processing tokens as they arrive
+    """
+    accumulator = accumulator if accumulator is not None else StreamAccumulator()
+    for chunk in iter_chunks(model_id, response_stream):
+        accumulator.add(chunk)
+        yield chunk
+
+
+def print_chunk(chunk):
+    """
+    Callback writing the text delta of a chunk to the console as it arrives
+    """
+    if chunk.text:
+        print(chunk.text, end="", flush=True)
@@ -1,5 +1,7 @@
 import json
 import logging
+from model_invocation.parameters import Field, Parameters
+from profiling.profiler import stage
 
 ## Instantiate Logger
 logger = logging.getLogger(__name__)
@@ -19,6 +21,46 @@ COUNT_PENALTY = 0
 FREQUENCY_PENALTY = 0
 DEFAULT_PROMPT = "Why do we dream?"
 
+
+class Jurassic2Parameters(Parameters):
+    """
+    Parameters of AI21 Jurassic2, validated against the ranges documented in AI21Jurassic2TextGenerator
+    """
+
+    MODEL = "AI21 Jurassic2"
+    FIELDS = dict(
+        model_id=Field(str, MODEL_ID_J2),
+        temperature=Field(float, float(TEMPERATURE), 0.0, 1.5),
+        top_p=Field(float, float(TOP_P), 0.0, 1.0),
+        max_tokens=Field(int, int(MAX_TOKENS), 1, 8191),
+        stop_sequences=Field(tuple, tuple(STOP_SEQUENCES)),
+        presence_penalty=Field(float, float(PRESENCE_PENALTY), 0.0, 5.0),
+        count_penalty=Field(float, float(COUNT_PENALTY), 0.0, 1.0),
+        frequency_penalty=Field(float, float(FREQUENCY_PENALTY), 0.0, 500.0),
+        prompt=Field(str, DEFAULT_PROMPT),
+    )
+    __slots__ = tuple(FIELDS)
+
+
+def build_request(params):
+    """
+    Request body for AI21 Jurassic2, built from the parameters only (missing ones take their default)
+    """
+    params = Jurassic2Parameters.of(params)
+    return json.dumps(
+        dict(
+            prompt=params.prompt,
+            maxTokens=params.max_tokens,
+            temperature=params.temperature,
+            topP=params.top_p,
+            stopSequences=list(params.stop_sequences),
+            countPenalty=dict(scale=params.count_penalty),
+            presencePenalty=dict(scale=params.presence_penalty),
+            frequencyPenalty=dict(scale=params.frequency_penalty),
+        )
+    )
+
+
 class AI21Jurassic2TextGenerator:
     """
     --> AI21 text models:
@@ -116,73 +158,87 @@ class AI21Jurassic2TextGenerator:
 
     """
 
-    def __init__(self, bedrock_client) -> None:
+    def __init__(self, bedrock_client, semantic_cache=None, retriever=None) -> None:
         self.bedrock_client = bedrock_client
+        self.semantic_cache = semantic_cache
+        self.retriever = retriever
 
     def prepare_input(self):
-        self.model_id = (
+        """
+        Collect the parameters of a generation from the user
+        """
+        values = {}
+        values["model_id"] = (
             input(f"Please input modelId [{MODEL_ID_J2}]: ").strip() or MODEL_ID_J2
         )
 
-        self.temperature = float(
+        values["temperature"] = float(
             input(f"Please input temperature [{TEMPERATURE}]: ").strip() or TEMPERATURE
         )
-        self.top_p = float(input(f"Please input topP [{TOP_P}]: ").strip() or TOP_P)
-        self.maxTokens = int(
+        values["top_p"] = float(input(f"Please input topP [{TOP_P}]: ").strip() or TOP_P)
+        values["max_tokens"] = int(
             input(f"Please input maxTokens [{MAX_TOKENS}]: ").strip() or MAX_TOKENS
         )
-        self.stop_sequences = (
-            input(f"Please comma seperated input stopSequences [{STOP_SEQUENCES}]: ").strip()
-            or STOP_SEQUENCES
-        )
-        if type(self.stop_sequences) == str:
-            self.stop_sequences = self.stop_sequences.split(",")
+        stop_sequences = input(f"Please comma seperated input stopSequences [{STOP_SEQUENCES}]: ").strip()
+        if stop_sequences:
+            values["stop_sequences"] = stop_sequences.split(",")
 
-        self.presence_penalty = float(
+        values["presence_penalty"] = float(
             input(f"Please input presence_penalty [{PRESENCE_PENALTY}]: ").strip() or PRESENCE_PENALTY
         )
-        self.count_penalty = float(
+        values["count_penalty"] = float(
             input(f"Please input count_penalty [{COUNT_PENALTY}]: ").strip() or COUNT_PENALTY
         )
-        self.frequency_penalty = float(
+        values["frequency_penalty"] = float(
             input(f"Please input frequency_penalty [{FREQUENCY_PENALTY}]: ").strip() or FREQUENCY_PENALTY
         )
 
-        self.prompt = (
+        values["prompt"] = (
             input(f"Please input Question [{DEFAULT_PROMPT}]: ").strip()
             or DEFAULT_PROMPT
         )
+        return Jurassic2Parameters(**values)
 
-    def process(self):
+    def generate(self, params):
         """
-        Invoke AI21 Text Model
+        Invoke AI21 Text Model, return the response
         """
-        ## Collect user Inputs
-        self.prepare_input()
+        params = Jurassic2Parameters.of(params)
+        ## Cached under the question of the user, whatever the passages the retriever adds to it
+        question = params.prompt
+
+        ## Ground the question in the passages retrieved from the corpus
+        if self.retriever is not None:
+            params = params.replace(prompt=self.retriever.augment(params.model_id, params.prompt))
 
         ### Prepare Input for the FM invocation
-        input = json.dumps(
-            dict(
-                prompt=self.prompt,
-                maxTokens=self.maxTokens,
-                temperature=self.temperature,
-                topP=self.top_p,
-                stopSequences=self.stop_sequences,
-                countPenalty=dict(scale=self.count_penalty),
-                presencePenalty=dict(scale=self.presence_penalty),
-                frequencyPenalty=dict(scale=self.frequency_penalty),
+        with stage("build"):
+            body = build_request(params)
+
+        def generate():
+            output = self.bedrock_client.invoke_model(
+                body=body,
+                modelId=params.model_id,
+                accept="application/json",
+                contentType="application/json",
             )
-        )
 
-        output = self.bedrock_client.invoke_model(
-            body=input,
-            modelId=self.model_id,
-            accept="application/json",
-            contentType="application/json",
-        )
+            ### Read Response
+            raw = output["body"].read()
+            with stage("parse"):
+                return json.loads(raw)
+
+        if self.semantic_cache is None:
+            return generate()
+        return self.semantic_cache.get_or_generate(self.semantic_cache.namespace_of(params), question, generate)
+
+    def process(self):
+        """
+        Invoke AI21 Text Model with parameters collected from the user
+        """
+        ## Collect user Inputs
+        params = self.prepare_input()
 
-        ### Read Response
-        response = json.loads(output["body"].read())
-        
+        response = self.generate(params)
         for result in response["completions"]:
             logger.info(f"Output text: {result["data"]["text"]}")
@@ -1,7 +1,9 @@
 import json
 import logging
-import time
 from utils.exception_handler import BedrockException
+from model_invocation.streaming import StreamAccumulator, iter_chunks, print_chunk
+from model_invocation.parameters import Field, Parameters
+from profiling.profiler import stage
 
 ## Instantiate Logger
 logger = logging.getLogger(__name__)
@@ -17,6 +19,42 @@ MAX_TOKEN_COUNT = "512"
 STOP_SEQUENCES = []
 DEFAULT_PROMPT = "Why do we dream?"
 
+
+class TitanTextParameters(Parameters):
+    """
+    Parameters of Amazon Titan Text, validated against the ranges documented in AmazonTitanTextGenerator
+    """
+
+    MODEL = "Amazon Titan Text"
+    FIELDS = dict(
+        model_id=Field(str, MODEL_ID_TITAN),
+        temperature=Field(float, float(TEMPERATURE), 0.0, 1.5),
+        top_p=Field(float, float(TOP_P), 0.0, 1.0),
+        max_token_count=Field(int, int(MAX_TOKEN_COUNT), 1, 8192),
+        stop_sequences=Field(tuple, tuple(STOP_SEQUENCES)),
+        prompt=Field(str, DEFAULT_PROMPT),
+    )
+    __slots__ = tuple(FIELDS)
+
+
+def build_request(params):
+    """
+    Request body for Amazon Titan Text, built from the parameters only (missing ones take their default)
+    """
+    params = TitanTextParameters.of(params)
+    return json.dumps(
+        dict(
+            inputText=params.prompt,
+            textGenerationConfig=dict(
+                maxTokenCount=params.max_token_count,
+                stopSequences=list(params.stop_sequences),
+                temperature=params.temperature,
+                topP=params.top_p,
+            ),
+        )
+    )
+
+
 class AmazonTitanTextGenerator:
     """
     --> Amazon text models:
@@ -101,75 +139,104 @@ class AmazonTitanTextGenerator:
         }
 
     """
-    def __init__(self, bedrock_client) -> None:
+    def __init__(self, bedrock_client, semantic_cache=None, retriever=None) -> None:
         self.bedrock_client = bedrock_client
+        self.semantic_cache = semantic_cache
+        self.retriever = retriever
 
     def prepare_input(self):
-        self.model_id = input(f"Please input modelId [{MODEL_ID_TITAN}]: ").strip() or MODEL_ID_TITAN
+        """
+        Collect the parameters of a generation from the user
+        """
+        values = {}
+        values["model_id"] = input(f"Please input modelId [{MODEL_ID_TITAN}]: ").strip() or MODEL_ID_TITAN
 
-        self.temperature = float(input(f"Please input temperature [{TEMPERATURE}]: ").strip() or TEMPERATURE)
-        self.top_p = float(input(f"Please input topP [{TOP_P}]: ").strip() or TOP_P)
-        self.max_token_input = int(input(f"Please input maxTokenCount [{MAX_TOKEN_COUNT}]: ").strip() or MAX_TOKEN_COUNT)
-        self.stop_sequences = (input(f"Please comma seperated input stopSequences [{STOP_SEQUENCES}]: ").strip() or STOP_SEQUENCES)
-        if type(self.stop_sequences) == str:
-            self.stop_sequences = self.stop_sequences.split(",")
-        
-        self.prompt = input(f"Please input Question [{DEFAULT_PROMPT}]: ").strip() or DEFAULT_PROMPT
+        values["temperature"] = float(input(f"Please input temperature [{TEMPERATURE}]: ").strip() or TEMPERATURE)
+        values["top_p"] = float(input(f"Please input topP [{TOP_P}]: ").strip() or TOP_P)
+        values["max_token_count"] = int(input(f"Please input maxTokenCount [{MAX_TOKEN_COUNT}]: ").strip() or MAX_TOKEN_COUNT)
+        stop_sequences = input(f"Please comma seperated input stopSequences [{STOP_SEQUENCES}]: ").strip()
+        if stop_sequences:
+            values["stop_sequences"] = stop_sequences.split(",")
 
-    def process(self, streaming = False):
+        values["prompt"] = input(f"Please input Question [{DEFAULT_PROMPT}]: ").strip() or DEFAULT_PROMPT
+        return TitanTextParameters(**values)
+
+    def _prepare(self, params):
+        params = TitanTextParameters.of(params)
+
+        ## Ground the question in the passages retrieved from the corpus
+        if self.retriever is not None:
+            params = params.replace(prompt=self.retriever.augment(params.model_id, params.prompt))
+        return params
+
+    def generate(self, params):
         """
-        Invoke Amazon Titan Text Model
+        Invoke Amazon Titan Text Model, return the response
         """
-        ## Collect user Inputs
-        self.prepare_input()
-
-        ### Prepare Input for the FM invocation
-        input = json.dumps(
-            dict(
-                inputText=self.prompt,
-                textGenerationConfig=dict(
-                    maxTokenCount=self.max_token_input,
-                    stopSequences=self.stop_sequences,
-                    temperature=self.temperature,
-                    topP=self.top_p,
-                ),
-            )
-        )
-
-        if not streaming:
+        params = TitanTextParameters.of(params)
+        ## Cached under the question of the user, whatever the passages the retriever adds to it
+        question = params.prompt
+        params = self._prepare(params)
+        with stage("build"):
+            body = build_request(params)
+
+        def generate():
             ### Invoke Foundation Model
             output = self.bedrock_client.invoke_model(
-                body=input,
-                modelId=self.model_id,
+                body=body,
+                modelId=params.model_id,
                 accept="application/json",
                 contentType="application/json",
             )
 
             ### Read Response
-            response = json.loads(output["body"].read())
+            raw = output["body"].read()
+            with stage("parse"):
+                response = json.loads(raw)
 
             error = response.get("error")
             if error is not None:
                 raise BedrockException(f"Text Generation Error: {error}")
-            
+            return response
+
+        if self.semantic_cache is None:
+            return generate()
+        return self.semantic_cache.get_or_generate(self.semantic_cache.namespace_of(params), question, generate)
+
+    def stream(self, params, callbacks=()):
+        """
+        Invoke Amazon Titan Text Model with a response stream, return the StreamAccumulator once consumed
+        """
+        params = self._prepare(params)
+        with stage("build"):
+            body = build_request(params)
+        output = self.bedrock_client.invoke_model_with_response_stream(
+            body=body,
+            modelId=params.model_id,
+            accept="application/json",
+            contentType="application/json",
+        )
+
+        ## Process Stream
+        accumulator = StreamAccumulator(callbacks=callbacks)
+        return accumulator.consume(iter_chunks(params.model_id, output.get("body")))
+
+    def process(self, streaming = False):
+        """
+        Invoke Amazon Titan Text Model with parameters collected from the user
+        """
+        ## Collect user Inputs
+        params = self.prepare_input()
+
+        if not streaming:
+            response = self.generate(params)
+
             logger.info(f"Input text Token Count: {response["inputTextTokenCount"]}")
             for result in response["results"]:
                 logger.info(f"Token Count: {result["tokenCount"]}")
                 logger.info(f"Output text: {result["outputText"]}")
                 logger.info(f"Completion Reason: {result["completionReason"]}")
         else:
-            output = self.bedrock_client.invoke_model_with_response_stream(
-                body=input,
-                modelId=self.model_id,
-                accept = "application/json",
-                contentType="application/json"
-            )
-
-            response_stream = output.get("body")
-            
-            ## Process Stream
-            for event in response_stream:
-                chunk = event.get("chunk")
-                data = json.loads(chunk.get("bytes").decode())
-                logger.info(data["outputText"])
-                time.sleep(2)
+            accumulator = self.stream(params, callbacks=[print_chunk])
+            print("")
+            logger.info(f"Completion Reason: {accumulator.finish_reason}")
@@ -1,5 +1,8 @@
 import json
 import logging
+from model_invocation.streaming import StreamAccumulator, iter_chunks, print_chunk
+from model_invocation.parameters import Field, Parameters
+from profiling.profiler import stage
 
 ## Instantiate Logger
 logger = logging.getLogger(__name__)
@@ -16,10 +19,49 @@ MAX_TOKENS_TO_SAMPLE = "200"
 STOP_SEQUENCES = []
 DEFAULT_PROMPT = "Why do we dream?"
 
+
+class ClaudeParameters(Parameters):
+    """
+    Parameters of Anthropic Claude, validated against the ranges documented in AnthropicClaudeTextGenerator
+    """
+
+    MODEL = "Anthropic Claude"
+    FIELDS = dict(
+        model_id=Field(str, MODEL_ID_CLAUDE),
+        temperature=Field(float, float(TEMPERATURE), 0.0, 1.0),
+        top_p=Field(float, float(TOP_P), 0.0, 1.0),
+        top_k=Field(int, int(TOP_K), 0, 500),
+        max_tokens_to_sample=Field(int, int(MAX_TOKENS_TO_SAMPLE), 1, 4096),
+        stop_sequences=Field(tuple, tuple(STOP_SEQUENCES)),
+        prompt=Field(str, DEFAULT_PROMPT),
+    )
+    __slots__ = tuple(FIELDS)
+
+
+def build_request(params):
+    """
+    Request body for Anthropic Claude, built from the parameters only (missing ones take their default)
+    """
+    params = ClaudeParameters.of(params)
+    return json.dumps(
+        dict(
+            prompt=f"Human: {params.prompt} \\nAssistant:",
+            temperature=params.temperature,
+            top_p=params.top_p,
+            top_k=params.top_k,
+            max_tokens_to_sample=params.max_tokens_to_sample,
+            stop_sequences=list(params.stop_sequences),
+            anthropic_version="bedrock-2023-05-31",
+        )
+    )
+
+
 class AnthropicClaudeTextGenerator:
 
-    def __init__(self, bedrock_client) -> None:
+    def __init__(self, bedrock_client, semantic_cache=None, retriever=None) -> None:
         self.bedrock_client = bedrock_client
+        self.semantic_cache = semantic_cache
+        self.retriever = retriever
     """
     --> Anthoripc text models:
 
@@ -83,75 +125,97 @@ class AnthropicClaudeTextGenerator:
     """
 
     def prepare_input(self):
-        self.model_id = (
+        """
+        Collect the parameters of a generation from the user
+        """
+        values = {}
+        values["model_id"] = (
             input(f"Please input modelId [{MODEL_ID_CLAUDE}]: ").strip()
             or MODEL_ID_CLAUDE
         )
 
-        self.temperature = float(
+        values["temperature"] = float(
             input(f"Please input temperature [{TEMPERATURE}]: ").strip() or TEMPERATURE
         )
-        self.top_p = float(input(f"Please input top_p [{TOP_P}]: ").strip() or TOP_P)
-        self.top_k = int(input(f"Please input top_k [{TOP_K}]: ").strip() or TOP_K)
-        self.max_tokens_to_sample = int(
+        values["top_p"] = float(input(f"Please input top_p [{TOP_P}]: ").strip() or TOP_P)
+        values["top_k"] = int(input(f"Please input top_k [{TOP_K}]: ").strip() or TOP_K)
+        values["max_tokens_to_sample"] = int(
             input(f"Please input max_tokens_to_sample [{MAX_TOKENS_TO_SAMPLE}]: ").strip() or MAX_TOKENS_TO_SAMPLE
         )
-        self.stop_sequences = (
-            input(f"Please comma seperated input stop_sequences [{STOP_SEQUENCES}]: ").strip()
-            or STOP_SEQUENCES
-        )
-        if type(self.stop_sequences) == str:
-            self.stop_sequences = self.stop_sequences.split(",")
+        stop_sequences = input(f"Please comma seperated input stop_sequences [{STOP_SEQUENCES}]: ").strip()
+        if stop_sequences:
+            values["stop_sequences"] = stop_sequences.split(",")
 
-        self.prompt = (
+        values["prompt"] = (
             input(f"Please input Question [{DEFAULT_PROMPT}]: ").strip()
             or DEFAULT_PROMPT
         )
+        return ClaudeParameters(**values)
 
-    def process(self, streaming=False):
-        """
-        Invoke Anthropic Claude Model
-        """
+    def _prepare(self, params):
+        params = ClaudeParameters.of(params)
 
-        self.prepare_input()
-
-        ## Prepare Input for the FM invocation
-        input = json.dumps(
-            dict(
-                prompt=f"Human: {self.prompt} \\nAssistant:",
-                temperature=self.temperature,
-                top_p=self.top_p,
-                top_k=self.top_k,
-                max_tokens_to_sample=self.max_tokens_to_sample,
-                stop_sequences=self.stop_sequences,
-                anthropic_version="bedrock-2023-05-31",
-            )
-        )
+        ## Ground the question in the passages retrieved from the corpus
+        if self.retriever is not None:
+            params = params.replace(prompt=self.retriever.augment(params.model_id, params.prompt))
+        return params
 
-        ## Invoke Foundation Model
-        if not streaming:
+    def generate(self, params):
+        """
+        Invoke Anthropic Claude Model, return the response
+        """
+        params = ClaudeParameters.of(params)
+        ## Cached under the question of the user, whatever the passages the retriever adds to it
+        question = params.prompt
+        params = self._prepare(params)
+        with stage("build"):
+            body = build_request(params)
+
+        def generate():
             output = self.bedrock_client.invoke_model(
-                body=input,
-                modelId=self.model_id,
+                body=body,
+                modelId=params.model_id,
                 accept="application/json",
                 contentType="application/json",
             )
 
             ## Read Response
-            response = json.loads(output.get("body").read())
+            raw = output.get("body").read()
+            with stage("parse"):
+                return json.loads(raw)
+
+        if self.semantic_cache is None:
+            return generate()
+        return self.semantic_cache.get_or_generate(self.semantic_cache.namespace_of(params), question, generate)
+
+    def stream(self, params, callbacks=()):
+        """
+        Invoke Anthropic Claude Model with a response stream, return the StreamAccumulator once consumed
+        """
+        params = self._prepare(params)
+        with stage("build"):
+            body = build_request(params)
+        output = self.bedrock_client.invoke_model_with_response_stream(
+            body=body,
+            modelId=params.model_id,
+            accept="application/json",
+            contentType="application/json",
+        )
 
+        ## Process Stream
+        accumulator = StreamAccumulator(callbacks=callbacks)
+        return accumulator.consume(iter_chunks(params.model_id, output.get("body")))
+
+    def process(self, streaming=False):
+        """
+        Invoke Anthropic Claude Model with parameters collected from the user
+        """
+        params = self.prepare_input()
+
+        if not streaming:
+            response = self.generate(params)
             logger.info(f"Completion: {response.get("completion")}")
         else:
-            output = self.bedrock_client.invoke_model_with_response_stream(body=input,
-                modelId=self.model_id,
-                accept="application/json",
-                contentType="application/json",)
-            
-            ## Read Response
-            response_stream = output.get("body")
-
-            ## Process Stream
-            for event in response_stream:
-                chunk = event.get("chunk")
-                data = json.loads(chunk.get("bytes").decode())
-                logger.info(f"Completion: {data["cmpletion"]}")
+            accumulator = self.stream(params, callbacks=[print_chunk])
+            print("")
+            logger.info(f"Stop Reason: {accumulator.finish_reason}")
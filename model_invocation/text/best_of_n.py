@@ -0,0 +1,139 @@
+import json
+import logging
+
+from model_invocation.best_of_n_engine import BestOfN, LikelihoodScorer, RegexScorer
+from model_invocation.families import family_of, set_max_tokens, set_sampling
+from model_invocation.parameters import Field, Parameters
+from profiling.profiler import stage
+from utils.exception_handler import ValidationException
+
+## Instantiate Logger
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+# Refer Latest documentation for Model Ids based on your use case
+MODEL_ID = "anthropic.claude-v2"
+
+# Best-of-N Default Values
+CANDIDATES = "3"
+MAX_TOKENS = "400"
+## Not greedy, so that the candidates differ (Amazon Titan Text defaults to temperature 0)
+TEMPERATURE = "0.7"
+TOP_P = "0.9"
+## Any non blank answer is accepted: the first candidate to finish wins
+ACCEPT_PATTERN = r"\S"
+DEFAULT_PROMPT = "Why do we dream?"
+
+
+class BestOfNParameters(Parameters):
+    """
+    Parameters of a Best-of-N generation (a blank pattern ranks the candidates by likelihood, Cohere Command only)
+    """
+
+    MODEL = "Best-of-N"
+    FIELDS = dict(
+        model_id=Field(str, MODEL_ID),
+        candidates=Field(int, int(CANDIDATES), 1, 16),
+        max_tokens=Field(int, int(MAX_TOKENS), 1, 4096),
+        temperature=Field(float, float(TEMPERATURE), 0.0, 1.0),
+        top_p=Field(float, float(TOP_P), 0.0, 1.0),
+        pattern=Field(str, ACCEPT_PATTERN),
+        prompt=Field(str, DEFAULT_PROMPT),
+    )
+    __slots__ = tuple(FIELDS)
+
+    def check(self):
+        ## Only Cohere Command returns the likelihoods which rank the candidates
+        if not self.pattern and family_of(self.model_id)["name"] != "cohere-command":
+            raise ValidationException(
+                f"Invalid pattern for {self.MODEL}: ranking by likelihood (blank pattern) needs Cohere Command, "
+                f"not {self.model_id}"
+            )
+
+
+def build_request(params):
+    """
+    Request body shared by the N candidates, built from the parameters only (missing ones take their default)
+    """
+    params = BestOfNParameters.of(params)
+    family = family_of(params.model_id)
+    prompt = params.prompt
+    if family["name"] == "claude":
+        prompt = f"\n\nHuman: {prompt}\n\nAssistant:"
+    body = {family["prompt_key"]: prompt}
+    set_max_tokens(params.model_id, body, params.max_tokens)
+    set_sampling(params.model_id, body, params.temperature, params.top_p)
+    return json.dumps(body)
+
+
+class BestOfNTextGenerator:
+    """
+    --> Best-of-N text generation, for any text model:
+
+    N candidates are generated concurrently (Cohere Command generates them in a single request) and scored:
+
+        1. With an acceptance pattern: candidates matching the regular expression are accepted, and the
+        remaining streams are cancelled as soon as the first one is.
+        2. Without a pattern (Cohere Command only): the candidate with the highest likelihood is returned.
+
+    The request body carries the prompt, the maximum number of generated tokens and the sampling
+    parameters (temperature, top_p), not greedy by default so that the candidates differ; the other
+    inference parameters keep the default of the model.
+    """
+
+    def __init__(self, bedrock_client) -> None:
+        self.bedrock_client = bedrock_client
+
+    def prepare_input(self):
+        """
+        Collect the parameters of a generation from the user
+        """
+        values = {}
+        values["model_id"] = input(f"Please input modelId [{MODEL_ID}]: ").strip() or MODEL_ID
+        values["candidates"] = int(input(f"Please input number of candidates [{CANDIDATES}]: ").strip() or CANDIDATES)
+        values["max_tokens"] = int(input(f"Please input max tokens [{MAX_TOKENS}]: ").strip() or MAX_TOKENS)
+        values["temperature"] = float(input(f"Please input temperature [{TEMPERATURE}]: ").strip() or TEMPERATURE)
+        values["top_p"] = float(input(f"Please input top_p [{TOP_P}]: ").strip() or TOP_P)
+        values["pattern"] = input(
+            f"Please input acceptance pattern, blank to rank by likelihood (Cohere) [{ACCEPT_PATTERN}]: "
+        ).strip()
+        if not values["pattern"] and family_of(values["model_id"])["name"] != "cohere-command":
+            values["pattern"] = ACCEPT_PATTERN
+
+        values["prompt"] = input(f"Please input Question [{DEFAULT_PROMPT}]: ").strip() or DEFAULT_PROMPT
+        return BestOfNParameters(**values)
+
+    def generate(self, params):
+        """
+        Generate N candidates, return the selected one and all the candidates
+
+        A blank pattern ranks the candidates by likelihood (Cohere Command only).
+        """
+        params = BestOfNParameters.of(params)
+        with stage("build"):
+            body = build_request(params)
+
+        if params.pattern:
+            best_of_n = BestOfN(self.bedrock_client, RegexScorer(params.pattern), params.candidates, threshold=1.0)
+        else:
+            best_of_n = BestOfN(self.bedrock_client, LikelihoodScorer(), params.candidates)
+
+        try:
+            return best_of_n.generate(params.model_id, body)
+        finally:
+            best_of_n.close()
+
+    def process(self):
+        """
+        Generate N candidates and print the selected one
+        """
+        ## Collect user Inputs
+        params = self.prepare_input()
+
+        best, candidates = self.generate(params)
+
+        for candidate in candidates:
+            status = "cancelled" if candidate.cancelled else f"score {candidate.score}"
+            logger.info(f"Candidate {candidate.index}: {status}, latency {candidate.latency or 0:.2f}s")
+        logger.info(f"Selected Candidate {best.index}:\n{best.text}")
+        logger.info(f"Finish Reason: {best.finish_reason}")
@@ -0,0 +1,106 @@
+import logging
+
+from model_invocation.conversation import HISTORY_TOKENS, ConversationSession
+from model_invocation.streaming import print_chunk
+from model_invocation.parameters import Field, Parameters
+
+## Instantiate Logger
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+# Refer Latest documentation for Model Ids based on your use case
+MODEL_ID = "anthropic.claude-v2"
+
+# Chat Default Values
+SYSTEM_PROMPT = ""
+SUMMARIZE = "no"
+
+
+class ChatParameters(Parameters):
+    """
+    Parameters of a chat session
+    """
+
+    MODEL = "Chat"
+    FIELDS = dict(
+        model_id=Field(str, MODEL_ID),
+        system=Field(str, SYSTEM_PROMPT),
+        history_tokens=Field(int, HISTORY_TOKENS, 1, 100000),
+        summarize=Field(bool, SUMMARIZE == "yes"),
+    )
+    __slots__ = tuple(FIELDS)
+
+
+class ChatTextGenerator:
+    """
+    --> Multi-turn chat with any text model (Claude, Llama2, Titan, Cohere Command, Jurassic2):
+
+    Questions are asked one after the other in a ConversationSession, which keeps the history in the prompt
+    format of the model within a token budget. The answers are streamed for the models which support it.
+    An empty question ends the chat.
+    """
+
+    def __init__(self, bedrock_client) -> None:
+        self.bedrock_client = bedrock_client
+
+    def prepare_input(self):
+        """
+        Collect the parameters of a chat from the user
+        """
+        values = {}
+        values["model_id"] = input(f"Please input modelId [{MODEL_ID}]: ").strip() or MODEL_ID
+        values["system"] = input(f"Please input system prompt [{SYSTEM_PROMPT}]: ").strip() or SYSTEM_PROMPT
+        values["history_tokens"] = int(
+            input(f"Please input history token budget [{HISTORY_TOKENS}]: ").strip() or HISTORY_TOKENS
+        )
+        values["summarize"] = (
+            input(f"Summarize old turns instead of dropping them (yes/no) [{SUMMARIZE}]: ").strip().lower()
+            or SUMMARIZE
+        ) == "yes"
+        return ChatParameters(**values)
+
+    def session(self, params):
+        """
+        New ConversationSession for the parameters: the conversation state lives in the session, one per
+        chat, so one generator can start any number of concurrent chats
+        """
+        params = ChatParameters.of(params)
+        return ConversationSession(
+            self.bedrock_client,
+            params.model_id,
+            system=params.system or None,
+            history_tokens=params.history_tokens,
+            summarize=params.summarize,
+        )
+
+    def generate(self, params, questions):
+        """
+        Ask the questions one after the other in a new session, return the answers
+        """
+        session = self.session(params)
+        try:
+            return [session.ask(question) for question in questions]
+        finally:
+            session.close()
+
+    def process(self):
+        """
+        Chat until an empty question
+        """
+        ## Collect user Inputs
+        session = self.session(self.prepare_input())
+
+        streaming = session.family != "jurassic2"
+        try:
+            while True:
+                question = input("You: ").strip()
+                if not question:
+                    break
+                if streaming:
+                    session.ask(question, streaming=True, callbacks=[print_chunk])
+                    print("")
+                else:
+                    logger.info(session.ask(question))
+        finally:
+            session.close()
+        logger.info(f"Chat ended: {len(session)} turns in history, {session.dropped} dropped or summarized")
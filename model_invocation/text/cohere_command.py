@@ -1,6 +1,9 @@
 import json
 import logging
 from utils.exception_handler import BedrockException
+from model_invocation.streaming import StreamAccumulator, iter_chunks, print_chunk
+from model_invocation.parameters import Field, Parameters
+from profiling.profiler import stage
 
 ## Instantiate Logger
 logger = logging.getLogger(__name__)
@@ -16,8 +19,50 @@ TOP_K = "0"
 MAX_TOKENS = "400"
 STOP_SEQUENCES = []
 RETURN_LIKELIHOODS = "NONE"
+NUM_GENERATIONS = "2"
 DEFAULT_PROMPT = "Why do we dream?"
 
+
+class CommandParameters(Parameters):
+    """
+    Parameters of Cohere Command, validated against the ranges documented in the module
+    """
+
+    MODEL = "Cohere Command"
+    FIELDS = dict(
+        model_id=Field(str, MODEL_ID_COMMAND),
+        temperature=Field(float, float(TEMPERATURE), 0.0, 5.0),
+        top_p=Field(float, float(TOP_P), 0.0, 1.0),
+        top_k=Field(int, int(TOP_K), 0, 500),
+        max_tokens=Field(int, int(MAX_TOKENS), 0, 4000),
+        stop_sequences=Field(tuple, tuple(STOP_SEQUENCES)),
+        return_likelihoods=Field(str, RETURN_LIKELIHOODS, choices=("GENERATION", "ALL", "NONE")),
+        num_generations=Field(int, int(NUM_GENERATIONS), 1, 5),
+        prompt=Field(str, DEFAULT_PROMPT),
+    )
+    __slots__ = tuple(FIELDS)
+
+
+def build_request(params, streaming=False):
+    """
+    Request body for Cohere Command, built from the parameters only (missing ones take their default)
+    """
+    params = CommandParameters.of(params)
+    return json.dumps(
+        dict(
+            prompt=params.prompt,
+            temperature=params.temperature,
+            p=params.top_p,
+            k=params.top_k,
+            max_tokens=params.max_tokens,
+            stop_sequences=list(params.stop_sequences),
+            return_likelihoods=params.return_likelihoods,
+            num_generations=params.num_generations,
+            stream=streaming,
+        )
+    )
+
+
 class CohereCommandTextGenerator:
     """
     --> Cohere text models:
@@ -54,6 +99,11 @@ class CohereCommandTextGenerator:
             GENERATION: Only return likelihoods for generated tokens.
             ALL: Return likelihoods for all tokens.
             NONE: (Default) Don't return any likelihoods.
+
+    C. Candidates
+
+        1. num_generations:
+        The number of generations the model returns for the prompt. (defaults to 2, range: 1-5)
         
     --> Request Structure: Json with following propertis
 
@@ -111,77 +161,101 @@ class CohereCommandTextGenerator:
         }
 
     """
-    def __init__(self, bedrock_client) -> None:
+    def __init__(self, bedrock_client, semantic_cache=None, retriever=None) -> None:
         self.bedrock_client = bedrock_client
+        self.semantic_cache = semantic_cache
+        self.retriever = retriever
 
     def prepare_input(self):
-        self.model_id = input(f"Please input modelId [{MODEL_ID_COMMAND}]: ").strip() or MODEL_ID_COMMAND
-
-        self.temperature = float(input(f"Please input temperature [{TEMPERATURE}]: ").strip() or TEMPERATURE)
-        self.top_p = float(input(f"Please input p [{TOP_P}]: ").strip() or TOP_P)
-        self.top_k = int(input(f"Please input k [{TOP_K}]: ").strip() or TOP_K)
-        self.max_tokens = int(input(f"Please input maxTokenCount [{MAX_TOKENS}]: ").strip() or MAX_TOKENS)
-        self.stop_sequences = (input(f"Please comma seperated input stopSequences [{STOP_SEQUENCES}]: ").strip() or STOP_SEQUENCES)
-        if type(self.stop_sequences) == str:
-            self.stop_sequences = self.stop_sequences.split(",")
-        self.return_likelihoods = input(f"Please input return_likelihoods [{RETURN_LIKELIHOODS}]: ").strip() or RETURN_LIKELIHOODS
+        """
+        Collect the parameters of a generation from the user
+        """
+        values = {}
+        values["model_id"] = input(f"Please input modelId [{MODEL_ID_COMMAND}]: ").strip() or MODEL_ID_COMMAND
+
+        values["temperature"] = float(input(f"Please input temperature [{TEMPERATURE}]: ").strip() or TEMPERATURE)
+        values["top_p"] = float(input(f"Please input p [{TOP_P}]: ").strip() or TOP_P)
+        values["top_k"] = int(input(f"Please input k [{TOP_K}]: ").strip() or TOP_K)
+        values["max_tokens"] = int(input(f"Please input maxTokenCount [{MAX_TOKENS}]: ").strip() or MAX_TOKENS)
+        stop_sequences = input(f"Please comma seperated input stopSequences [{STOP_SEQUENCES}]: ").strip()
+        if stop_sequences:
+            values["stop_sequences"] = stop_sequences.split(",")
+        values["return_likelihoods"] = input(f"Please input return_likelihoods [{RETURN_LIKELIHOODS}]: ").strip() or RETURN_LIKELIHOODS
+        values["num_generations"] = int(input(f"Please input num_generations [{NUM_GENERATIONS}]: ").strip() or NUM_GENERATIONS)
         
-        self.prompt = input(f"Please input Question [{DEFAULT_PROMPT}]: ").strip() or DEFAULT_PROMPT
+        values["prompt"] = input(f"Please input Question [{DEFAULT_PROMPT}]: ").strip() or DEFAULT_PROMPT
+        return CommandParameters(**values)
 
-    def process(self, streaming = False):
+    def _prepare(self, params):
+        params = CommandParameters.of(params)
+
+        ## Ground the question in the passages retrieved from the corpus
+        if self.retriever is not None:
+            params = params.replace(prompt=self.retriever.augment(params.model_id, params.prompt))
+        return params
+
+    def generate(self, params):
         """
-        Invoke Cohere Command Text Model
+        Invoke Cohere Command Text Model, return the response
         """
-        ## Collect user Inputs
-        self.prepare_input()
-
-        ### Prepare Input for the FM invocation
-        input = json.dumps(
-            dict(
-                prompt=self.prompt,
-                temperature=self.temperature,
-                p=self.top_p,
-                k=self.top_k,
-                max_tokens=self.max_tokens,
-                stop_sequences=self.stop_sequences,
-                return_likelihoods= self.return_likelihoods,
-                num_generations= 2,
-                stream=streaming,
-            )
-        )
+        params = CommandParameters.of(params)
+        ## Cached under the question of the user, whatever the passages the retriever adds to it
+        question = params.prompt
+        params = self._prepare(params)
+        with stage("build"):
+            body = build_request(params)
 
-        if not streaming:
+        def generate():
             ### Invoke Foundation Model
             output = self.bedrock_client.invoke_model(
-                body=input,
-                modelId=self.model_id,
+                body=body,
+                modelId=params.model_id,
                 accept="application/json",
                 contentType="application/json",
             )
 
             ### Read Response
-            response = json.loads(output["body"].read())
-            
+            raw = output["body"].read()
+            with stage("parse"):
+                return json.loads(raw)
+
+        if self.semantic_cache is None:
+            return generate()
+        return self.semantic_cache.get_or_generate(self.semantic_cache.namespace_of(params), question, generate)
+
+    def stream(self, params, callbacks=()):
+        """
+        Invoke Cohere Command Text Model with a response stream, return the StreamAccumulator once consumed
+        """
+        params = self._prepare(params)
+        with stage("build"):
+            body = build_request(params, streaming=True)
+        output = self.bedrock_client.invoke_model_with_response_stream(
+            body=body,
+            modelId=params.model_id,
+            accept = "application/json",
+            contentType="application/json"
+        )
+
+        ## Process Stream
+        accumulator = StreamAccumulator(callbacks=callbacks)
+        return accumulator.consume(iter_chunks(params.model_id, output.get("body")))
+
+    def process(self, streaming = False):
+        """
+        Invoke Cohere Command Text Model with parameters collected from the user
+        """
+        ## Collect user Inputs
+        params = self.prepare_input()
+
+        if not streaming:
+            response = self.generate(params)
             for result in response["generations"]:
                 logger.info(result["text"])
                 logger.info(f"Finish Reason: {result["finish_reason"]}")
                 if 'likelihood' in result:
                     logger.info(f"Likelihood: {result['likelihood']}\n")
         else:
-            output = self.bedrock_client.invoke_model_with_response_stream(
-                body=input,
-                modelId=self.model_id,
-                accept = "application/json",
-                contentType="application/json"
-            )
-
-            response_stream = output.get("body")
-            ## Process Stream
-            for event in response_stream:
-                chunk = event.get("chunk")
-                data = json.loads(chunk.get("bytes").decode())
-                text = data.get("text")
-                if '\n' == text:
-                    print('')
-                    continue
-                print(text, end='')
+            accumulator = self.stream(params, callbacks=[print_chunk])
+            print("")
+            logger.info(f"Finish Reason: {accumulator.finish_reason}")
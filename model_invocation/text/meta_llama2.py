@@ -1,6 +1,9 @@
 import json
 import logging
 from utils.exception_handler import BedrockException
+from model_invocation.streaming import StreamAccumulator, iter_chunks, print_chunk
+from model_invocation.parameters import Field, Parameters
+from profiling.profiler import stage
 
 ## Instantiate Logger
 logger = logging.getLogger(__name__)
@@ -15,6 +18,36 @@ TOP_P = "0.9"
 MAX_GEN_LEN = "512"
 DEFAULT_PROMPT = "Why do we dream?"
 
+
+class Llama2Parameters(Parameters):
+    """
+    Parameters of Meta Llama2, validated against the ranges documented in MetaLlama2TextGenerator
+    """
+
+    MODEL = "Meta Llama2"
+    FIELDS = dict(
+        model_id=Field(str, MODEL_ID_LLAMA),
+        temperature=Field(float, float(TEMPERATURE), 0.0, 1.0),
+        top_p=Field(float, float(TOP_P), 0.0, 1.0),
+        max_gen_len=Field(int, int(MAX_GEN_LEN), 1, 2048),
+        prompt=Field(str, DEFAULT_PROMPT),
+    )
+    __slots__ = tuple(FIELDS)
+
+
+def build_request(params):
+    """
+    Request body for Meta Llama2, built from the parameters only (missing ones take their default)
+    """
+    params = Llama2Parameters.of(params)
+    return json.dumps(dict(
+        prompt=params.prompt,
+        temperature = params.temperature,
+        top_p = params.top_p,
+        max_gen_len = params.max_gen_len,
+    ))
+
+
 class MetaLlama2TextGenerator:
     """
     --> Meta text models:
@@ -76,59 +109,89 @@ class MetaLlama2TextGenerator:
         }
 
     """
-    def __init__(self, bedrock_client) -> None:
+    def __init__(self, bedrock_client, semantic_cache=None, retriever=None) -> None:
         self.bedrock_client = bedrock_client
+        self.semantic_cache = semantic_cache
+        self.retriever = retriever
 
     def prepare_input(self):
-        self.model_id = input(f"Please input modelId [{MODEL_ID_LLAMA}]: ").strip() or MODEL_ID_LLAMA
-
-        self.temperature = float(input(f"Please input temperature [{TEMPERATURE}]: ").strip() or TEMPERATURE)
-        self.top_p = float(input(f"Please input top_p [{TOP_P}]: ").strip() or TOP_P)
-        self.max_gen_len = int(input(f"Please input max_gen_len [{MAX_GEN_LEN}]: ").strip() or MAX_GEN_LEN)
+        """
+        Collect the parameters of a generation from the user
+        """
+        values = {}
+        values["model_id"] = input(f"Please input modelId [{MODEL_ID_LLAMA}]: ").strip() or MODEL_ID_LLAMA
+
+        values["temperature"] = float(input(f"Please input temperature [{TEMPERATURE}]: ").strip() or TEMPERATURE)
+        values["top_p"] = float(input(f"Please input top_p [{TOP_P}]: ").strip() or TOP_P)
+        values["max_gen_len"] = int(input(f"Please input max_gen_len [{MAX_GEN_LEN}]: ").strip() or MAX_GEN_LEN)
         
-        self.prompt = input(f"Please input Question [{DEFAULT_PROMPT}]: ").strip() or DEFAULT_PROMPT
-
-    def process(self, streaming = False):
-
-        ## Prepare Input for the FM invocation
-        self.prepare_input()
-
-        ## Prepare Input for the FM invocation
-        input  = json.dumps(dict(
-            prompt=self.prompt,
-            temperature = self.temperature,
-            top_p = self.top_p,
-            max_gen_len = self.max_gen_len,
-        ))
-
-        ## Invoke Foundation Model
-        if not streaming:
+        values["prompt"] = input(f"Please input Question [{DEFAULT_PROMPT}]: ").strip() or DEFAULT_PROMPT
+        return Llama2Parameters(**values)
+
+    def _prepare(self, params):
+        params = Llama2Parameters.of(params)
+
+        ## Ground the question in the passages retrieved from the corpus
+        if self.retriever is not None:
+            params = params.replace(prompt=self.retriever.augment(params.model_id, params.prompt))
+        return params
+
+    def generate(self, params):
+        """
+        Invoke Meta Llama2 Model, return the response
+        """
+        params = Llama2Parameters.of(params)
+        ## Cached under the question of the user, whatever the passages the retriever adds to it
+        question = params.prompt
+        params = self._prepare(params)
+        with stage("build"):
+            body = build_request(params)
+
+        def generate():
             output = self.bedrock_client.invoke_model(
-                body = input,
-                modelId = self.model_id,
+                body = body,
+                modelId = params.model_id,
                 accept = "application/json",
                 contentType = "application/json"
             )
 
             ## Read Response
-            response = json.loads(output.get("body").read())
+            raw = output.get("body").read()
+            with stage("parse"):
+                return json.loads(raw)
+
+        if self.semantic_cache is None:
+            return generate()
+        return self.semantic_cache.get_or_generate(self.semantic_cache.namespace_of(params), question, generate)
+
+    def stream(self, params, callbacks=()):
+        """
+        Invoke Meta Llama2 Model with a response stream, return the StreamAccumulator once consumed
+        """
+        params = self._prepare(params)
+        with stage("build"):
+            body = build_request(params)
+        output = self.bedrock_client.invoke_model_with_response_stream(
+            body = body,
+            modelId = params.model_id,
+            accept = "application/json",
+            contentType = "application/json"
+        )
+
+        ## Process Stream
+        accumulator = StreamAccumulator(callbacks=callbacks)
+        return accumulator.consume(iter_chunks(params.model_id, output.get("body")))
+
+    def process(self, streaming = False):
+        """
+        Invoke Meta Llama2 Model with parameters collected from the user
+        """
+        params = self.prepare_input()
+
+        if not streaming:
+            response = self.generate(params)
             logger.info(f"Generation: {response.get("generation")}")
-        
         else:
-            output = self.bedrock_client.invoke_model_with_response_stream(
-                body = input,
-                modelId = self.model_id,
-                accept = "application/json",
-                contentType = "application/json"
-            )
-            ## Read Response
-            response_stream = output.get("body")
-
-            for event in response_stream:
-                chunk = event.get("chunk")
-                data = json.loads(chunk.get("bytes").decode())
-                text = data.get("generation")
-                if '\n' == text:
-                    print('')
-                    continue
-                print(text, end='')
+            accumulator = self.stream(params, callbacks=[print_chunk])
+            print("")
+            logger.info(f"Stop Reason: {accumulator.finish_reason}")
@@ -9,6 +9,8 @@ from model_invocation.text.anthropic_claude import AnthropicClaudeTextGenerator
 from model_invocation.text.meta_llama2 import MetaLlama2TextGenerator
 from model_invocation.text.ai21_jurassic import AI21Jurassic2TextGenerator
 from model_invocation.text.cohere_command import CohereCommandTextGenerator
+from model_invocation.text.best_of_n import BestOfNTextGenerator
+from model_invocation.text.chat import ChatTextGenerator
 from model_invocation.image.stability_diffusion import StabilityDiffusionImageGenerator
 from model_invocation.image.amazon_titan import AmazonTitanImageGenerator
 from model_invocation.embedding.amazon_titan import AmazonTitanEmbeddeing
@@ -21,14 +23,35 @@ logging.basicConfig(level=logging.INFO, format="%(message)s")
 
 class Operations:
 
-    def __init__(self, control_client, runtime_client) -> None:
+    def __init__(
+        self, control_client, runtime_client, semantic_cache=None, retriever=None, image_post_processor=None
+    ) -> None:
         self.control_client = control_client
         self.runtime_client = runtime_client
+        self.semantic_cache = semantic_cache
+        self.retriever = retriever
+
+        ## One generator per model, shared by every call: generators keep no state between calls
+        text_arguments = dict(bedrock_client=runtime_client, semantic_cache=semantic_cache, retriever=retriever)
+        self.titan_text = AmazonTitanTextGenerator(**text_arguments)
+        self.claude = AnthropicClaudeTextGenerator(**text_arguments)
+        self.llama2 = MetaLlama2TextGenerator(**text_arguments)
+        self.jurassic2 = AI21Jurassic2TextGenerator(**text_arguments)
+        self.cohere_command = CohereCommandTextGenerator(**text_arguments)
+        self.best_of_n = BestOfNTextGenerator(bedrock_client=runtime_client)
+        self.chat_generator = ChatTextGenerator(bedrock_client=runtime_client)
+        self.titan_image = AmazonTitanImageGenerator(bedrock_client=runtime_client, post_processor=image_post_processor)
+        self.sdxl = StabilityDiffusionImageGenerator(bedrock_client=runtime_client, post_processor=image_post_processor)
+        self.titan_embedding = AmazonTitanEmbeddeing(bedrock_client=runtime_client)
+        self.cohere_embedding = CohereEmbeddeing(bedrock_client=runtime_client)
 
     def list_models(self):
         """
         Initiator for listing FM models deployed with Amazon Bedrock
         """
+        if self.control_client is None:
+            logger.error("Listing the models needs Amazon Bedrock: a cassette is replayed (BEDROCK_REPLAY)")
+            return
 
         try:
             models = FoundationModels(bedrock_client=self.control_client)
@@ -45,8 +68,7 @@ class Operations:
         """
 
         try:
-            titan = AmazonTitanTextGenerator(bedrock_client=self.runtime_client)
-            titan.process(streaming)
+            self.titan_text.process(streaming)
         except ClientError as err:
             err_msg = err.response["Error"]["Message"]
             logger.error(f"Client Error: {err_msg}")
@@ -61,8 +83,7 @@ class Operations:
         """
 
         try:
-            claude = AnthropicClaudeTextGenerator(bedrock_client=self.runtime_client)
-            claude.process(streaming)
+            self.claude.process(streaming)
         except ClientError as err:
             err_msg = err.response["Error"]["Message"]
             logger.error(f"Client Error: {err_msg}")
@@ -77,8 +98,7 @@ class Operations:
         """
 
         try:
-            llama2 = MetaLlama2TextGenerator(bedrock_client=self.runtime_client)
-            llama2.process(streaming)
+            self.llama2.process(streaming)
         except ClientError as err:
             err_msg = err.response["Error"]["Message"]
             logger.error(f"Client Error: {err_msg}")
@@ -93,8 +113,7 @@ class Operations:
         """
 
         try:
-            j2 = AI21Jurassic2TextGenerator(bedrock_client=self.runtime_client)
-            j2.process()
+            self.jurassic2.process()
         except ClientError as err:
             err_msg = err.response["Error"]["Message"]
             logger.error(f"Client Error: {err_msg}")
@@ -109,8 +128,37 @@ class Operations:
         """
 
         try:
-            j2 = CohereCommandTextGenerator(bedrock_client=self.runtime_client)
-            j2.process(streaming)
+            self.cohere_command.process(streaming)
+        except ClientError as err:
+            err_msg = err.response["Error"]["Message"]
+            logger.error(f"Client Error: {err_msg}")
+        except BedrockException as err:
+            logger.error(err.message)
+        else:
+            logger.info("Processign Done!!!")
+
+    def generate_text_best_of_n(self):
+        """
+        Initiator for Testing Best-of-N Text Generation
+        """
+
+        try:
+            self.best_of_n.process()
+        except ClientError as err:
+            err_msg = err.response["Error"]["Message"]
+            logger.error(f"Client Error: {err_msg}")
+        except BedrockException as err:
+            logger.error(err.message)
+        else:
+            logger.info("Processign Done!!!")
+
+    def chat(self):
+        """
+        Initiator for Testing Multi-turn Chat
+        """
+
+        try:
+            self.chat_generator.process()
         except ClientError as err:
             err_msg = err.response["Error"]["Message"]
             logger.error(f"Client Error: {err_msg}")
@@ -125,8 +173,7 @@ class Operations:
         """
 
         try:
-            titan = AmazonTitanImageGenerator(bedrock_client=self.runtime_client)
-            titan.process()
+            self.titan_image.process()
         except ClientError as err:
             err_msg = err.response["Error"]["Message"]
             logger.error(f"Client Error: {err_msg}")
@@ -141,8 +188,7 @@ class Operations:
         """
 
         try:
-            sdxl = StabilityDiffusionImageGenerator(bedrock_client=self.runtime_client)
-            sdxl.process()
+            self.sdxl.process()
         except ClientError as err:
             err_msg = err.response["Error"]["Message"]
             logger.error(f"Client Error: {err_msg}")
@@ -157,8 +203,7 @@ class Operations:
         """
 
         try:
-            titan = AmazonTitanEmbeddeing(bedrock_client=self.runtime_client)
-            titan.process()
+            self.titan_embedding.process()
         except ClientError as err:
             err_msg = err.response["Error"]["Message"]
             logger.error(f"Client Error: {err_msg}")
@@ -173,8 +218,7 @@ class Operations:
         """
 
         try:
-            cohere = CohereEmbeddeing(bedrock_client=self.runtime_client)
-            cohere.process()
+            self.cohere_embedding.process()
         except ClientError as err:
             err_msg = err.response["Error"]["Message"]
             logger.error(f"Client Error: {err_msg}")
@@ -0,0 +1,447 @@
+import cProfile
+import io
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+
+## Instantiate Logger
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+# Profiler Default Values
+OUTPUT_DIR = "profiles"
+MODE_SAMPLE = "sample"
+MODE_CPROFILE = "cprofile"
+MODES = (MODE_SAMPLE, MODE_CPROFILE)
+## 200 samples per second: enough to see a 50ms stage, at a cost well under 5% of a core
+SAMPLE_INTERVAL_SECONDS = 0.005
+## Frames kept per allocation by tracemalloc (more frames slow every allocation down), and lines reported
+TRACEMALLOC_FRAMES = 1
+TOP_ALLOCATIONS = 15
+TOP_FUNCTIONS = 40
+
+## Stages of the invocation hot path, in the order of a request
+STAGES = ("build", "send", "first byte", "read", "parse", "post-process", "save")
+
+## Profiler collecting the stage timings, None when profiling is off
+_active = None
+_NO_STAGE = nullcontext()
+
+
+class _Stage:
+    """
+    Context manager adding its duration to a stage of the active Profiler
+    """
+
+    __slots__ = ("profiler", "name", "started")
+
+    def __init__(self, profiler, name) -> None:
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.record(self.name, time.perf_counter() - self.started)
+
+
+def stage(name):
+    """
+    Time a stage of the hot path (see STAGES) while profiling; a shared no-op context manager otherwise
+    """
+    if _active is None:
+        return _NO_STAGE
+    return _Stage(_active, name)
+
+
+def record(name, seconds):
+    """
+    Add a duration measured elsewhere to a stage, while profiling
+    """
+    if _active is not None:
+        _active.record(name, seconds)
+
+
+def _percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class _Sampler:
+    """
+    Daemon thread recording the Python stack of every other thread each `interval` seconds, as collapsed
+    stacks: one line per distinct stack, `thread;outermost frame;...;innermost frame count`
+    """
+
+    def __init__(self, interval) -> None:
+        self.interval = interval
+        self.stacks = Counter()
+        self.labels = {}
+        self.samples = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="bedrock-profiler", daemon=True)
+
+    def _label(self, code):
+        ## Cached per code object: formatting every frame of every sample would dominate the cost
+        label = self.labels.get(code)
+        if label is None:
+            filename = code.co_filename
+            if filename.startswith(os.getcwd()):
+                filename = os.path.relpath(filename)
+            label = f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(";", ":")
+            self.labels[code] = label
+        return label
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self.stopped.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(self._label(frame.f_code))
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def write(self, path):
+        with open(path, "w", encoding="utf-8") as file:
+            for stack, count in self.stacks.most_common():
+                file.write(f"{stack} {count}\n")
+
+
+class Profiler:
+    """
+    --> Opt-in profiling of the invocation hot path, written to a new directory of `output_dir` on stop():
+
+    1. mode "sample": a sampling thread records the stacks of all the threads every `interval` seconds,
+       written as collapsed stacks to stacks.folded (flamegraph.pl, inferno, speedscope).
+    2. mode "cprofile": deterministic profile while profiled operations run (from Python 3.12, of every
+       thread during that time), written to profile.pstats (snakeviz, gprof2dot, `python -m pstats`) with
+       its slowest functions in report.txt.
+    3. tracemalloc (unless `trace_memory` is False): memory growth and peak of the profiled operations
+       which run alone (tracemalloc only counts the whole process: the runs overlapping another operation
+       are counted, not measured), the peak of the process, and the lines whose memory grew the most between
+       the snapshots taken on start() and stop(), in report.txt. The snapshots are written to
+       memory-start.tracemalloc and memory-stop.tracemalloc.
+    4. stage timers (see STAGES): count, total, mean, p50, p95 and max of every stage in report.txt,
+       from the stage() markers of the generators and a ProfiledClient around the runtime client.
+
+    Operations are profiled with `with profiler.operation(name):`, or every method of an object at once
+    with wrap(), e.g. Operations or a generator. Profiling is process-wide: one Profiler at a time.
+    """
+
+    def __init__(
+        self,
+        output_dir=OUTPUT_DIR,
+        mode=MODE_SAMPLE,
+        interval=SAMPLE_INTERVAL_SECONDS,
+        trace_memory=True,
+    ) -> None:
+        if mode not in MODES:
+            raise ValueError(f"Unknown profiling mode {mode!r}, use one of {', '.join(MODES)}")
+        self.output_dir = output_dir
+        self.mode = mode
+        self.interval = interval
+        self.trace_memory = trace_memory
+
+        self.stages = {}
+        self.operations = {}
+        ## Operation -> [(bytes still allocated after it, peak bytes during it)], of the runs alone
+        self.memory = {}
+        ## Operation -> runs overlapping another operation, whose memory is not measured
+        self.overlapped = {}
+        ## Overlap flags ([bool]) of the operations running
+        self.running = []
+        self.process_peak = 0
+        self.snapshots = []
+        self.growth = []
+        self.sampler = None
+        self.profile = None
+        self.profiling = 0
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.started = None
+
+    def start(self):
+        global _active
+        if _active is not None:
+            raise RuntimeError("A profiler is already running")
+        self.started = time.monotonic()
+        if self.trace_memory:
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            self.snapshots.append(tracemalloc.take_snapshot())
+        if self.mode == MODE_SAMPLE:
+            self.sampler = _Sampler(self.interval)
+            self.sampler.start()
+        else:
+            self.profile = cProfile.Profile()
+        _active = self
+        logger.info(f"Profiling ({self.mode}), reports in {self.output_dir}")
+        return self
+
+    def record(self, name, seconds):
+        with self.lock:
+            self.stages.setdefault(name, []).append(seconds)
+
+    @contextmanager
+    def operation(self, name):
+        """
+        Profile an operation; operations nested in it (e.g. a generator called by Operations) are part of it
+        """
+        depth = getattr(self.local, "depth", 0)
+        if depth:
+            self.local.depth = depth + 1
+            try:
+                yield
+            finally:
+                self.local.depth = depth
+            return
+
+        self.local.depth = 1
+        ## Snapshots take seconds once botocore is loaded: operations only read the traced totals, which are
+        ## process-wide, so that they are reset and read only for an operation running alone
+        with self.lock:
+            overlap = [bool(self.running)]
+            for flag in self.running:
+                flag[0] = True
+            self.running.append(overlap)
+            if self.trace_memory and not overlap[0]:
+                current, peak = tracemalloc.get_traced_memory()
+                self.process_peak = max(self.process_peak, peak)
+                tracemalloc.reset_peak()
+                before = current
+            ## One profile for all the threads running operations, enabled while any of them runs
+            if self.profile is not None:
+                if not self.profiling:
+                    self.profile.enable()
+                self.profiling += 1
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            with self.lock:
+                if self.profile is not None:
+                    self.profiling -= 1
+                    if not self.profiling:
+                        self.profile.disable()
+                self.running.remove(overlap)
+                self.operations.setdefault(name, []).append(elapsed)
+                if self.trace_memory:
+                    current, peak = tracemalloc.get_traced_memory()
+                    self.process_peak = max(self.process_peak, peak)
+                    if overlap[0]:
+                        self.overlapped[name] = self.overlapped.get(name, 0) + 1
+                    else:
+                        self.memory.setdefault(name, []).append((current - before, peak - before))
+            self.local.depth = 0
+
+    def wrap(self, target):
+        """
+        Proxy of `target` whose public methods are profiled as operations named after them
+        """
+        return Profiled(target, self)
+
+    def _timings(self, title, timings, order):
+        width = max([24] + [len(name) + 1 for name in order])
+        header = "".join(f"{column:>11}" for column in ("count", "total s", "mean ms", "p50 ms", "p95 ms", "max ms"))
+        lines = [f"--- {title}", f"{'':{width}}{header}"]
+        for name in order:
+            ordered = sorted(timings[name])
+            total = sum(ordered)
+            lines.append(
+                f"{name:{width}}{len(ordered):11}{total:11.3f}{total / len(ordered) * 1000:11.2f}"
+                f"{_percentile(ordered, 0.5) * 1000:11.2f}{_percentile(ordered, 0.95) * 1000:11.2f}"
+                f"{ordered[-1] * 1000:11.2f}"
+            )
+        return lines
+
+    def report(self):
+        """
+        Text report of the stage timers, the operations, the slowest functions and the allocations
+        """
+        with self.lock:
+            stages = dict(self.stages)
+            operations = dict(self.operations)
+            memory = dict(self.memory)
+            overlapped = dict(self.overlapped)
+            process_peak = self.process_peak
+            if self.trace_memory and tracemalloc.is_tracing():
+                process_peak = max(process_peak, tracemalloc.get_traced_memory()[1])
+
+        lines = [f"Profile ({self.mode}) of {time.monotonic() - self.started:.1f}s", ""]
+        order = [name for name in STAGES if name in stages] + sorted(set(stages) - set(STAGES))
+        lines += self._timings("Stages", stages, order) + [""]
+        lines += self._timings("Operations", operations, sorted(operations)) + [""]
+
+        if self.profile is not None:
+            output = io.StringIO()
+            pstats.Stats(self.profile, stream=output).sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+            lines += [f"--- Top {TOP_FUNCTIONS} functions by cumulative time", output.getvalue()]
+        if self.sampler is not None:
+            lines += [f"--- {self.sampler.samples} samples every {self.interval * 1000:g}ms, see stacks.folded", ""]
+
+        if memory or overlapped:
+            names = sorted(set(memory) | set(overlapped))
+            width = max(len(name) for name in names) + 1
+            lines.append("--- Memory of the operations run alone (runs overlapping another one are not measured)")
+            lines.append(f"{'':{width}}{'alone':>11}{'overlapped':>11}{'mean growth KiB':>17}{'max peak KiB':>17}")
+            for name in names:
+                usages = memory.get(name, [])
+                line = f"{name:{width}}{len(usages):11}{overlapped.get(name, 0):11}"
+                if usages:
+                    growth = sum(usage[0] for usage in usages) / len(usages)
+                    peak = max(usage[1] for usage in usages)
+                    line += f"{growth / 1024:17.1f}{peak / 1024:17.1f}"
+                lines.append(line)
+            lines.append(f"Process peak while profiling: {process_peak / 1024:.1f} KiB")
+            lines.append("")
+        if self.growth:
+            lines.append(f"--- Top {TOP_ALLOCATIONS} lines by memory growth while profiling")
+            lines += [f"    {stat}" for stat in self.growth]
+            lines.append("")
+        return "\n".join(lines)
+
+    def stop(self):
+        """
+        Stop profiling and write the reports, return their directory
+        """
+        global _active
+        if _active is not self:
+            return None
+        _active = None
+        if self.sampler is not None:
+            self.sampler.stop()
+        if self.trace_memory:
+            self.snapshots.append(tracemalloc.take_snapshot())
+            ## Without the allocations of the profiler itself (collapsed stacks, tracemalloc bookkeeping)
+            own = (__file__, tracemalloc.__file__)
+            self.growth = [
+                stat
+                for stat in self.snapshots[1].compare_to(self.snapshots[0], "lineno")
+                if stat.size_diff > 0 and stat.traceback[0].filename not in own
+            ][:TOP_ALLOCATIONS]
+
+        directory = os.path.join(self.output_dir, time.strftime("%Y%m%d-%H%M%S") + f"-{os.getpid()}")
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, "report.txt"), "w", encoding="utf-8") as file:
+            file.write(self.report())
+        if self.sampler is not None:
+            self.sampler.write(os.path.join(directory, "stacks.folded"))
+        if self.profile is not None:
+            self.profile.dump_stats(os.path.join(directory, "profile.pstats"))
+        if self.trace_memory:
+            self.snapshots[0].dump(os.path.join(directory, "memory-start.tracemalloc"))
+            self.snapshots[1].dump(os.path.join(directory, "memory-stop.tracemalloc"))
+            tracemalloc.stop()
+        logger.info(f"Profile written to {directory}")
+        return directory
+
+
+class Profiled:
+    """
+    Proxy profiling every call of the public methods of an object as an operation named after the method
+    """
+
+    def __init__(self, target, profiler) -> None:
+        self.target = target
+        self.profiler = profiler
+
+    def __getattr__(self, name):
+        value = getattr(self.target, name)
+        if name.startswith("_") or not callable(value):
+            return value
+        operation = f"{type(self.target).__name__}.{name}"
+
+        def profiled(*args, **kwargs):
+            with self.profiler.operation(operation):
+                return value(*args, **kwargs)
+
+        return profiled
+
+
+class _TimedBody:
+    """
+    Response body whose read() is timed as the "read" stage
+    """
+
+    def __init__(self, body) -> None:
+        self.body = body
+
+    def __getattr__(self, name):
+        return getattr(self.body, name)
+
+    def read(self, *args, **kwargs):
+        with stage("read"):
+            return self.body.read(*args, **kwargs)
+
+
+class _FirstByteStream:
+    """
+    Iterate a response stream unchanged, timing the "first byte" stage up to its first event
+    """
+
+    def __init__(self, stream, started) -> None:
+        self.stream = stream
+        self.started = started
+
+    def __iter__(self):
+        first = True
+        for event in self.stream:
+            if first:
+                record("first byte", time.perf_counter() - self.started)
+                first = False
+            yield event
+
+    def close(self):
+        self.stream.close()
+
+
+class ProfiledClient:
+    """
+    --> Drop-in wrapper of the bedrock-runtime client timing the network stages while profiling:
+
+    1. send: from the call to the response headers (for invoke_model, the whole generation)
+    2. first byte: from the call to the first event of a response stream
+    3. read: download of the body returned by invoke_model
+
+    Wrap the raw client, inside the scheduling and retry wrappers, so that waits for admission and
+    retry backoffs are not counted as network time.
+    """
+
+    def __init__(self, client) -> None:
+        self.client = client
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def invoke_model(self, **kwargs):
+        with stage("send"):
+            output = self.client.invoke_model(**kwargs)
+        output["body"] = _TimedBody(output["body"])
+        return output
+
+    def invoke_model_with_response_stream(self, **kwargs):
+        started = time.perf_counter()
+        with stage("send"):
+            output = self.client.invoke_model_with_response_stream(**kwargs)
+        output["body"] = _FirstByteStream(output["body"], started)
+        return output
@@ -0,0 +1,253 @@
+import gzip
+import json
+import logging
+import threading
+import time
+from io import BytesIO
+
+from botocore.exceptions import ClientError
+from botocore.response import StreamingBody
+
+## Instantiate Logger
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+# Cassette Default Values
+CASSETTE_VERSION = 1
+## Response headers kept in the cassette: token counts, invocation latency and content types
+RECORDED_HEADERS = ("content-type", "x-amzn-bedrock-")
+
+OPERATION_INVOKE = "invoke"
+OPERATION_STREAM = "invoke-with-response-stream"
+
+## How a replayed request finds its interaction: same model and request body, or (falling back) same model
+MATCH_BODY = "body"
+MATCH_MODEL = "model"
+MATCHES = (MATCH_BODY, MATCH_MODEL)
+
+
+def request_key(operation, model_id, body):
+    """
+    Key of a request in a cassette: the body is compared as JSON, so that key order and spacing do not matter
+    """
+    if isinstance(body, bytes):
+        body = body.decode()
+    try:
+        body = json.dumps(json.loads(body), sort_keys=True, separators=(",", ":"))
+    except ValueError:
+        pass
+    return operation, model_id, body
+
+
+class Interaction:
+    """
+    --> One recorded invocation:
+
+        1. operation / model_id / request: what was sent (the request body as sent, after any clamping)
+        2. status / headers / body: the response, or the error code and message in `error`
+        3. latency: seconds to the response headers; duration: seconds to the end of the body or stream
+        4. events: (seconds from the start of the call, chunk payload) of every event of a response stream
+    """
+
+    __slots__ = (
+        "operation", "model_id", "request", "status", "headers", "body", "error", "latency", "duration", "events"
+    )
+
+    def __init__(
+        self,
+        operation,
+        model_id,
+        request,
+        status=200,
+        headers=None,
+        body=None,
+        error=None,
+        latency=0.0,
+        duration=0.0,
+        events=None,
+    ) -> None:
+        self.operation = operation
+        self.model_id = model_id
+        self.request = request
+        self.status = status
+        self.headers = headers or {}
+        self.body = body
+        self.error = error
+        self.latency = latency
+        self.duration = duration
+        self.events = events if events is not None else []
+
+    @property
+    def key(self):
+        return request_key(self.operation, self.model_id, self.request)
+
+    def as_dict(self):
+        ## Rounded to 0.1ms, which keeps the files small and is finer than the network jitter
+        values = {name: getattr(self, name) for name in self.__slots__}
+        values["latency"] = round(self.latency, 4)
+        values["duration"] = round(self.duration, 4)
+        values["events"] = [[round(offset, 4), payload] for offset, payload in self.events]
+        return {name: value for name, value in values.items() if value not in (None, [], {})}
+
+
+class Cassette:
+    """
+    --> Recorded Amazon Bedrock traffic, in a gzipped JSON Lines file (one interaction per line):
+
+    Interactions with the same request are replayed in the order they were recorded, then again from the first,
+    so that a cassette of a few calls can serve a long benchmark.
+    """
+
+    def __init__(self, interactions=()) -> None:
+        self.interactions = list(interactions)
+        self.lock = threading.Lock()
+        self._index()
+
+    def _index(self):
+        self.by_key = {}
+        self.by_model = {}
+        for interaction in self.interactions:
+            self.by_key.setdefault(interaction.key, []).append(interaction)
+            self.by_model.setdefault((interaction.operation, interaction.model_id), []).append(interaction)
+        self.next = {}
+
+    @classmethod
+    def load(cls, path):
+        with gzip.open(path, "rt", encoding="utf-8") as file:
+            header = json.loads(file.readline())
+            if header.get("cassette") != CASSETTE_VERSION:
+                raise ValueError(f"{path} is not a cassette of version {CASSETTE_VERSION}")
+            return cls(Interaction(**json.loads(line)) for line in file if line.strip())
+
+    def save(self, path):
+        with self.lock:
+            interactions = list(self.interactions)
+        with gzip.open(path, "wt", encoding="utf-8") as file:
+            file.write(json.dumps(dict(cassette=CASSETTE_VERSION, interactions=len(interactions))) + "\n")
+            for interaction in interactions:
+                file.write(json.dumps(interaction.as_dict(), separators=(",", ":")) + "\n")
+        logger.info(f"Recorded {len(interactions)} interactions to {path}")
+
+    def add(self, interaction):
+        with self.lock:
+            self.interactions.append(interaction)
+            self.by_key.setdefault(interaction.key, []).append(interaction)
+            self.by_model.setdefault((interaction.operation, interaction.model_id), []).append(interaction)
+
+    def find(self, operation, model_id, body, match=MATCH_BODY):
+        """
+        Next interaction recorded for a request, None when there is none
+        """
+        key = request_key(operation, model_id, body)
+        with self.lock:
+            candidates = self.by_key.get(key)
+            if not candidates and match == MATCH_MODEL:
+                key = (operation, model_id)
+                candidates = self.by_model.get(key)
+            if not candidates:
+                return None
+            index = self.next.get(key, 0)
+            self.next[key] = index + 1
+            return candidates[index % len(candidates)]
+
+    def __len__(self):
+        return len(self.interactions)
+
+
+class _RecordingStream:
+    """
+    Iterate a response stream unchanged, recording the payload and time of every chunk. The interaction is added
+    to the cassette once the stream ends, with the chunks received so far when it is closed early or fails.
+    """
+
+    def __init__(self, stream, interaction, started, cassette) -> None:
+        self.stream = stream
+        self.interaction = interaction
+        self.started = started
+        self.cassette = cassette
+        self.recorded = False
+
+    def __iter__(self):
+        try:
+            for event in self.stream:
+                if "chunk" in event:
+                    offset = time.monotonic() - self.started
+                    self.interaction.events.append((offset, event["chunk"]["bytes"].decode()))
+                yield event
+        except ClientError as err:
+            self.interaction.error = _error_of(err)
+            raise
+        finally:
+            self._record()
+
+    def _record(self):
+        if not self.recorded:
+            self.recorded = True
+            self.interaction.duration = time.monotonic() - self.started
+            self.cassette.add(self.interaction)
+
+    def close(self):
+        self.stream.close()
+        self._record()
+
+
+def _error_of(err):
+    error = err.response.get("Error", {})
+    return dict(code=error.get("Code", ""), message=error.get("Message", ""))
+
+
+def _headers_of(output):
+    headers = output.get("ResponseMetadata", {}).get("HTTPHeaders", {})
+    return {name: value for name, value in headers.items() if name.startswith(RECORDED_HEADERS)}
+
+
+class RecordingClient:
+    """
+    --> Drop-in wrapper of the bedrock-runtime client recording every invocation into a Cassette:
+
+    Request bodies, response bodies and headers, errors, and the time of the response and of every stream
+    chunk are recorded, for replay without network access (see recording.replay). Wrap the raw client, under
+    the other wrappers, so that the requests are recorded as sent and the timings without local waits;
+    save the cassette with `cassette.save(path)`.
+    """
+
+    def __init__(self, client, cassette=None) -> None:
+        self.client = client
+        self.cassette = cassette if cassette is not None else Cassette()
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def _call(self, method, operation, modelId, kwargs):
+        interaction = Interaction(operation, modelId, kwargs.get("body"))
+        if isinstance(interaction.request, bytes):
+            interaction.request = interaction.request.decode()
+        started = time.monotonic()
+        try:
+            output = method(modelId=modelId, **kwargs)
+        except ClientError as err:
+            interaction.latency = interaction.duration = time.monotonic() - started
+            interaction.status = err.response.get("ResponseMetadata", {}).get("HTTPStatusCode", 400)
+            interaction.error = _error_of(err)
+            self.cassette.add(interaction)
+            raise
+        interaction.latency = time.monotonic() - started
+        interaction.headers = _headers_of(output)
+        return started, interaction, output
+
+    def invoke_model(self, modelId, **kwargs):
+        started, interaction, output = self._call(self.client.invoke_model, OPERATION_INVOKE, modelId, kwargs)
+        body = output["body"].read()
+        interaction.duration = time.monotonic() - started
+        interaction.body = body.decode()
+        self.cassette.add(interaction)
+        ## The body was consumed: the caller reads it again from memory
+        output["body"] = StreamingBody(BytesIO(body), len(body))
+        return output
+
+    def invoke_model_with_response_stream(self, modelId, **kwargs):
+        started, interaction, output = self._call(
+            self.client.invoke_model_with_response_stream, OPERATION_STREAM, modelId, kwargs
+        )
+        output["body"] = _RecordingStream(output["body"], interaction, started, self.cassette)
+        return output
@@ -0,0 +1,184 @@
+import argparse
+import asyncio
+import base64
+import json
+import logging
+import threading
+import time
+from urllib.parse import unquote
+
+import boto3
+
+from benchmarks.emulator import encode_event
+from gateway.http import HttpError, read_request, response_head, write_response
+from recording.cassette import MATCH_BODY, MATCHES, OPERATION_INVOKE, OPERATION_STREAM, Cassette
+from utils.client_factory import BedrockClientFactory
+
+## Instantiate Logger
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+# Replay Default Values
+HOST = "127.0.0.1"
+PORT = 8089
+## Recorded times are multiplied by TIME_SCALE: 0.5 replays twice as fast, 0 without any wait
+TIME_SCALE = 1.0
+REGION = "us-east-1"
+## Error returned for requests which are not in the cassette
+MISS_ERROR_CODE = "ResourceNotFoundException"
+
+
+class ReplayServer:
+    """
+    --> Local bedrock-runtime endpoint answering from a Cassette, for deterministic benchmarks and CI without
+    network access or cost:
+
+    Every request gets the response, headers or error recorded for the same model and request body (see
+    Cassette.find), after the recorded latency; streams send their chunks at the recorded times. All times are
+    scaled by `time_scale`. Clients talk to it over HTTP like to the service, so that botocore and every client
+    wrapper (scheduler, cache, circuit breakers, deadlines) run as in production.
+
+    Point a client at it with runtime_client(), or BedrockClientFactory(endpoint_url=server.endpoint_url).
+    """
+
+    def __init__(self, cassette, host=HOST, port=PORT, time_scale=TIME_SCALE, match=MATCH_BODY) -> None:
+        if match not in MATCHES:
+            raise ValueError(f"Unknown match {match!r}, use one of {', '.join(MATCHES)}")
+        self.cassette = cassette
+        self.host = host
+        self.port = port
+        self.time_scale = time_scale
+        self.match = match
+        self.server = None
+        self.requests = 0
+        self.misses = 0
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        logger.info(f"Replaying {len(self.cassette)} interactions on {self.endpoint_url}")
+
+    async def stop(self):
+        self.server.close()
+
+    def start_background(self):
+        """
+        Serve from a daemon thread with its own event loop, e.g. within a test or benchmark process
+        """
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(self.start())
+        threading.Thread(target=loop.run_forever, name="bedrock-replay", daemon=True).start()
+        return self
+
+    def runtime_client(self, **options):
+        """
+        bedrock-runtime client of this endpoint, with placeholder credentials: nothing leaves the host
+        """
+        session = boto3.Session(aws_access_key_id="replay", aws_secret_access_key="replay", region_name=REGION)
+        return BedrockClientFactory(profile_name=None, endpoint_url=self.endpoint_url, **options).runtime_client(
+            session
+        )
+
+    @property
+    def endpoint_url(self):
+        return f"http://{self.host}:{self.port}"
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                request = await read_request(reader)
+                if request is None:
+                    break
+                self.requests += 1
+                await self._dispatch(request, writer)
+        except (ConnectionError, asyncio.CancelledError, HttpError):
+            pass
+        finally:
+            writer.close()
+
+    async def _wait_until(self, started, offset):
+        delay = started + offset * self.time_scale - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def _dispatch(self, request, writer):
+        started = time.monotonic()
+        parts = request.path.strip("/").split("/")
+        if len(parts) != 3 or parts[0] != "model" or parts[2] not in (OPERATION_INVOKE, OPERATION_STREAM):
+            await write_response(writer, 404, dict(message="Unknown operation"))
+            return
+
+        operation, model_id = parts[2], unquote(parts[1])
+        interaction = self.cassette.find(operation, model_id, request.body, self.match)
+        if interaction is None:
+            self.misses += 1
+            logger.warning(f"No recorded interaction for {operation} of {model_id}")
+            await write_response(
+                writer,
+                404,
+                dict(message=f"No recorded interaction for {operation} of {model_id}"),
+                headers={"x-amzn-ErrorType": MISS_ERROR_CODE},
+            )
+            return
+
+        if interaction.status != 200:
+            await self._wait_until(started, interaction.latency)
+            await write_response(
+                writer,
+                interaction.status,
+                dict(message=interaction.error["message"]),
+                headers={"x-amzn-ErrorType": interaction.error["code"]},
+            )
+            return
+
+        headers = dict(interaction.headers)
+        content_type = headers.pop("content-type", "application/json")
+        if operation == OPERATION_INVOKE:
+            await self._wait_until(started, interaction.duration)
+            await write_response(writer, 200, interaction.body.encode(), content_type=content_type, headers=headers)
+            return
+
+        await self._wait_until(started, interaction.latency)
+        headers.update({"Content-Type": content_type, "Transfer-Encoding": "chunked"})
+        writer.write(response_head(200, headers))
+        await writer.drain()
+        for offset, payload in interaction.events:
+            await self._wait_until(started, offset)
+            event = encode_event(json.dumps(dict(bytes=base64.b64encode(payload.encode()).decode())).encode())
+            writer.write(f"{len(event):x}\r\n".encode() + event + b"\r\n")
+            await writer.drain()
+        if interaction.error is not None:
+            await self._wait_until(started, interaction.duration)
+            event = encode_event(
+                json.dumps(dict(message=interaction.error["message"])).encode(),
+                event_type=interaction.error["code"],
+                message_type="exception",
+            )
+            writer.write(f"{len(event):x}\r\n".encode() + event + b"\r\n")
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a cassette of recorded Amazon Bedrock traffic over HTTP")
+    parser.add_argument("cassette", help="cassette recorded with BEDROCK_RECORD or a RecordingClient")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--time-scale", type=float, default=TIME_SCALE, help="0.5 is twice as fast, 0 without waits")
+    parser.add_argument("--match", choices=MATCHES, default=MATCH_BODY,
+                        help="model: answer unknown request bodies with the interactions of the same model")
+    args = parser.parse_args()
+
+    async def serve():
+        server = ReplayServer(Cassette.load(args.cassette), args.host, args.port, args.time_scale, args.match)
+        await server.start()
+        try:
+            await server.server.serve_forever()
+        finally:
+            logger.info(f"Replayed {server.requests} requests, {server.misses} not in the cassette")
+
+    asyncio.run(serve())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,401 @@
+import logging
+import random
+import threading
+import time
+from collections import deque
+
+from botocore.exceptions import ClientError, ReadTimeoutError
+from botocore.exceptions import ConnectionError as EndpointConnectionError
+
+from resilience.deadline import current_deadline
+from scheduling.scheduler import admission_seconds
+from utils.exception_handler import CircuitOpenException
+
+## Instantiate Logger
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+# Circuit Breaker Default Values
+## Outcomes of the last WINDOW_CALLS calls decide whether the circuit opens, once there are MIN_CALLS of them
+WINDOW_CALLS = 20
+MIN_CALLS = 10
+FAILURE_RATE = 0.5
+## Calls slower than SLOW_CALL_SECONDS (time to the response, or to the first event of a stream) are slow
+SLOW_CALL_SECONDS = 30.0
+SLOW_CALL_RATE = 0.8
+OPEN_SECONDS = 30.0
+## Probe calls let through when half-open; the circuit closes when they all succeed
+HALF_OPEN_CALLS = 2
+
+# Retry Default Values
+MAX_ATTEMPTS = 3
+BACKOFF_SECONDS = 0.2
+MAX_BACKOFF_SECONDS = 5.0
+## Every request adds RETRY_RATIO to the budget and every retry spends 1, i.e. at most 10% extra load
+RETRY_RATIO = 0.1
+## Floor, so that retries remain possible at low traffic
+MIN_RETRIES_PER_SECOND = 0.5
+RETRY_CAPACITY = 10.0
+
+## Errors telling that the model is unhealthy or overloaded; other errors (validation, access) are the caller's
+FAILURE_ERROR_CODES = frozenset(
+    [
+        "ThrottlingException",
+        "TooManyRequestsException",
+        "ServiceUnavailableException",
+        "InternalServerException",
+        "ModelTimeoutException",
+        "ModelNotReadyException",
+        "ModelStreamErrorException",
+    ]
+)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+
+def is_failure(err):
+    """
+    Whether an exception raised by an invocation counts against the health of the model
+    """
+    if isinstance(err, ClientError):
+        code = err.response.get("Error", {}).get("Code", "")
+        ## Errors inside event streams use lower camel case codes (throttlingException)
+        return code[:1].upper() + code[1:] in FAILURE_ERROR_CODES
+    return isinstance(err, (EndpointConnectionError, ReadTimeoutError))
+
+
+class CircuitBreaker:
+    """
+    --> Circuit breaker of one model in one region:
+
+    1. closed: calls go through; the outcomes of the last `window_calls` calls are kept. The circuit opens
+       when the failure rate or the slow call rate crosses its threshold.
+    2. open: calls are refused immediately with CircuitOpenException, for `open_seconds`.
+    3. half-open: `half_open_calls` probe calls go through. The circuit closes when they all succeed,
+       and opens again on the first failure. Probes whose outcome is never recorded (e.g. an abandoned
+       stream) expire `open_seconds` after the last one was let through, so that new probes can go.
+    """
+
+    def __init__(
+        self,
+        name,
+        window_calls=WINDOW_CALLS,
+        min_calls=MIN_CALLS,
+        failure_rate=FAILURE_RATE,
+        slow_call_seconds=SLOW_CALL_SECONDS,
+        slow_call_rate=SLOW_CALL_RATE,
+        open_seconds=OPEN_SECONDS,
+        half_open_calls=HALF_OPEN_CALLS,
+    ) -> None:
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate = slow_call_rate
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+
+        ## (failed, slow) of the last calls
+        self.outcomes = deque(maxlen=window_calls)
+        self.failures = 0
+        self.slow_calls = 0
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.probes = 0
+        self.probe_successes = 0
+        self.probed_at = 0.0
+        self.rejected = 0
+        self.lock = threading.Lock()
+
+    def allow(self):
+        """
+        Admit a call or raise CircuitOpenException; every admitted call must be followed by record()
+        """
+        with self.lock:
+            if self.state == OPEN:
+                remaining = self.opened_at + self.open_seconds - time.monotonic()
+                if remaining > 0:
+                    self.rejected += 1
+                    raise CircuitOpenException(
+                        f"Circuit open for {self.name}, retry in {remaining:.1f}s", retry_after=remaining
+                    )
+                self.state = HALF_OPEN
+                self.probes = 0
+                self.probe_successes = 0
+                logger.info(f"Circuit half-open for {self.name}")
+
+            if self.state == HALF_OPEN:
+                if self.probes >= self.half_open_calls and time.monotonic() - self.probed_at >= self.open_seconds:
+                    logger.warning(f"Probes of {self.name} expired without an outcome, probing again")
+                    self.probes = 0
+                    self.probe_successes = 0
+                if self.probes >= self.half_open_calls:
+                    self.rejected += 1
+                    raise CircuitOpenException(f"Circuit half-open for {self.name}, probing", retry_after=1.0)
+                self.probes += 1
+                self.probed_at = time.monotonic()
+
+    def record(self, failed, latency=0.0):
+        """
+        Outcome of an admitted call; failed=None for outcomes which say nothing of the model (e.g. validation)
+        """
+        slow = latency >= self.slow_call_seconds
+        with self.lock:
+            if self.state == HALF_OPEN:
+                if failed or slow:
+                    self._open()
+                elif failed is None:
+                    ## max(): the probe may have expired meanwhile
+                    self.probes = max(0, self.probes - 1)
+                else:
+                    self.probe_successes += 1
+                    if self.probe_successes >= self.half_open_calls:
+                        self._close()
+                return
+
+            if failed is None or self.state == OPEN:
+                return
+            if len(self.outcomes) == self.outcomes.maxlen:
+                old_failed, old_slow = self.outcomes[0]
+                self.failures -= old_failed
+                self.slow_calls -= old_slow
+            self.outcomes.append((failed, slow))
+            self.failures += failed
+            self.slow_calls += slow
+
+            calls = len(self.outcomes)
+            if calls >= self.min_calls and (
+                self.failures / calls >= self.failure_rate or self.slow_calls / calls >= self.slow_call_rate
+            ):
+                self._open()
+
+    def _open(self):
+        logger.warning(
+            f"Circuit open for {self.name}: {self.failures} failed and {self.slow_calls} slow "
+            f"of the last {len(self.outcomes)} calls"
+        )
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+
+    def _close(self):
+        logger.info(f"Circuit closed for {self.name}")
+        self.state = CLOSED
+        self.outcomes.clear()
+        self.failures = 0
+        self.slow_calls = 0
+
+    def stats(self):
+        with self.lock:
+            calls = len(self.outcomes)
+            return dict(
+                state=self.state,
+                calls=calls,
+                failure_rate=self.failures / calls if calls else 0.0,
+                slow_call_rate=self.slow_calls / calls if calls else 0.0,
+                rejected=self.rejected,
+            )
+
+
+class CircuitBreakers:
+    """
+    One CircuitBreaker per (region, modelId), created on first use with the same settings
+    """
+
+    def __init__(self, **settings) -> None:
+        self.settings = settings
+        self.breakers = {}
+        self.lock = threading.Lock()
+
+    def get(self, region, model_id):
+        key = (region, model_id)
+        breaker = self.breakers.get(key)
+        if breaker is None:
+            with self.lock:
+                breaker = self.breakers.get(key)
+                if breaker is None:
+                    breaker = CircuitBreaker(f"{model_id} ({region})", **self.settings)
+                    self.breakers[key] = breaker
+        return breaker
+
+    def stats(self):
+        return {key: breaker.stats() for key, breaker in list(self.breakers.items())}
+
+
+class RetryBudget:
+    """
+    --> Retries shared by all the requests of a process:
+
+    Every request deposits `ratio` of a retry and every retry withdraws a whole one, plus a small floor of
+    `min_per_second` retries, up to `capacity`. During an outage the budget empties after a few retries and
+    the failures are returned at once, so that retries never multiply the load on a struggling model.
+    """
+
+    def __init__(self, ratio=RETRY_RATIO, min_per_second=MIN_RETRIES_PER_SECOND, capacity=RETRY_CAPACITY) -> None:
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.capacity = capacity
+        self.balance = capacity
+        self.updated = time.monotonic()
+        self.retries = 0
+        self.denied = 0
+        self.lock = threading.Lock()
+
+    def _refill(self, amount):
+        now = time.monotonic()
+        self.balance = min(self.capacity, self.balance + amount + (now - self.updated) * self.min_per_second)
+        self.updated = now
+
+    def deposit(self):
+        with self.lock:
+            self._refill(self.ratio)
+
+    def withdraw(self):
+        """
+        Take one retry from the budget, False when it is spent
+        """
+        with self.lock:
+            self._refill(0.0)
+            if self.balance < 1.0:
+                self.denied += 1
+                return False
+            self.balance -= 1.0
+            self.retries += 1
+            return True
+
+    def stats(self):
+        with self.lock:
+            return dict(balance=round(self.balance, 2), retries=self.retries, denied=self.denied)
+
+
+def _outcome(err):
+    """
+    record() outcome of an invocation which raised: None when it says nothing of the model
+    """
+    ## A timeout caused by the caller's deadline says nothing of the model
+    deadline = current_deadline()
+    return True if is_failure(err) and not (deadline is not None and deadline.expired()) else None
+
+
+class _GuardedStream:
+    """
+    Iterate a response stream unchanged, recording the call to the breaker once the stream ends: a failure
+    when an error is raised in the middle of it, a success otherwise (also when it is closed early).
+    A stream dropped without being read records nothing of the model, which releases its half-open probe.
+    """
+
+    def __init__(self, stream, breaker, latency) -> None:
+        self.stream = stream
+        self.breaker = breaker
+        self.latency = latency
+        self.recorded = False
+
+    def _record(self, failed):
+        if not self.recorded:
+            self.recorded = True
+            self.breaker.record(failed, self.latency)
+
+    def __iter__(self):
+        failed = False
+        try:
+            yield from self.stream
+        except Exception as err:
+            failed = _outcome(err)
+            raise
+        finally:
+            self._record(failed)
+
+    def close(self):
+        self.stream.close()
+        self._record(False)
+
+    def __del__(self):
+        self._record(None)
+
+
+class ResilientClient:
+    """
+    --> Drop-in wrapper of the bedrock-runtime client failing fast on unhealthy models:
+
+    1. Every invocation goes through the CircuitBreaker of its (region, modelId): while a model is down or
+       throttled, calls are refused at once with CircuitOpenException instead of waiting out timeouts,
+       which frees workers for the healthy models.
+    2. Throttling, server errors and timeouts are retried with jittered exponential backoff, up to
+       `max_attempts`, only while the circuit is closed and the shared RetryBudget allows it, and never
+       past the deadline of the call (see resilience.deadline).
+
+    Build the client with BedrockClientFactory(retry_attempts=1), so that botocore does not retry on its
+    own outside of the budget.
+    """
+
+    def __init__(
+        self,
+        client,
+        breakers=None,
+        budget=None,
+        max_attempts=MAX_ATTEMPTS,
+        backoff_seconds=BACKOFF_SECONDS,
+        max_backoff_seconds=MAX_BACKOFF_SECONDS,
+    ) -> None:
+        self.client = client
+        self.breakers = breakers or CircuitBreakers()
+        self.budget = budget or RetryBudget()
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.region = client.meta.region_name
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def _call(self, method, modelId, kwargs, record_success=True):
+        """
+        Invoke with retries, return (breaker, output, latency); a success is recorded unless record_success is
+        False, for streams which are recorded once they end
+        """
+        breaker = self.breakers.get(self.region, modelId)
+        self.budget.deposit()
+        attempt = 0
+        while True:
+            attempt += 1
+            breaker.allow()
+            started = time.monotonic()
+            ## Time spent waiting for admission by a ScheduledClient underneath is not the model's
+            waited = admission_seconds()
+            try:
+                output = method(modelId=modelId, **kwargs)
+            except Exception as err:
+                failed = _outcome(err)
+                breaker.record(failed, time.monotonic() - started - (admission_seconds() - waited))
+                if not failed or attempt >= self.max_attempts or breaker.state != CLOSED:
+                    raise
+                deadline = current_deadline()
+                backoff = min(self.max_backoff_seconds, self.backoff_seconds * 2 ** (attempt - 1))
+                pause = random.uniform(0, backoff)
+                if deadline is not None and deadline.remaining() <= pause:
+                    raise
+                if not self.budget.withdraw():
+                    raise
+                time.sleep(pause)
+                continue
+            latency = time.monotonic() - started - (admission_seconds() - waited)
+            if record_success:
+                breaker.record(False, latency)
+            return breaker, output, latency
+
+    def invoke_model(self, modelId, **kwargs):
+        return self._call(self.client.invoke_model, modelId, kwargs)[1]
+
+    def invoke_model_with_response_stream(self, modelId, **kwargs):
+        breaker, output, latency = self._call(
+            self.client.invoke_model_with_response_stream, modelId, kwargs, record_success=False
+        )
+        output["body"] = _GuardedStream(output["body"], breaker, latency)
+        return output
+
+    def stats(self):
+        return dict(
+            breakers={f"{model_id} ({region})": stats for (region, model_id), stats in self.breakers.stats().items()},
+            retry_budget=self.budget.stats(),
+        )
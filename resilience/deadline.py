@@ -0,0 +1,305 @@
+import contextvars
+import heapq
+import itertools
+import logging
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+from model_invocation.streaming import DEADLINE_EVENT_KEY
+from utils.exception_handler import DeadlineExceededException
+
+## Instantiate Logger
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+# Deadline Default Values
+DEADLINE_SECONDS = 60.0
+## Connection setup (DNS, TCP and TLS) takes well under a second, longer means the endpoint is unreachable
+CONNECT_TIMEOUT_SECONDS = 10.0
+## Floor of the read timeout of an attempt: a timeout of 0 would make the socket non-blocking
+MIN_READ_TIMEOUT_SECONDS = 0.05
+
+## What a stream cut short by its deadline returns, after the chunks already received
+PARTIAL_RAISE = "raise"
+PARTIAL_RETURN = "return"
+PARTIAL_POLICIES = (PARTIAL_RAISE, PARTIAL_RETURN)
+
+## Phases in which a deadline is missed
+PHASE_NOT_SENT = "not sent"
+PHASE_RESPONSE = "response"
+PHASE_STREAM = "stream"
+
+## Deadline of the invocation in progress (or of the deadline() block) in the current thread or task
+_current_deadline = contextvars.ContextVar("current_deadline", default=None)
+
+
+class Deadline:
+    """
+    Monotonic time by which an invocation must be done, out of a budget of `seconds`
+    """
+
+    __slots__ = ("seconds", "expires_at", "response")
+
+    def __init__(self, seconds, expires_at=None) -> None:
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds if expires_at is None else expires_at
+        ## Raw HTTP response of the invocation, shut down when the deadline expires in the middle of a stream
+        self.response = None
+
+    def remaining(self):
+        return self.expires_at - time.monotonic()
+
+    def expired(self):
+        return self.remaining() <= 0
+
+
+def current_deadline():
+    """
+    Deadline of the invocation in progress in this context, None outside of deadline() and DeadlineClient calls
+    """
+    return _current_deadline.get()
+
+
+@contextmanager
+def deadline(seconds):
+    """
+    Bound every invocation made in the block by `seconds` from now, e.g. the embedding and generation calls
+    of a RAG request, or the turns of a chat; an enclosing block with an earlier deadline keeps its own
+    """
+    scope = Deadline(seconds)
+    outer = _current_deadline.get()
+    if outer is not None and outer.expires_at < scope.expires_at:
+        scope = outer
+    token = _current_deadline.set(scope)
+    try:
+        yield scope
+    finally:
+        _current_deadline.reset(token)
+
+
+def _shutdown(response):
+    """
+    Shut down the socket of a raw HTTP response. A read blocked on it returns at once, which closing
+    the response from another thread does not do.
+    """
+    sock = getattr(getattr(response, "connection", None), "sock", None)
+    if sock is None:
+        return
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+
+class _Watchdog:
+    """
+    Single daemon thread expiring the streams whose deadline passed, whatever the number of open streams
+    """
+
+    def __init__(self) -> None:
+        self.heap = []
+        self.sequence = itertools.count()
+        self.condition = threading.Condition()
+        self.thread = None
+
+    def watch(self, stream):
+        with self.condition:
+            heapq.heappush(self.heap, (stream.deadline.expires_at, next(self.sequence), stream))
+            ## Started again in a forked worker process, where the thread of the parent does not exist
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, name="bedrock-deadline", daemon=True)
+                self.thread.start()
+            self.condition.notify()
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.heap or self.heap[0][0] > time.monotonic():
+                    self.condition.wait(self.heap[0][0] - time.monotonic() if self.heap else None)
+                stream = heapq.heappop(self.heap)[2]
+            stream.expire()
+
+
+_watchdog = _Watchdog()
+
+
+class _DeadlineStream:
+    """
+    Iterate a response stream until its deadline. On expiry the watchdog shuts its connection down, which
+    ends a read blocked on a stalled stream, and the partial policy of the client decides how it ends.
+    """
+
+    def __init__(self, stream, deadline, model_id, client) -> None:
+        self.stream = stream
+        self.deadline = deadline
+        self.model_id = model_id
+        self.client = client
+        self.finished = False
+        self.expired = False
+        _watchdog.watch(self)
+
+    def expire(self):
+        if not self.finished:
+            self.expired = True
+            _shutdown(self.deadline.response)
+
+    def __iter__(self):
+        try:
+            try:
+                yield from self.stream
+                if not self.expired:
+                    return
+                cause = None
+            except Exception as err:
+                if not (self.expired or self.deadline.expired()):
+                    raise
+                cause = err
+
+            self.stream.close()
+            message = self.client._missed(self.model_id, PHASE_STREAM, self.deadline)
+            if self.client.partial == PARTIAL_RAISE:
+                raise DeadlineExceededException(message) from cause
+            yield {DEADLINE_EVENT_KEY: dict(seconds=self.deadline.seconds)}
+        finally:
+            self.finished = True
+            self.deadline.response = None
+
+    def close(self):
+        if not self.finished:
+            ## Closed from another thread while a read may be blocked, e.g. for a client which went away
+            _shutdown(self.deadline.response)
+        self.stream.close()
+
+
+class DeadlineClient:
+    """
+    --> Drop-in wrapper of the bedrock-runtime client bounding every invocation by a deadline:
+
+    1. The deadline of a call is `seconds` from its start, or the deadline of the enclosing deadline()
+       block when that is earlier. The wrapped clients see it through current_deadline(): a ResilientClient
+       does not retry when the backoff would outlast it, a ScheduledClient waits for admission until it.
+    2. Every attempt botocore sends gets the time remaining as read timeout (when the client allows less,
+       its own read_timeout), and no attempt is sent or retried once the deadline expired. Connecting is
+       bounded by the connect_timeout of the client, see BedrockClientFactory(connect_timeout=...).
+    3. Response streams are watched by a single watchdog thread: when the deadline of a stream expires,
+       its connection is shut down, which releases a worker blocked on a stalled stream, and the response
+       is closed. The `partial` policy decides what the stream returns after the chunks already received:
+       PARTIAL_RAISE raises DeadlineExceededException, PARTIAL_RETURN ends the stream with a
+       `deadlineExceeded` event (finish_reason "deadline" in the accumulator of the text generators).
+
+    Missed deadlines raise DeadlineExceededException; they are logged and counted per model and phase
+    in stats().
+    """
+
+    def __init__(self, client, seconds=DEADLINE_SECONDS, partial=PARTIAL_RAISE) -> None:
+        if partial not in PARTIAL_POLICIES:
+            raise ValueError(f"Unknown partial policy {partial!r}, use one of {', '.join(PARTIAL_POLICIES)}")
+        self.client = client
+        self.seconds = seconds
+        self.partial = partial
+        self.read_timeout = client.meta.config.read_timeout
+        self.calls = 0
+        self.misses = {}
+        self.partial_results = 0
+        self.lock = threading.Lock()
+
+        ## Events of the raw client fire for every attempt, including those retried by the wrapped clients
+        client.meta.events.register(
+            "before-send.bedrock-runtime", self._before_send, unique_id="deadline-before-send"
+        )
+        client.meta.events.register(
+            "after-call.bedrock-runtime", self._after_call, unique_id="deadline-after-call"
+        )
+        ## First, so that botocore does not sleep its retry backoff after the deadline
+        client.meta.events.register_first(
+            "needs-retry.bedrock-runtime", self._needs_retry, unique_id="deadline-needs-retry"
+        )
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def _before_send(self, request, **kwargs):
+        deadline = _current_deadline.get()
+        if deadline is None:
+            return
+        remaining = deadline.remaining()
+        if remaining <= 0:
+            raise DeadlineExceededException(
+                f"Deadline of {deadline.seconds:g}s expired before sending the request"
+            )
+        ## Honoured by botocore versions with per-request timeouts, the others keep the client's read timeout
+        context = getattr(request, "context", None)
+        if context is not None:
+            context["read_timeout"] = max(MIN_READ_TIMEOUT_SECONDS, min(remaining, self.read_timeout))
+
+    def _needs_retry(self, caught_exception=None, **kwargs):
+        deadline = _current_deadline.get()
+        if caught_exception is not None and deadline is not None and deadline.expired():
+            raise DeadlineExceededException(f"Deadline of {deadline.seconds:g}s expired") from caught_exception
+
+    def _after_call(self, http_response, **kwargs):
+        deadline = _current_deadline.get()
+        if deadline is not None:
+            deadline.response = getattr(http_response, "raw", None)
+
+    def _missed(self, model_id, phase, deadline):
+        with self.lock:
+            key = (model_id, phase)
+            self.misses[key] = self.misses.get(key, 0) + 1
+            if phase == PHASE_STREAM and self.partial == PARTIAL_RETURN:
+                self.partial_results += 1
+        message = f"Deadline of {deadline.seconds:g}s exceeded for {model_id} ({phase})"
+        logger.warning(message)
+        return message
+
+    def _call(self, method, modelId, kwargs):
+        ## A new Deadline per call, which holds the response of this call only
+        deadline = Deadline(self.seconds)
+        outer = _current_deadline.get()
+        if outer is not None and outer.expires_at < deadline.expires_at:
+            deadline = Deadline(outer.seconds, outer.expires_at)
+        with self.lock:
+            self.calls += 1
+        if deadline.expired():
+            raise DeadlineExceededException(self._missed(modelId, PHASE_NOT_SENT, deadline))
+
+        token = _current_deadline.set(deadline)
+        try:
+            return deadline, method(modelId=modelId, **kwargs)
+        except Exception as err:
+            if not deadline.expired():
+                raise
+            raise DeadlineExceededException(self._missed(modelId, PHASE_RESPONSE, deadline)) from err
+        finally:
+            _current_deadline.reset(token)
+
+    def invoke_model(self, modelId, **kwargs):
+        return self._call(self.client.invoke_model, modelId, kwargs)[1]
+
+    def invoke_model_with_response_stream(self, modelId, **kwargs):
+        deadline, output = self._call(self.client.invoke_model_with_response_stream, modelId, kwargs)
+        output["body"] = _DeadlineStream(output["body"], deadline, modelId, self)
+        return output
+
+    def stats(self):
+        with self.lock:
+            misses = {}
+            for (model_id, phase), count in self.misses.items():
+                misses.setdefault(model_id, {})[phase] = count
+            missed = sum(self.misses.values())
+            return dict(
+                calls=self.calls,
+                missed=missed,
+                miss_rate=missed / self.calls if self.calls else 0.0,
+                partial_results=self.partial_results,
+                misses=misses,
+            )
+
+    def log_stats(self):
+        stats = self.stats()
+        logger.info(
+            f"Deadlines: calls={stats['calls']} missed={stats['missed']} miss_rate={stats['miss_rate']:.2%} "
+            f"partial_results={stats['partial_results']}"
+        )
@@ -0,0 +1,354 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import time
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from model_invocation.families import family_of
+from retrieval.vector_store import VectorStore
+from utils.token_estimator import TokenEstimator, text_features
+
+## Instantiate Logger
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+# Ingestion Default Values
+CHUNK_TOKENS = 256
+OVERLAP_TOKENS = 32
+BATCH_SIZE = 32
+CONCURRENCY = 4
+TEXT_EXTENSIONS = (".txt", ".md", ".rst")
+TEXT_FIELD = "text"
+PROGRESS_INTERVAL_SECONDS = 30.0
+## Paragraphs are cut at this size even without a blank line, so that a single line does not fill memory
+MAX_PARAGRAPH_CHARS = 65536
+
+
+def chunk_digest(text):
+    """
+    Hash of the normalized text of a chunk, equal for exact duplicates (whitespace ignored)
+    """
+    return hashlib.sha256(" ".join(text.split()).encode()).hexdigest()
+
+
+def _paragraphs(lines):
+    """
+    Group lines into paragraphs separated by blank lines
+    """
+    paragraph, size = [], 0
+    for line in lines:
+        if not line.strip():
+            if paragraph:
+                yield "".join(paragraph)
+                paragraph, size = [], 0
+            continue
+        paragraph.append(line)
+        size += len(line)
+        if size >= MAX_PARAGRAPH_CHARS:
+            yield "".join(paragraph)
+            paragraph, size = [], 0
+    if paragraph:
+        yield "".join(paragraph)
+
+
+class Chunker:
+    """
+    Split text into chunks of at most `max_tokens` estimated tokens of the embedding model, on paragraph
+    boundaries when possible and on word boundaries otherwise, each chunk repeating the last
+    `overlap_tokens` of the previous one when a paragraph had to be split.
+    """
+
+    def __init__(self, model_id, estimator=None, max_tokens=CHUNK_TOKENS, overlap_tokens=OVERLAP_TOKENS) -> None:
+        estimator = estimator or TokenEstimator()
+        ## The coefficients are fixed for the run, so that chunking does not solve the estimator for every paragraph
+        self.coefficients = estimator.coefficients(model_id)
+        self.max_tokens = min(max_tokens, family_of(model_id)["context_window"])
+        self.overlap_tokens = min(overlap_tokens, self.max_tokens // 2)
+
+    def tokens(self, text):
+        a, b, c = self.coefficients
+        chars, words, _ = text_features(text)
+        return a * chars + b * words + c
+
+    def _split(self, paragraph):
+        """
+        Cut an oversize paragraph into overlapping windows of words
+        """
+        words = paragraph.split()
+        tokens_per_word = self.tokens(paragraph) / max(1, len(words))
+        window = max(1, int(self.max_tokens / tokens_per_word))
+        step = max(1, window - int(self.overlap_tokens / tokens_per_word))
+        for start in range(0, len(words), step):
+            yield " ".join(words[start : start + window])
+            if start + window >= len(words):
+                break
+
+    def chunks(self, paragraphs):
+        """
+        Yield the chunks of an iterable of paragraphs
+        """
+        current, current_tokens = [], 0.0
+        for paragraph in paragraphs:
+            paragraph = paragraph.strip()
+            tokens = self.tokens(paragraph)
+            if current and current_tokens + tokens > self.max_tokens:
+                yield "\n\n".join(current)
+                current, current_tokens = [], 0.0
+            if tokens > self.max_tokens:
+                yield from self._split(paragraph)
+                continue
+            current.append(paragraph)
+            current_tokens += tokens
+        if current:
+            yield "\n\n".join(current)
+
+
+def file_signature(path):
+    """
+    Size and modification time of a file, which tell whether it changed since it was ingested
+    """
+    stat = os.stat(path)
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def iter_documents(source, text_field=TEXT_FIELD):
+    """
+    Stream the documents of a source: (document id, signature, iterator of paragraphs).
+
+        1. A directory: every text file below it (.txt, .md, .rst), in a stable order
+        2. A JSONL file: one document per line, its text in `text_field` and its id in "id" (or the line number)
+
+    The signature is the file_signature() of a text file, None for the documents of a JSONL file.
+    """
+    if os.path.isdir(source):
+        for root, directories, files in os.walk(source):
+            directories.sort()
+            for name in sorted(files):
+                if not name.endswith(TEXT_EXTENSIONS):
+                    continue
+                path = os.path.join(root, name)
+                with open(path, encoding="utf-8", errors="replace") as file:
+                    yield path, file_signature(path), _paragraphs(file)
+        return
+
+    with open(source, encoding="utf-8") as file:
+        for number, line in enumerate(file, start=1):
+            if not line.strip():
+                continue
+            document = json.loads(line)
+            document_id = f"{source}#{document.get('id', number)}"
+            ## Documents of a JSONL source are resumed by digest, only the file as a whole has a signature
+            yield document_id, None, _paragraphs(document.get(text_field, "").splitlines(keepends=True))
+
+
+class IngestionPipeline:
+    """
+    --> Streaming ingestion of a corpus into a VectorStore:
+
+        source --> paragraphs --> token bounded chunks --> exact dedupe --> batches --> concurrent embedding
+        --> vectors and metadata appended to disk
+
+    1. Memory is bounded: files are read as streams of paragraphs, and at most `concurrency * 2`
+       batches of `batch_size` chunks are in flight.
+    2. Exact duplicates (same normalized text) are skipped, against the store and the batches in flight.
+    3. Resumable: sources ingested completely are skipped when unchanged, and the chunks of an interrupted
+       source are recognized by their digests, so a restart only embeds what is not stored yet.
+
+    The embedder is one of the embedding classes (AmazonTitanEmbeddeing or CohereEmbeddeing), called with
+    embed(texts, model_id=..., **embed_arguments), e.g. input_type="search_document" for Cohere.
+    With a rate limited client (see scheduling.scheduler) the throughput is bounded by the embedding quota
+    rather than by the pipeline.
+    """
+
+    def __init__(
+        self,
+        embedder,
+        store,
+        model_id,
+        chunker=None,
+        batch_size=BATCH_SIZE,
+        concurrency=CONCURRENCY,
+        progress_interval_seconds=PROGRESS_INTERVAL_SECONDS,
+        embed_arguments=None,
+    ) -> None:
+        self.embedder = embedder
+        self.embed_arguments = embed_arguments or {}
+        self.store = store
+        self.model_id = model_id
+        self.chunker = chunker or Chunker(model_id)
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.progress_interval_seconds = progress_interval_seconds
+
+        self.in_flight_digests = set()
+        self.documents = 0
+        self.chunks = 0
+        self.duplicates = 0
+        self.embedded = 0
+        self.skipped_sources = 0
+        self.started_at = None
+        self.last_progress = 0.0
+
+    def _embed(self, batch):
+        vectors = self.embedder.embed(
+            [record["text"] for record in batch], model_id=self.model_id, **self.embed_arguments
+        )
+        return vectors, batch
+
+    def _batches(self, source, text_field):
+        """
+        Yield batches of new chunk records, marking each source done once all its batches are stored
+        """
+        batch = []
+        jsonl_signature = None if os.path.isdir(source) else file_signature(source)
+        if jsonl_signature is not None and self.store.source_done(source, jsonl_signature):
+            self.skipped_sources += 1
+            return
+
+        for document_id, signature, paragraphs in iter_documents(source, text_field):
+            if signature is not None and self.store.source_done(document_id, signature):
+                self.skipped_sources += 1
+                continue
+
+            self.documents += 1
+            for number, text in enumerate(self.chunker.chunks(paragraphs)):
+                self.chunks += 1
+                digest = chunk_digest(text)
+                if digest in self.in_flight_digests or self.store.contains(digest):
+                    self.duplicates += 1
+                    continue
+                self.in_flight_digests.add(digest)
+                batch.append(dict(digest=digest, source=document_id, chunk=number, text=text))
+                if len(batch) == self.batch_size:
+                    yield batch, None
+                    batch = []
+            if signature is not None:
+                yield batch, (document_id, signature)
+                batch = []
+        if batch or jsonl_signature is not None:
+            yield batch, None if jsonl_signature is None else (source, jsonl_signature)
+
+    def run(self, source, text_field=TEXT_FIELD):
+        """
+        Ingest a directory or JSONL file, return the progress counters
+        """
+        self.started_at = time.monotonic()
+        self.last_progress = self.started_at
+        ## Sources are marked done once every batch submitted before their marker is stored
+        markers = []
+
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="ingestion") as executor:
+            in_flight = {}
+            submitted = 0
+
+            def drain(block):
+                done, _ = wait(in_flight, return_when=ALL_COMPLETED if block else FIRST_COMPLETED)
+                for future in done:
+                    in_flight.pop(future)
+                    self._store(*future.result())
+                oldest = min(in_flight.values(), default=submitted)
+                while markers and markers[0][0] <= oldest:
+                    self.store.mark_source_done(*markers.pop(0)[1])
+
+            for batch, marker in self._batches(source, text_field):
+                if batch:
+                    in_flight[executor.submit(self._embed, batch)] = submitted
+                    submitted += 1
+                if marker is not None:
+                    markers.append((submitted, marker))
+                if len(in_flight) >= self.concurrency * 2:
+                    drain(block=False)
+            while in_flight:
+                drain(block=True)
+            while markers:
+                self.store.mark_source_done(*markers.pop(0)[1])
+
+        self.log_progress()
+        return self.progress()
+
+    def _store(self, vectors, batch):
+        self.store.append(vectors, batch)
+        self.in_flight_digests.difference_update(record["digest"] for record in batch)
+        self.embedded += len(batch)
+
+        now = time.monotonic()
+        if now - self.last_progress >= self.progress_interval_seconds:
+            self.last_progress = now
+            self.log_progress()
+
+    def progress(self):
+        elapsed = time.monotonic() - self.started_at if self.started_at else 0.0
+        return dict(
+            documents=self.documents,
+            chunks=self.chunks,
+            duplicates=self.duplicates,
+            embedded=self.embedded,
+            skipped_sources=self.skipped_sources,
+            stored=len(self.store),
+            chunks_per_second=self.embedded / elapsed if elapsed else 0.0,
+        )
+
+    def log_progress(self):
+        progress = self.progress()
+        logger.info(
+            f"Ingestion progress: documents={progress['documents']} chunks={progress['chunks']} "
+            f"duplicates={progress['duplicates']} embedded={progress['embedded']} "
+            f"skipped_sources={progress['skipped_sources']} stored={progress['stored']} "
+            f"rate={progress['chunks_per_second']:.2f}/s"
+        )
+
+
+def main():
+    from model_invocation.embedding.amazon_titan import MODEL_ID_TITAN, AmazonTitanEmbeddeing
+    from model_invocation.embedding.cohere import MODEL_ID_COHERE, CohereEmbeddeing
+    from utils.client_factory import PROFILE_NAME, BedrockClientFactory
+
+    parser = argparse.ArgumentParser(description="Chunk, dedupe, embed and store a corpus")
+    parser.add_argument("source", help="Directory of text files or JSONL file")
+    parser.add_argument("store", help="Vector store directory")
+    parser.add_argument("--embedder", choices=("titan", "cohere"), default="titan")
+    parser.add_argument("--model-id")
+    parser.add_argument("--text-field", default=TEXT_FIELD)
+    parser.add_argument("--chunk-tokens", type=int, default=CHUNK_TOKENS)
+    parser.add_argument("--overlap-tokens", type=int, default=OVERLAP_TOKENS)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY)
+    parser.add_argument("--profile", default=PROFILE_NAME, help='AWS profile, "" for the default credential chain')
+    parser.add_argument("--region")
+    parser.add_argument("--endpoint-url")
+    args = parser.parse_args()
+
+    client_factory = BedrockClientFactory(
+        profile_name=args.profile or None,
+        region_name=args.region,
+        endpoint_url=args.endpoint_url,
+        max_pool_connections=args.concurrency,
+    )
+    runtime_client = client_factory.runtime_client()
+    if args.embedder == "cohere":
+        embedder, model_id = CohereEmbeddeing(runtime_client), args.model_id or MODEL_ID_COHERE
+        embed_arguments = dict(input_type="search_document")
+    else:
+        embedder, model_id = AmazonTitanEmbeddeing(runtime_client), args.model_id or MODEL_ID_TITAN
+        embed_arguments = None
+
+    store = VectorStore(args.store)
+    try:
+        pipeline = IngestionPipeline(
+            embedder,
+            store,
+            model_id,
+            chunker=Chunker(model_id, max_tokens=args.chunk_tokens, overlap_tokens=args.overlap_tokens),
+            batch_size=args.batch_size,
+            concurrency=args.concurrency,
+            embed_arguments=embed_arguments,
+        )
+        pipeline.run(args.source, args.text_field)
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
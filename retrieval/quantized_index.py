@@ -0,0 +1,212 @@
+import logging
+
+import numpy as np
+
+from model_invocation.families import family_of
+
+## Instantiate Logger
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+# Quantized Index Default Values
+QUANTIZATION_MODES = ("float32", "int8", "binary")
+## Candidates scored by the quantized codes for every result re-ranked with float vectors
+RERANK_FACTOR = 8
+INITIAL_CAPACITY = 1024
+## Rows of int8 codes converted to float32 at a time, so that the products run as BLAS float32 kernels
+SCORE_BLOCK_ROWS = 8192
+
+## Number of set bits of every byte value, to count the bits of XORed binary codes
+_POPCOUNT = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+
+
+def normalize(vectors):
+    """
+    Scale float vectors (one per row) to unit length, so that the dot product is the cosine similarity
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def quantize_int8(vectors):
+    """
+    Symmetric int8 quantization with one scale per vector: return (codes, scales), vector ~= codes * scale
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    scales = np.abs(vectors).max(axis=-1) / 127
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def quantize_binary(vectors):
+    """
+    One sign bit per dimension, packed 8 dimensions per byte
+    """
+    return np.packbits(np.asarray(vectors) > 0, axis=-1)
+
+
+def native_embedding_type(model_id, mode):
+    """
+    Compressed embedding type the model returns natively for a quantization mode, or None:
+
+        1. cohere.embed-*-v3: int8 and ubinary (packed sign bits)
+        2. amazon.titan-embed-text-v2: binary (one 0/1 value per dimension)
+    """
+    if mode == "float32":
+        return None
+    if family_of(model_id)["name"] == "cohere-embed" and model_id.split(":")[0].endswith("v3"):
+        return "int8" if mode == "int8" else "ubinary"
+    if model_id.startswith("amazon.titan-embed-text-v2") and mode == "binary":
+        return "binary"
+    return None
+
+
+def embed_quantized(embedder, texts, model_id, mode, keep_float=False):
+    """
+    Embed texts into the codes of a quantization mode, using the compressed embedding type of the model
+    when it has one and quantizing float embeddings locally otherwise.
+
+    Return (codes, scales, floats): scales is None for binary codes, floats (unit length float32) is None
+    unless keep_float is set, e.g. to store them on disk for re-ranking.
+    """
+    embedding_type = native_embedding_type(model_id, mode)
+    if embedding_type is None:
+        floats = normalize(embedder.embed(texts, model_id=model_id))
+        if mode == "float32":
+            return floats, None, floats
+        if mode == "int8":
+            codes, scales = quantize_int8(floats)
+        else:
+            codes, scales = quantize_binary(floats), None
+        return codes, scales, floats if keep_float else None
+
+    embedding_types = [embedding_type, "float"] if keep_float else [embedding_type]
+    embeddings = embedder.embed(texts, model_id=model_id, embedding_types=embedding_types)
+    floats = normalize(embeddings["float"]) if keep_float else None
+    values = np.asarray(embeddings[embedding_type])
+    if embedding_type == "int8":
+        ## Cohere calibrates int8 codes globally, a single scale fits every vector
+        return values.astype(np.int8), np.ones(len(values), dtype=np.float32), floats
+    if embedding_type == "binary":
+        return np.packbits(values > 0, axis=-1), None, floats
+    return values.astype(np.uint8), None, floats
+
+
+class QuantizedIndex:
+    """
+    --> In-memory vector index over quantized codes:
+
+    1. float32: 4 bytes per dimension, exact cosine similarity (baseline)
+    2. int8: 1 byte per dimension, score = (codes . query) * scale, with the float query
+    3. binary: 1 bit per dimension, score = -(hamming distance) between the sign bits of vector and query
+
+    Search is a single vectorized pass over the code matrix. When float vectors are attached with
+    attach_float_vectors() (e.g. a numpy memmap of the float32 vectors on disk, so that they do not
+    take memory), the best k * rerank_factor candidates of the codes are re-ranked by exact cosine similarity.
+
+    Rows are numbered in insertion order, the optional ids given to add() are returned by search().
+    """
+
+    def __init__(self, dimensions, mode="int8", rerank_factor=RERANK_FACTOR) -> None:
+        if mode not in QUANTIZATION_MODES:
+            raise ValueError(f"Unsupported quantization mode: {mode}. Values: {QUANTIZATION_MODES}")
+        self.dimensions = dimensions
+        self.mode = mode
+        self.rerank_factor = rerank_factor
+
+        width = (dimensions + 7) // 8 if mode == "binary" else dimensions
+        dtype = dict(float32=np.float32, int8=np.int8, binary=np.uint8)[mode]
+        self.codes = np.empty((INITIAL_CAPACITY, width), dtype=dtype)
+        self.scales = np.empty(INITIAL_CAPACITY, dtype=np.float32)
+        self.ids = []
+        self.float_vectors = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, codes, scales=None, ids=None):
+        """
+        Append quantized codes (as returned by embed_quantized, or quantize_*), one row per vector
+        """
+        codes = np.atleast_2d(codes)
+        size, count = len(self.ids), len(codes)
+        if size + count > self.codes.shape[0]:
+            grown = max(size + count, self.codes.shape[0] * 2)
+            self.codes = np.resize(self.codes, (grown, self.codes.shape[1]))
+            self.scales = np.resize(self.scales, grown)
+
+        self.codes[size : size + count] = codes
+        self.scales[size : size + count] = 1.0 if scales is None else scales
+        self.ids.extend(range(size, size + count) if ids is None else ids)
+
+    def add_float(self, vectors, ids=None):
+        """
+        Quantize float vectors locally and append them
+        """
+        vectors = normalize(np.atleast_2d(vectors))
+        if self.mode == "float32":
+            self.add(vectors, ids=ids)
+        elif self.mode == "int8":
+            self.add(*quantize_int8(vectors), ids=ids)
+        else:
+            self.add(quantize_binary(vectors), ids=ids)
+
+    def attach_float_vectors(self, vectors):
+        """
+        Unit length float32 vectors, row for row with the codes, used to re-rank the quantized candidates
+        """
+        self.float_vectors = vectors
+
+    def memory_bytes(self):
+        """
+        Bytes used by the codes (and scales) of the vectors added
+        """
+        size = len(self.ids)
+        scales = size * self.scales.itemsize if self.mode == "int8" else 0
+        return size * self.codes.shape[1] * self.codes.itemsize + scales
+
+    def scores(self, query):
+        """
+        Score of every row for a unit length float32 query, higher is better
+        """
+        size = len(self.ids)
+        codes = self.codes[:size]
+        if self.mode == "float32":
+            return codes @ query
+        if self.mode == "int8":
+            scores = np.empty(size, dtype=np.float32)
+            for start in range(0, size, SCORE_BLOCK_ROWS):
+                block = codes[start : start + SCORE_BLOCK_ROWS]
+                scores[start : start + len(block)] = block.astype(np.float32) @ query
+            return scores * self.scales[:size]
+        distances = _POPCOUNT[np.bitwise_xor(codes, quantize_binary(query))].sum(axis=1, dtype=np.int32)
+        return -distances
+
+    def search(self, query, k=10, rerank=None):
+        """
+        Return the ids and scores of the k rows closest to a float query vector.
+        rerank defaults to True when float vectors are attached.
+        """
+        query = normalize(query)
+        rerank = self.float_vectors is not None if rerank is None else rerank
+        if rerank and self.float_vectors is None:
+            raise ValueError("Re-ranking needs float vectors, see attach_float_vectors()")
+
+        scores = self.scores(query)
+        candidates = min(len(scores), k * self.rerank_factor if rerank else k)
+        if candidates == 0:
+            return [], np.empty(0, dtype=np.float32)
+        rows = np.argpartition(-scores, candidates - 1)[:candidates]
+
+        if rerank:
+            ## Sorted rows read the memmap sequentially
+            rows = np.sort(rows)
+            scores = np.asarray(self.float_vectors[rows], dtype=np.float32) @ query
+            order = np.argsort(-scores)[:k]
+        else:
+            scores = scores[rows]
+            order = np.argsort(-scores, kind="stable")[:k]
+        rows, scores = rows[order], scores[order]
+        return [self.ids[row] for row in rows], scores
@@ -0,0 +1,188 @@
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from model_invocation.families import family_of
+from retrieval.quantized_index import normalize
+from utils.token_estimator import TokenEstimator
+
+## Instantiate Logger
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+# Retrieval Default Values
+TOP_K = 8
+## Candidates retrieved for MMR to choose the top k from
+FETCH_K = 32
+## 1.0 ranks by relevance only, lower values favour passages unlike the ones already selected
+MMR_LAMBDA = 0.7
+## Candidates at least this similar to a selected passage are near duplicates
+DUPLICATE_SIMILARITY = 0.95
+CONTEXT_TOKENS = 1500
+CACHE_ENTRIES = 256
+INDEX_MODE = "int8"
+
+
+def mmr(query, vectors, k, mmr_lambda=MMR_LAMBDA, duplicate_similarity=DUPLICATE_SIMILARITY):
+    """
+    Maximal marginal relevance: pick k of the unit length candidate vectors, each maximizing
+    lambda * similarity to the query - (1 - lambda) * max similarity to the ones already picked.
+    Near duplicates of a picked vector are never picked. Return the positions of the picked vectors, in order.
+    """
+    relevance = vectors @ query
+    similarity = vectors @ vectors.T
+    picked = []
+    redundancy = np.full(len(vectors), -np.inf if len(vectors) else 0.0, dtype=np.float32)
+    available = np.ones(len(vectors), dtype=bool)
+    while len(picked) < k and available.any():
+        marginal = mmr_lambda * relevance - (1 - mmr_lambda) * np.maximum(redundancy, 0)
+        marginal[~available] = -np.inf
+        best = int(np.argmax(marginal))
+        picked.append(best)
+        available[best] = False
+        available &= similarity[best] < duplicate_similarity
+        redundancy = np.maximum(redundancy, similarity[best])
+    return picked
+
+
+def format_context(model_id, question, passages):
+    """
+    Prompt text carrying the passages and the question, in the style each family follows best.
+    The generators add the conversation markers (Human/Assistant, [INST]) around it.
+    """
+    family = family_of(model_id)["name"]
+    if family == "claude":
+        documents = "\n".join(
+            f'<document index="{number}">\n{passage}\n</document>' for number, passage in enumerate(passages, start=1)
+        )
+        return (
+            f"Answer the question using the documents below.\n<documents>\n{documents}\n</documents>\n\n"
+            f"Question: {question}"
+        )
+    if family == "llama2":
+        context = "\n\n".join(passages)
+        return f"Use the following context to answer the question.\n\nContext:\n{context}\n\nQuestion: {question}"
+    context = "\n\n".join(f"[{number}] {passage}" for number, passage in enumerate(passages, start=1))
+    return f"Context:\n{context}\n\nBased on the context above, answer the question.\nQuestion: {question}\nAnswer:"
+
+
+class Retriever:
+    """
+    --> Retrieval-augmented generation over a VectorStore (see retrieval.ingestion):
+
+    1. The question is embedded with the embedder of the corpus (Cohere with input_type=search_query)
+    2. fetch_k candidates are retrieved from the quantized index of the store, re-ranked with float vectors
+    3. MMR picks top_k diverse passages, dropping exact and near duplicates
+    4. Passages are packed in MMR order while they fit the token budget of the generation model, so that
+       no input tokens are spent on redundant context
+
+    Retrieval results are cached per question (LRU), so repeated questions cost neither an embedding
+    call nor a search. Until the store has rows (e.g. while the corpus is ingested) no passage is retrieved
+    and the questions are sent as they are.
+    """
+
+    def __init__(
+        self,
+        store,
+        embedder,
+        embedding_model_id,
+        embed_arguments=None,
+        top_k=TOP_K,
+        fetch_k=FETCH_K,
+        mmr_lambda=MMR_LAMBDA,
+        context_tokens=CONTEXT_TOKENS,
+        cache_entries=CACHE_ENTRIES,
+        index_mode=INDEX_MODE,
+        estimator=None,
+    ) -> None:
+        self.store = store
+        self.embedder = embedder
+        self.embedding_model_id = embedding_model_id
+        self.embed_arguments = embed_arguments or {}
+        self.top_k = top_k
+        self.fetch_k = fetch_k
+        self.mmr_lambda = mmr_lambda
+        self.context_tokens = context_tokens
+        self.cache_entries = cache_entries
+        self.index_mode = index_mode
+        self.estimator = estimator or TokenEstimator()
+
+        self.index = None
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if len(store) == 0:
+            logger.warning(f"RAG: the vector store {store.directory} is empty, ingest a corpus first")
+
+    def _current_index(self):
+        ## The store only grows, the index is rebuilt when rows were added since it was built
+        if self.index is None or len(self.index) != len(self.store):
+            self.index = self.store.build_index(self.index_mode)
+        return self.index
+
+    def retrieve(self, question):
+        """
+        Return the metadata records of the top_k diverse passages for a question, most relevant first
+        """
+        if len(self.store) == 0:
+            return []
+        key = (" ".join(question.lower().split()), len(self.store))
+        with self.lock:
+            records = self.cache.get(key)
+            if records is not None:
+                self.cache.move_to_end(key)
+                self.hits += 1
+                return records
+            self.misses += 1
+
+        query = normalize(
+            self.embedder.embed([question], model_id=self.embedding_model_id, **self.embed_arguments)[0]
+        )
+        rows, _ = self._current_index().search(query, self.fetch_k)
+        rows = np.asarray(rows, dtype=np.int64)
+        picked = mmr(query, np.asarray(self.store.vectors()[rows], dtype=np.float32), self.top_k, self.mmr_lambda)
+        records = self.store.records(rows[picked].tolist())
+
+        with self.lock:
+            self.cache[key] = records
+            while len(self.cache) > self.cache_entries:
+                self.cache.popitem(last=False)
+        return records
+
+    def pack(self, model_id, question, records):
+        """
+        Texts of the records which fit the context token budget, in order, skipping the ones which do not fit
+        """
+        budget = min(self.context_tokens, family_of(model_id)["context_window"] // 2)
+        budget -= self.estimator.estimate(model_id, question)
+        passages, seen = [], set()
+        texts = [record["text"] for record in records]
+        for text, tokens in zip(texts, self.estimator.estimate_many(model_id, texts)):
+            if text in seen or tokens > budget:
+                continue
+            seen.add(text)
+            passages.append(text)
+            budget -= int(tokens)
+        return passages
+
+    def augment(self, model_id, question):
+        """
+        Prompt text of a question augmented with the passages retrieved for it, for the generation model
+        """
+        passages = self.pack(model_id, question, self.retrieve(question))
+        logger.info(f"RAG: {len(passages)} passages in context for {model_id}")
+        if not passages:
+            return question
+        return format_context(model_id, question, passages)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return dict(
+            hits=self.hits,
+            misses=self.misses,
+            hit_rate=self.hits / lookups if lookups else 0.0,
+            cached=len(self.cache),
+        )
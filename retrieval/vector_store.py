@@ -0,0 +1,186 @@
+import json
+import logging
+import os
+import sqlite3
+from array import array
+
+import numpy as np
+
+from retrieval.quantized_index import QuantizedIndex, normalize
+
+## Instantiate Logger
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+# Vector Store Files
+VECTORS_FILE = "vectors.f32"
+METADATA_FILE = "metadata.jsonl"
+STATE_FILE = "state.sqlite"
+## Rows quantized at a time when an index is built from the vectors on disk
+INDEX_BLOCK_ROWS = 65536
+
+
+class VectorStore:
+    """
+    --> Append-only vector store on disk, in a directory:
+
+        1. vectors.f32: unit length float32 vectors, one row after the other (read back as a numpy memmap)
+        2. metadata.jsonl: one JSON record per row ({"row", "digest", "source", "chunk", "text", ...})
+        3. state.sqlite: digests of the stored chunks (exact duplicate detection) and the sources
+           ingested completely, so that an interrupted ingestion resumes where it stopped
+
+    Vectors and metadata are appended and flushed batch by batch, then the digests are committed.
+    On open, rows present in only one of the two files (crash in the middle of a batch) are truncated, and
+    the digests of complete rows whose commit was lost (crash after the flush) are restored from their
+    metadata, so the store always holds complete rows and their digests: a resumed ingestion stores
+    every chunk once.
+    """
+
+    def __init__(self, directory, dimensions=None) -> None:
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.vectors_path = os.path.join(directory, VECTORS_FILE)
+        self.metadata_path = os.path.join(directory, METADATA_FILE)
+
+        self.state = sqlite3.connect(os.path.join(directory, STATE_FILE), check_same_thread=False)
+        self.state.execute("PRAGMA journal_mode=WAL")
+        self.state.execute("CREATE TABLE IF NOT EXISTS chunks (digest TEXT PRIMARY KEY, row INTEGER)")
+        self.state.execute("CREATE TABLE IF NOT EXISTS sources (source TEXT PRIMARY KEY, signature TEXT)")
+        self.state.execute("CREATE TABLE IF NOT EXISTS settings (name TEXT PRIMARY KEY, value TEXT)")
+        self.state.commit()
+
+        stored = self.state.execute("SELECT value FROM settings WHERE name = 'dimensions'").fetchone()
+        self.dimensions = int(stored[0]) if stored else dimensions
+        self.rows = 0
+        ## Byte offset of every metadata line, 8 bytes per row
+        self.offsets = array("q")
+        if self.dimensions is not None:
+            self._recover()
+
+        self.vectors_file = open(self.vectors_path, "ab")
+        self.metadata_file = open(self.metadata_path, "ab")
+        self._vectors = None
+
+    def __len__(self):
+        return self.rows
+
+    def _recover(self):
+        """
+        Index the metadata lines and truncate both files to the rows complete in both
+        """
+        row_bytes = self.dimensions * 4
+        vector_rows = os.path.getsize(self.vectors_path) // row_bytes if os.path.exists(self.vectors_path) else 0
+
+        offsets, valid_size = array("q"), 0
+        if os.path.exists(self.metadata_path):
+            with open(self.metadata_path, "rb") as file:
+                for line in file:
+                    if not line.endswith(b"\n") or len(offsets) == vector_rows:
+                        break
+                    offsets.append(valid_size)
+                    valid_size += len(line)
+
+        self.rows = len(offsets)
+        self.offsets = offsets
+        if os.path.exists(self.vectors_path):
+            os.truncate(self.vectors_path, self.rows * row_bytes)
+        if os.path.exists(self.metadata_path):
+            os.truncate(self.metadata_path, valid_size)
+        deleted = self.state.execute("DELETE FROM chunks WHERE row >= ?", (self.rows,)).rowcount
+        if deleted:
+            ## The sources are scanned again, their stored chunks are skipped by digest
+            self.state.execute("DELETE FROM sources")
+            logger.info(f"Vector store {self.directory}: dropped {deleted} rows of an incomplete batch")
+
+        ## Rows are appended in order and their digests committed after them: the rows beyond the last one
+        ## committed were flushed to both files before a crash, their digests are in their metadata
+        committed = self.state.execute("SELECT COALESCE(MAX(row) + 1, 0) FROM chunks").fetchone()[0]
+        if committed < self.rows:
+            with open(self.metadata_path, "rb") as file:
+                file.seek(offsets[committed])
+                digests = [(json.loads(file.readline())["digest"], row) for row in range(committed, self.rows)]
+            self.state.executemany("INSERT OR IGNORE INTO chunks VALUES (?, ?)", digests)
+            logger.info(f"Vector store {self.directory}: restored the digests of {len(digests)} uncommitted rows")
+        self.state.commit()
+
+    def contains(self, digest):
+        return self.state.execute("SELECT 1 FROM chunks WHERE digest = ?", (digest,)).fetchone() is not None
+
+    def source_done(self, source, signature):
+        row = self.state.execute("SELECT signature FROM sources WHERE source = ?", (source,)).fetchone()
+        return row is not None and row[0] == signature
+
+    def mark_source_done(self, source, signature):
+        self.state.execute("INSERT OR REPLACE INTO sources VALUES (?, ?)", (source, signature))
+        self.state.commit()
+
+    def append(self, vectors, records):
+        """
+        Append unit length vectors with their metadata records (each carrying its "digest")
+        """
+        vectors = normalize(vectors)
+        if self.dimensions is None:
+            self.dimensions = vectors.shape[1]
+            self.state.execute("INSERT INTO settings VALUES ('dimensions', ?)", (str(self.dimensions),))
+            ## Committed before any row is written, so that a crash in the first batch is recovered on open
+            self.state.commit()
+        elif vectors.shape[1] != self.dimensions:
+            raise ValueError(f"Vector store holds {self.dimensions} dimensions, got {vectors.shape[1]}")
+
+        lines = []
+        offset = self.metadata_file.tell()
+        for row, record in enumerate(records, start=self.rows):
+            line = (json.dumps(dict(record, row=row), ensure_ascii=False) + "\n").encode()
+            self.offsets.append(offset)
+            offset += len(line)
+            lines.append(line)
+
+        self.vectors_file.write(vectors.tobytes())
+        self.vectors_file.flush()
+        self.metadata_file.write(b"".join(lines))
+        self.metadata_file.flush()
+        self.state.executemany(
+            "INSERT OR IGNORE INTO chunks VALUES (?, ?)",
+            [(record["digest"], row) for row, record in enumerate(records, start=self.rows)],
+        )
+        self.state.commit()
+        self.rows += len(records)
+        self._vectors = None
+
+    def vectors(self):
+        """
+        All vectors as a read-only memmap (rows x dimensions float32), which stays on disk
+        """
+        if self.rows == 0:
+            return np.empty((0, self.dimensions or 0), dtype=np.float32)
+        if self._vectors is None or len(self._vectors) != self.rows:
+            self._vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(self.rows, self.dimensions))
+        return self._vectors
+
+    def records(self, rows):
+        """
+        Metadata records of some rows
+        """
+        records = []
+        with open(self.metadata_path, "rb") as file:
+            for row in rows:
+                file.seek(self.offsets[row])
+                records.append(json.loads(file.readline()))
+        return records
+
+    def build_index(self, mode="int8", rerank=True):
+        """
+        QuantizedIndex over the stored vectors, quantized block by block, re-ranking against the memmap
+        """
+        index = QuantizedIndex(self.dimensions, mode)
+        vectors = self.vectors()
+        for start in range(0, self.rows, INDEX_BLOCK_ROWS):
+            index.add_float(vectors[start : start + INDEX_BLOCK_ROWS])
+        if rerank:
+            index.attach_float_vectors(vectors)
+        return index
+
+    def close(self):
+        self.vectors_file.close()
+        self.metadata_file.close()
+        self.state.close()
@@ -0,0 +1,427 @@
+import contextvars
+import heapq
+import itertools
+import json
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+
+from model_invocation.families import prompt_of, max_tokens_of
+from resilience.deadline import current_deadline
+from utils.exception_handler import DeadlineExceededException
+from utils.token_estimator import (
+    INPUT_TOKEN_HEADER,
+    OUTPUT_TOKEN_HEADER,
+    ObservedStream,
+    TokenEstimator,
+)
+
+## Instantiate Logger
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+# Scheduler Default Values
+REQUESTS_PER_MINUTE = 60
+TOKENS_PER_MINUTE = 100000
+WINDOW_SECONDS = 60.0
+MAX_WORKERS = 16
+
+# Priorities: lower value is admitted first
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 5
+PRIORITY_BATCH = 10
+
+# Adaptive rate on throttling: multiplicative decrease, slow recovery towards the configured budget
+THROTTLE_DECREASE = 0.7
+SUCCESS_INCREASE = 1.02
+MIN_RATE_FACTOR = 0.1
+THROTTLE_PAUSE_SECONDS = 1.0
+THROTTLING_ERROR_CODES = ("ThrottlingException", "TooManyRequestsException")
+
+## Reservation admitted by submit(), picked up by ScheduledClient to avoid a second admission
+_current_reservation = contextvars.ContextVar("current_reservation", default=None)
+## Seconds the invocations of the current context waited for admission, in total
+_admission_seconds = contextvars.ContextVar("admission_seconds", default=0.0)
+
+
+def admission_seconds():
+    """
+    Seconds the invocations of the current thread (or task) waited for admission so far: the wrappers around
+    a ScheduledClient (e.g. circuit breakers) take the difference over a call out of its latency
+    """
+    return _admission_seconds.get()
+
+
+class _SlidingWindow:
+    """
+    Amounts consumed over the last window_seconds, as a queue of [timestamp, amount] entries
+    """
+
+    def __init__(self, window_seconds) -> None:
+        self.window_seconds = window_seconds
+        self.entries = deque()
+        self.total = 0
+
+    def _prune(self, now):
+        while self.entries and self.entries[0][0] <= now - self.window_seconds:
+            self.total -= self.entries.popleft()[1]
+
+    def add(self, amount, now):
+        entry = [now, amount]
+        self.entries.append(entry)
+        self.total += amount
+        return entry
+
+    def adjust(self, entry, amount):
+        ## Entries which already left the window no longer count towards the total
+        if self.entries and entry[0] >= self.entries[0][0]:
+            self.total += amount - entry[1]
+        entry[1] = amount
+
+    def usage(self, now):
+        self._prune(now)
+        return self.total
+
+    def wait_time(self, amount, limit, now):
+        """
+        Seconds until `amount` more fits under `limit`. An amount larger than the limit is admitted
+        into an empty window so that it can never starve.
+        """
+        self._prune(now)
+        excess = self.total + amount - limit
+        if excess <= 0 or not self.entries:
+            return 0.0
+
+        released = 0
+        for timestamp, entry_amount in self.entries:
+            released += entry_amount
+            if released >= excess:
+                return timestamp + self.window_seconds - now
+        return self.entries[-1][0] + self.window_seconds - now
+
+
+class Reservation:
+    """
+    Budget admitted for one invocation, reconciled with the actual token usage once known
+    """
+
+    def __init__(self, model_id, tokens) -> None:
+        self.model_id = model_id
+        self.tokens = tokens
+        self.admitted_at = None
+        self.token_entry = None
+
+
+class _Ticket:
+    def __init__(self, reservation, on_admit) -> None:
+        self.reservation = reservation
+        self.on_admit = on_admit
+
+
+class _ModelState:
+    def __init__(self, requests_per_minute, tokens_per_minute, window_seconds) -> None:
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.requests = _SlidingWindow(window_seconds)
+        self.tokens = _SlidingWindow(window_seconds)
+        self.waiting = []
+        self.rate_factor = 1.0
+        self.paused_until = 0.0
+
+    def wait_time(self, tokens, now):
+        return max(
+            self.paused_until - now,
+            self.requests.wait_time(
+                1, max(1, int(self.requests_per_minute * self.rate_factor)), now
+            ),
+            self.tokens.wait_time(
+                tokens, max(1, int(self.tokens_per_minute * self.rate_factor)), now
+            ),
+        )
+
+
+class TokenRateScheduler:
+    """
+    --> Requests-per-minute and tokens-per-minute aware scheduler:
+
+    Amazon Bedrock enforces quotas per model as requests per minute (RPM) and tokens per minute (TPM).
+    Every invocation is admitted against sliding windows of both budgets for its modelId, using the
+    estimated input tokens plus the requested max tokens, and reconciled with the actual usage afterwards.
+    Waiting work is kept in a priority queue per model, so large batches drain at the sustainable rate
+    while interactive requests with a higher priority are admitted first.
+
+    --> Usage:
+
+        1. acquire(model_id, tokens, priority, timeout):
+        Block until the invocation is admitted, returns a Reservation; bounded by the current deadline.
+
+        2. submit(model_id, tokens, fn, *args, priority):
+        Queue fn(*args) for execution once admitted, returns a Future.
+
+        3. reconcile(reservation, actual_tokens):
+        Replace the estimated tokens of a reservation with the reported usage.
+
+        4. throttled(model_id) / succeeded(model_id):
+        Adapt the admitted rate when Amazon Bedrock still throttles (e.g. shared account quotas).
+    """
+
+    def __init__(
+        self,
+        budgets=None,
+        requests_per_minute=REQUESTS_PER_MINUTE,
+        tokens_per_minute=TOKENS_PER_MINUTE,
+        window_seconds=WINDOW_SECONDS,
+        max_workers=MAX_WORKERS,
+    ) -> None:
+        self.budgets = dict(budgets or {})
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.window_seconds = window_seconds
+        self.max_workers = max_workers
+
+        self.models = {}
+        self.sequence = itertools.count()
+        self.condition = threading.Condition()
+        self.executor = None
+        self.in_flight = 0
+        self.running = True
+
+        self.dispatcher = threading.Thread(
+            target=self._dispatch, name="token-rate-scheduler", daemon=True
+        )
+        self.dispatcher.start()
+
+    def set_budget(self, model_id, requests_per_minute, tokens_per_minute):
+        with self.condition:
+            self.budgets[model_id] = (requests_per_minute, tokens_per_minute)
+            state = self.models.get(model_id)
+            if state is not None:
+                state.requests_per_minute = requests_per_minute
+                state.tokens_per_minute = tokens_per_minute
+            self.condition.notify_all()
+
+    def _state(self, model_id):
+        state = self.models.get(model_id)
+        if state is None:
+            requests_per_minute, tokens_per_minute = self.budgets.get(
+                model_id, (self.requests_per_minute, self.tokens_per_minute)
+            )
+            state = _ModelState(
+                requests_per_minute, tokens_per_minute, self.window_seconds
+            )
+            self.models[model_id] = state
+        return state
+
+    def _enqueue(self, ticket, priority):
+        state = self._state(ticket.reservation.model_id)
+        heapq.heappush(state.waiting, (priority, next(self.sequence), ticket))
+        self.condition.notify_all()
+
+    def _dispatch(self):
+        with self.condition:
+            while self.running:
+                now = time.monotonic()
+                next_wake = None
+                for state in self.models.values():
+                    while state.waiting:
+                        priority, _, ticket = state.waiting[0]
+                        is_job = ticket.on_admit is not None
+                        if is_job and self.in_flight >= self.max_workers:
+                            break
+
+                        wait = state.wait_time(ticket.reservation.tokens, now)
+                        if wait > 0:
+                            next_wake = wait if next_wake is None else min(next_wake, wait)
+                            break
+
+                        heapq.heappop(state.waiting)
+                        reservation = ticket.reservation
+                        reservation.admitted_at = now
+                        state.requests.add(1, now)
+                        reservation.token_entry = state.tokens.add(reservation.tokens, now)
+                        if is_job:
+                            self.in_flight += 1
+                            ticket.on_admit()
+                        else:
+                            self.condition.notify_all()
+
+                self.condition.wait(timeout=next_wake)
+
+    def _dequeue(self, ticket):
+        state = self._state(ticket.reservation.model_id)
+        state.waiting = [entry for entry in state.waiting if entry[2] is not ticket]
+        heapq.heapify(state.waiting)
+        ## The tickets behind it may be admitted now
+        self.condition.notify_all()
+
+    def acquire(self, model_id, tokens, priority=PRIORITY_NORMAL, timeout=None):
+        """
+        Block the calling thread until an invocation of `tokens` is admitted for the model, for at most
+        `timeout` seconds, by default what remains of the current deadline (see resilience.deadline).
+        Past it the ticket leaves the queue and DeadlineExceededException is raised.
+        """
+        if timeout is None:
+            deadline = current_deadline()
+            timeout = deadline.remaining() if deadline is not None else None
+        expires_at = None if timeout is None else time.monotonic() + timeout
+
+        reservation = Reservation(model_id, tokens)
+        ticket = _Ticket(reservation, None)
+        with self.condition:
+            self._enqueue(ticket, priority)
+            while reservation.admitted_at is None:
+                remaining = None if expires_at is None else expires_at - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    self._dequeue(ticket)
+                    raise DeadlineExceededException(
+                        f"Deadline exceeded for {model_id} while waiting for admission ({tokens} tokens)"
+                    )
+                self.condition.wait(timeout=remaining)
+        return reservation
+
+    def submit(self, model_id, tokens, fn, *args, priority=PRIORITY_BATCH):
+        """
+        Run fn(*args) on the worker pool once admitted. While it runs, ScheduledClient calls made by fn
+        are accounted against this reservation instead of being admitted again.
+        """
+        future = Future()
+        reservation = Reservation(model_id, tokens)
+
+        def run():
+            token = _current_reservation.set(reservation)
+            try:
+                if future.set_running_or_notify_cancel():
+                    try:
+                        future.set_result(fn(*args))
+                    except BaseException as err:
+                        future.set_exception(err)
+            finally:
+                _current_reservation.reset(token)
+                with self.condition:
+                    self.in_flight -= 1
+                    self.condition.notify_all()
+
+        def on_admit():
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="scheduled"
+                )
+            self.executor.submit(run)
+
+        with self.condition:
+            self._enqueue(_Ticket(reservation, on_admit), priority)
+        return future
+
+    def reconcile(self, reservation, actual_tokens):
+        with self.condition:
+            state = self._state(reservation.model_id)
+            state.tokens.adjust(reservation.token_entry, actual_tokens)
+            reservation.tokens = actual_tokens
+            self.condition.notify_all()
+
+    def throttled(self, model_id):
+        with self.condition:
+            state = self._state(model_id)
+            state.rate_factor = max(MIN_RATE_FACTOR, state.rate_factor * THROTTLE_DECREASE)
+            state.paused_until = time.monotonic() + THROTTLE_PAUSE_SECONDS
+            logger.info(
+                f"Throttled on {model_id}, admitting {state.rate_factor:.0%} of the configured budget"
+            )
+
+    def succeeded(self, model_id):
+        with self.condition:
+            state = self._state(model_id)
+            if state.rate_factor < 1.0:
+                state.rate_factor = min(1.0, state.rate_factor * SUCCESS_INCREASE)
+
+    def stats(self):
+        with self.condition:
+            now = time.monotonic()
+            return {
+                model_id: dict(
+                    requests_last_window=state.requests.usage(now),
+                    tokens_last_window=state.tokens.usage(now),
+                    waiting=len(state.waiting),
+                    rate_factor=state.rate_factor,
+                )
+                for model_id, state in self.models.items()
+            }
+
+    def shutdown(self, wait=True):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        if self.executor is not None:
+            self.executor.shutdown(wait=wait)
+
+
+class ScheduledClient:
+    """
+    --> Drop-in wrapper of the bedrock-runtime client admitting every invocation through a TokenRateScheduler.
+
+    The admitted tokens are the estimated prompt tokens plus the requested max tokens, reconciled with
+    the token counts reported by Amazon Bedrock in the response headers or the final stream chunk.
+    """
+
+    def __init__(self, client, scheduler, estimator=None, priority=PRIORITY_NORMAL) -> None:
+        self.client = client
+        self.scheduler = scheduler
+        self.estimator = estimator or TokenEstimator()
+        self.priority = priority
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def _admit(self, body, modelId):
+        reservation = _current_reservation.get()
+        if reservation is not None and reservation.model_id == modelId:
+            return reservation
+
+        request = json.loads(body)
+        tokens = self.estimator.estimate(
+            modelId, prompt_of(modelId, request)
+        ) + max_tokens_of(modelId, request)
+        return self.scheduler.acquire(modelId, tokens, self.priority)
+
+    def _call(self, method, body, modelId, kwargs):
+        started = time.monotonic()
+        reservation = self._admit(body, modelId)
+        _admission_seconds.set(_admission_seconds.get() + time.monotonic() - started)
+        try:
+            output = method(body=body, modelId=modelId, **kwargs)
+        except ClientError as err:
+            if err.response["Error"]["Code"] in THROTTLING_ERROR_CODES:
+                self.scheduler.throttled(modelId)
+            raise
+        self.scheduler.succeeded(modelId)
+        return reservation, output
+
+    def invoke_model(self, body, modelId, **kwargs):
+        reservation, output = self._call(self.client.invoke_model, body, modelId, kwargs)
+
+        headers = output.get("ResponseMetadata", {}).get("HTTPHeaders", {})
+        if INPUT_TOKEN_HEADER in headers:
+            self.scheduler.reconcile(
+                reservation,
+                int(headers[INPUT_TOKEN_HEADER]) + int(headers.get(OUTPUT_TOKEN_HEADER, 0)),
+            )
+        return output
+
+    def invoke_model_with_response_stream(self, body, modelId, **kwargs):
+        reservation, output = self._call(
+            self.client.invoke_model_with_response_stream, body, modelId, kwargs
+        )
+
+        def on_metrics(metrics):
+            self.scheduler.reconcile(
+                reservation,
+                int(metrics.get("inputTokenCount", 0))
+                + int(metrics.get("outputTokenCount", 0)),
+            )
+
+        output["body"] = ObservedStream(output["body"], on_metrics)
+        return output
@@ -0,0 +1,59 @@
+import json
+import unittest
+from io import BytesIO
+
+from model_invocation.best_of_n_engine import BestOfN, LikelihoodScorer
+from model_invocation.text.best_of_n import BestOfNTextGenerator, build_request
+from utils.exception_handler import ValidationException
+
+
+class FakeRuntimeClient:
+    def __init__(self) -> None:
+        self.bodies = []
+
+    def invoke_model(self, body, modelId, **kwargs):
+        self.bodies.append(json.loads(body))
+        if modelId.startswith("cohere"):
+            generations = [dict(text=f"Answer {index}", likelihood=-index) for index in range(3)]
+            response = dict(generations=generations)
+        else:
+            response = dict(completions=[dict(data=dict(text="Answer"), finishReason=dict(reason="endoftext"))])
+        return dict(body=BytesIO(json.dumps(response).encode("utf-8")))
+
+
+class BestOfNTest(unittest.TestCase):
+    def test_candidates_are_sampled(self):
+        for model_id, sampling in (
+            ("amazon.titan-text-express-v1", lambda body: body["textGenerationConfig"]),
+            ("anthropic.claude-v2", lambda body: dict(temperature=body["temperature"], topP=body["top_p"])),
+            ("ai21.j2-ultra-v1", lambda body: body),
+            ("cohere.command-text-v14", lambda body: dict(temperature=body["temperature"], topP=body["p"])),
+        ):
+            with self.subTest(model_id=model_id):
+                body = json.loads(build_request(dict(model_id=model_id, temperature=0.5)))
+                self.assertEqual(sampling(body)["temperature"], 0.5)
+                self.assertGreater(sampling(body)["topP"], 0)
+
+    def test_blank_pattern_needs_cohere_command(self):
+        runtime_client = FakeRuntimeClient()
+        with self.assertRaises(ValidationException):
+            BestOfNTextGenerator(runtime_client).generate(dict(pattern=""))
+        self.assertEqual(runtime_client.bodies, [])
+
+        best, _ = BestOfNTextGenerator(runtime_client).generate(dict(model_id="cohere.command-text-v14", pattern=""))
+        self.assertEqual(best.text, "Answer 0")
+        self.assertEqual(runtime_client.bodies[0]["return_likelihoods"], "GENERATION")
+
+    def test_likelihoods_are_only_asked_of_cohere_command(self):
+        runtime_client = FakeRuntimeClient()
+        best_of_n = BestOfN(runtime_client, LikelihoodScorer(), candidates=2)
+        try:
+            best_of_n.generate("ai21.j2-ultra-v1", build_request(dict(model_id="ai21.j2-ultra-v1")))
+        finally:
+            best_of_n.close()
+        self.assertEqual(len(runtime_client.bodies), 2)
+        self.assertTrue(all("return_likelihoods" not in body for body in runtime_client.bodies))
+
+
+if __name__ == "__main__":
+    unittest.main()
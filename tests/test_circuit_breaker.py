@@ -0,0 +1,133 @@
+import time
+import unittest
+from types import SimpleNamespace
+
+from botocore.exceptions import ClientError
+
+from resilience.circuit_breaker import CLOSED, HALF_OPEN, CircuitBreakers, ResilientClient
+from scheduling.scheduler import ScheduledClient
+from utils.exception_handler import CircuitOpenException
+
+MODEL_ID = "anthropic.claude-v2"
+BODY = '{"prompt": "Human: Why do we dream? \\\\nAssistant:", "max_tokens_to_sample": 200}'
+
+
+def throttling_error():
+    return ClientError(dict(Error=dict(Code="throttlingException", Message="Too many requests")), "InvokeModel")
+
+
+class FakeRuntimeClient:
+    meta = SimpleNamespace(region_name="us-east-1")
+
+    def __init__(self, events=(), error=None) -> None:
+        self.events = events
+        self.error = error
+
+    def invoke_model(self, **kwargs):
+        return dict(body=None, ResponseMetadata=dict(HTTPHeaders={}))
+
+    def invoke_model_with_response_stream(self, **kwargs):
+        def stream():
+            yield from self.events
+            if self.error is not None:
+                raise self.error
+
+        return dict(body=stream())
+
+
+class SlowScheduler:
+    """
+    Scheduler admitting every invocation after `wait_seconds`, e.g. a busy token budget
+    """
+
+    def __init__(self, wait_seconds) -> None:
+        self.wait_seconds = wait_seconds
+
+    def acquire(self, model_id, tokens, priority):
+        time.sleep(self.wait_seconds)
+        return None
+
+    def succeeded(self, model_id):
+        pass
+
+
+def resilient_client(client, **settings):
+    settings = dict(dict(min_calls=1, slow_call_seconds=0.05, slow_call_rate=0.5), **settings)
+    return ResilientClient(client, breakers=CircuitBreakers(**settings))
+
+
+class AdmissionWaitTest(unittest.TestCase):
+    def test_admission_wait_is_not_model_latency(self):
+        client = resilient_client(ScheduledClient(FakeRuntimeClient(), SlowScheduler(0.1)))
+        for _ in range(3):
+            client.invoke_model(body=BODY, modelId=MODEL_ID)
+
+        breaker = client.breakers.get("us-east-1", MODEL_ID)
+        self.assertEqual(breaker.state, CLOSED)
+        self.assertEqual(breaker.stats()["slow_call_rate"], 0.0)
+        self.assertEqual(breaker.stats()["calls"], 3)
+
+
+class StreamOutcomeTest(unittest.TestCase):
+    def outcomes(self, client):
+        return list(client.breakers.get("us-east-1", MODEL_ID).outcomes)
+
+    def test_stream_is_recorded_once_when_it_ends(self):
+        client = resilient_client(FakeRuntimeClient(events=[dict(chunk=dict(bytes=b"{}"))] * 3))
+        output = client.invoke_model_with_response_stream(body=BODY, modelId=MODEL_ID)
+        self.assertEqual(self.outcomes(client), [])
+        self.assertEqual(len(list(output["body"])), 3)
+        self.assertEqual(self.outcomes(client), [(False, False)])
+
+    def test_stream_failing_midway_is_one_failed_call(self):
+        client = resilient_client(
+            FakeRuntimeClient(events=[dict(chunk=dict(bytes=b"{}"))], error=throttling_error()), min_calls=10
+        )
+        output = client.invoke_model_with_response_stream(body=BODY, modelId=MODEL_ID)
+        with self.assertRaises(ClientError):
+            list(output["body"])
+        self.assertEqual(self.outcomes(client), [(True, False)])
+
+    def test_stream_closed_early_is_one_call(self):
+        client = resilient_client(FakeRuntimeClient(events=[dict(chunk=dict(bytes=b"{}"))] * 3))
+        output = client.invoke_model_with_response_stream(body=BODY, modelId=MODEL_ID)
+        for _ in output["body"]:
+            break
+        output["body"].close()
+        self.assertEqual(self.outcomes(client), [(False, False)])
+
+
+class HalfOpenProbeTest(unittest.TestCase):
+    def half_open_client(self):
+        client = resilient_client(FakeRuntimeClient(), open_seconds=0.05, half_open_calls=1)
+        breaker = client.breakers.get("us-east-1", MODEL_ID)
+        breaker.allow()
+        breaker.record(True)
+        time.sleep(0.06)
+        return client, breaker
+
+    def test_abandoned_probe_stream_releases_its_slot(self):
+        client, breaker = self.half_open_client()
+        output = client.invoke_model_with_response_stream(body=BODY, modelId=MODEL_ID)
+        self.assertEqual(breaker.state, HALF_OPEN)
+        with self.assertRaises(CircuitOpenException):
+            breaker.allow()
+
+        del output
+        client.invoke_model(body=BODY, modelId=MODEL_ID)
+        self.assertEqual(breaker.state, CLOSED)
+
+    def test_probes_without_outcome_expire(self):
+        client, breaker = self.half_open_client()
+        breaker.allow()
+        with self.assertRaises(CircuitOpenException):
+            breaker.allow()
+
+        time.sleep(0.06)
+        breaker.allow()
+        breaker.record(False)
+        self.assertEqual(breaker.state, CLOSED)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+import datetime
+import tempfile
+import unittest
+from unittest import mock
+
+from botocore.credentials import Credentials, ReadOnlyCredentials, RefreshableCredentials
+
+from utils.credential_cache import REFRESH_AHEAD_SECONDS, SharedCredentialCache, UNKNOWN_EXPIRY_SECONDS
+
+
+def refreshable_credentials(expiry):
+    metadata = dict(access_key="key", secret_key="secret", token="token", expiry_time=expiry.isoformat())
+    return RefreshableCredentials.create_from_metadata(metadata, refresh_using=lambda: metadata, method="test")
+
+
+class OpaqueCredentials(RefreshableCredentials):
+    """
+    Refreshable credentials of a botocore version keeping their expiry elsewhere than in _expiry_time
+    """
+
+    def __init__(self) -> None:
+        pass
+
+    def get_frozen_credentials(self):
+        return ReadOnlyCredentials("key", "secret", "token")
+
+
+class SharedCredentialCacheTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.cache = SharedCredentialCache("test", cache_dir=directory.name)
+
+    def fetch(self, credentials):
+        with mock.patch("utils.credential_cache.boto3.Session") as session:
+            session.return_value.get_credentials.return_value = credentials
+            return self.cache.fetch()
+
+    def test_expiry_of_refreshable_credentials(self):
+        expiry = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=1)
+        self.assertEqual(self.fetch(refreshable_credentials(expiry))["expiry_time"], expiry.isoformat())
+
+    def test_unknown_expiry_is_short_lived(self):
+        with self.assertLogs("utils.credential_cache", "WARNING"):
+            metadata = self.fetch(OpaqueCredentials())
+        lifetime = datetime.datetime.fromisoformat(metadata["expiry_time"]) - datetime.datetime.now(
+            datetime.timezone.utc
+        )
+        self.assertAlmostEqual(lifetime.total_seconds(), REFRESH_AHEAD_SECONDS + UNKNOWN_EXPIRY_SECONDS, delta=5)
+        self.assertIsInstance(self.cache.credentials(), RefreshableCredentials)
+
+    def test_static_credentials_do_not_expire(self):
+        metadata = self.fetch(Credentials("key", "secret"))
+        self.assertIsNone(metadata["expiry_time"])
+
+
+if __name__ == "__main__":
+    unittest.main()
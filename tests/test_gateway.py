@@ -0,0 +1,115 @@
+import asyncio
+import json
+import threading
+import unittest
+from io import BytesIO
+
+from gateway.server import BedrockGateway, sse_event
+
+PROMPT = json.dumps(dict(prompt="Why do we dream?")).encode()
+
+
+class FakeRuntimeClient:
+    """
+    Claude streams which send one chunk, then stall until released: the Bedrock side of a reader which never ends
+    """
+
+    def __init__(self) -> None:
+        self.released = threading.Event()
+        self.stall = True
+
+    def invoke_model(self, body, modelId, **kwargs):
+        response = dict(completion=" Nobody knows.", stop_reason="stop_sequence")
+        return dict(body=BytesIO(json.dumps(response).encode("utf-8")))
+
+    def invoke_model_with_response_stream(self, body, modelId, **kwargs):
+        released, stall = self.released, self.stall
+
+        class Stream:
+            def __iter__(self):
+                yield dict(chunk=dict(bytes=b'{"completion": " Nobody\\nknows."}'))
+                if stall:
+                    released.wait()
+                yield dict(chunk=dict(bytes=b'{"completion": "", "stop_reason": "stop_sequence"}'))
+
+            def close(self):
+                released.set()
+
+        return dict(body=Stream())
+
+
+async def request(port, path, body=PROMPT):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(
+        f"POST {path} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode()
+        + body
+    )
+    await writer.drain()
+    return reader, writer
+
+
+class GatewayTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.runtime_client = FakeRuntimeClient()
+        self.gateway = BedrockGateway(port=0, max_workers=1, max_streams=2, runtime_client=self.runtime_client)
+        await self.gateway.start()
+
+    async def asyncTearDown(self):
+        self.runtime_client.released.set()
+        self.gateway.drain_timeout = 1
+        await self.gateway.shutdown()
+
+    async def response(self, path, body=PROMPT):
+        reader, writer = await request(self.gateway.port, path, body)
+        status = int((await reader.readline()).split()[1])
+        await reader.readuntil(b"\r\n\r\n")
+        body = await reader.read()
+        writer.close()
+        return status, body
+
+    async def status(self, path, body=PROMPT):
+        return (await self.response(path, body))[0]
+
+    async def test_routes(self):
+        status, body = await self.response("/text/claude")
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body)["text"], " Nobody knows.")
+        for path in ("/model/anthropic.claude-v2", "/text", "/text/unknown", "/image/claude", "/text/claude/other",
+                     "/text/jurassic2/stream", "/embedding/titan/stream"):
+            with self.subTest(path=path):
+                self.assertEqual(await self.status(path), 404)
+
+    async def test_invalid_parameters(self):
+        for body in (b"{", b"[]", b'{"temperature": 5}', b'{"unknown": 1}', b'{"prompt": 42}'):
+            with self.subTest(body=body):
+                self.assertEqual(await self.status("/text/claude", body), 400)
+        self.assertEqual(await self.status("/text/claude/stream", b'{"temperature": 5}'), 400)
+
+    async def test_stream_events(self):
+        self.runtime_client.stall = False
+        status, body = await self.response("/text/claude/stream")
+        self.assertEqual(status, 200)
+        self.assertIn(b'data: {"text": " Nobody\\nknows."}\n\n', body)
+        self.assertIn(b'event: end\ndata: {"finish_reason": "stop_sequence"}\n\n', body)
+
+    def test_sse_event_keeps_the_framing_of_multiline_payloads(self):
+        self.assertEqual(sse_event("a\nb", event="error"), b"event: error\ndata: a\ndata: b\n\n")
+
+    async def test_streams_do_not_hold_the_invocation_threads(self):
+        ## Two streams stalled on their first chunk fill the stream slots, a third one waits for a slot
+        readers = []
+        for _ in range(3):
+            reader, writer = await request(self.gateway.port, "/text/claude/stream")
+            self.addCleanup(writer.close)
+            readers.append(reader)
+        for reader in readers[:2]:
+            await asyncio.wait_for(reader.readuntil(b"data: "), timeout=2)
+        with self.assertRaises(asyncio.TimeoutError):
+            await asyncio.wait_for(readers[2].readuntil(b"data: "), timeout=0.3)
+
+        ## The only invocation thread is free
+        self.assertEqual(await asyncio.wait_for(self.status("/text/claude"), timeout=2), 200)
+
+
+if __name__ == "__main__":
+    unittest.main()
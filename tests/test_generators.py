@@ -0,0 +1,47 @@
+import json
+import unittest
+from importlib import import_module
+from io import BytesIO
+
+from model_invocation.embedding.amazon_titan import AmazonTitanEmbeddeing
+from model_invocation.embedding.cohere import CohereEmbeddeing
+
+VECTOR = [0.25, -0.5, 0.75]
+MODULES = (
+    "model_invocation.text.ai21_jurassic",
+    "model_invocation.text.amazon_titan",
+    "model_invocation.text.anthropic_claude",
+    "model_invocation.text.best_of_n",
+    "model_invocation.text.cohere_command",
+    "model_invocation.text.meta_llama2",
+    "model_invocation.image.amazon_titan",
+    "model_invocation.image.stability_diffusion",
+)
+
+
+class FakeRuntimeClient:
+    def invoke_model(self, body, modelId, **kwargs):
+        if modelId.startswith("cohere"):
+            response = dict(embeddings=[VECTOR], id="1", response_type="embeddings_floats", texts=["text"])
+        else:
+            response = dict(embedding=VECTOR, inputTextTokenCount=1)
+        return dict(body=BytesIO(json.dumps(response).encode("utf-8")))
+
+
+class GeneratorInterfaceTest(unittest.TestCase):
+    def test_build_request_returns_a_json_body(self):
+        for module in MODULES:
+            with self.subTest(module=module):
+                body = import_module(module).build_request({})
+                self.assertIsInstance(body, str)
+                self.assertIsInstance(json.loads(body), dict)
+
+    def test_embedding_generators_return_the_vector(self):
+        for generator_class in (AmazonTitanEmbeddeing, CohereEmbeddeing):
+            with self.subTest(generator=generator_class.__name__):
+                embedding = generator_class(bedrock_client=FakeRuntimeClient()).generate({})
+                self.assertEqual(embedding, VECTOR)
+
+
+if __name__ == "__main__":
+    unittest.main()
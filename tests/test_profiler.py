@@ -0,0 +1,49 @@
+import tempfile
+import threading
+import unittest
+
+from profiling.profiler import Profiler
+
+
+class ProfilerMemoryTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.profiler = Profiler(directory.name, mode="cprofile").start()
+        self.addCleanup(self.profiler.stop)
+
+    def test_serial_operations_are_measured(self):
+        for _ in range(2):
+            with self.profiler.operation("allocate"):
+                buffer = bytearray(1 << 20)
+                del buffer
+        self.assertEqual(len(self.profiler.memory["allocate"]), 2)
+        self.assertGreaterEqual(min(peak for _, peak in self.profiler.memory["allocate"]), 1 << 20)
+        self.assertNotIn("allocate", self.profiler.overlapped)
+
+    def test_overlapping_operations_are_not_measured(self):
+        started, allocated = threading.Event(), threading.Event()
+
+        def other():
+            with self.profiler.operation("other"):
+                started.set()
+                buffer = bytearray(4 << 20)
+                allocated.wait()
+                del buffer
+
+        thread = threading.Thread(target=other)
+        thread.start()
+        started.wait()
+        ## Its peak is the other thread's buffer, which is not the memory of this operation
+        with self.profiler.operation("small"):
+            allocated.set()
+            thread.join()
+
+        self.assertNotIn("small", self.profiler.memory)
+        self.assertEqual(self.profiler.overlapped, dict(small=1, other=1))
+        self.assertGreaterEqual(self.profiler.process_peak, 4 << 20)
+        self.assertIn("Process peak while profiling", self.profiler.report())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from bootstrap import build_text_arguments
+from retrieval.rag import Retriever
+from retrieval.vector_store import VectorStore
+from utils.exception_handler import ValidationException
+
+DIMENSIONS = 16
+MODEL_ID = "anthropic.claude-v2"
+
+
+class FakeEmbedder:
+    def __init__(self) -> None:
+        self.calls = 0
+
+    def embed(self, texts, model_id=None):
+        self.calls += 1
+        return [np.ones(DIMENSIONS, dtype=np.float32) for _ in texts]
+
+
+class RetrieverTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.store = VectorStore(self.directory)
+        self.addCleanup(self.store.close)
+        self.embedder = FakeEmbedder()
+
+    def test_empty_store_adds_no_passages(self):
+        with self.assertLogs("retrieval.rag", "WARNING"):
+            retriever = Retriever(self.store, self.embedder, "amazon.titan-embed-g1-text-02")
+        self.assertEqual(retriever.retrieve("Why do we dream?"), [])
+        self.assertEqual(retriever.augment(MODEL_ID, "Why do we dream?"), "Why do we dream?")
+        self.assertEqual(self.embedder.calls, 0)
+
+        ## Rows ingested afterwards are retrieved
+        vectors = np.random.default_rng(0).standard_normal((4, DIMENSIONS)).astype(np.float32)
+        records = [dict(digest=f"digest-{row}", source="doc", chunk=row, text=f"chunk {row}") for row in range(4)]
+        self.store.append(vectors, records)
+        self.assertEqual(len(retriever.retrieve("Why do we dream?")), 4)
+        self.assertIn("chunk 0", retriever.augment(MODEL_ID, "Why do we dream?"))
+
+    def test_missing_store_fails_at_startup(self):
+        missing = os.path.join(self.directory, "mistyped")
+        with mock.patch.dict(os.environ, dict(BEDROCK_RAG_STORE=missing)):
+            os.environ.pop("BEDROCK_SEMANTIC_CACHE", None)
+            with self.assertRaises(ValidationException):
+                build_text_arguments(runtime_client=None, token_estimator=None)
+        self.assertFalse(os.path.exists(missing))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from botocore.exceptions import ClientError
+
+from bootstrap import build_clients
+from recording.cassette import OPERATION_INVOKE, Cassette, Interaction
+
+MODEL_ID = "anthropic.claude-v2"
+RECORDED_BODY = json.dumps(dict(prompt="Human: Why do we dream? \\nAssistant:", max_tokens_to_sample=200))
+OTHER_BODY = json.dumps(dict(prompt="Human: Why is the sky blue? \\nAssistant:", max_tokens_to_sample=200))
+
+
+class ReplayTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.cassette = os.path.join(directory.name, "session.jsonl.gz")
+        completion = json.dumps(dict(completion=" Nobody knows.", stop_reason="stop_sequence"))
+        Cassette([Interaction(OPERATION_INVOKE, MODEL_ID, RECORDED_BODY, body=completion)]).save(self.cassette)
+
+        ## A CI runner: neither the "bedrock-profile" profile nor any credentials
+        missing = os.path.join(directory.name, "missing")
+        self.environ = dict(AWS_CONFIG_FILE=missing, AWS_SHARED_CREDENTIALS_FILE=missing, BEDROCK_REPLAY=self.cassette)
+
+    def build(self, **environ):
+        with mock.patch.dict(os.environ, dict(self.environ, **environ)):
+            os.environ.pop("AWS_PROFILE", None)
+            return build_clients()
+
+    def invoke(self, client, body):
+        output = client.invoke_model(body=body, modelId=MODEL_ID, accept="application/json")
+        return json.loads(output["body"].read())
+
+    def test_replay_without_aws_profile(self):
+        control_client, runtime_client, _ = self.build()
+        self.assertIsNone(control_client)
+        self.assertEqual(self.invoke(runtime_client, RECORDED_BODY)["completion"], " Nobody knows.")
+        with self.assertRaises(ClientError):
+            self.invoke(runtime_client, OTHER_BODY)
+
+    def test_replay_match_model(self):
+        runtime_client = self.build(BEDROCK_REPLAY_MATCH="model")[1]
+        self.assertEqual(self.invoke(runtime_client, OTHER_BODY)["completion"], " Nobody knows.")
+
+
+if __name__ == "__main__":
+    unittest.main()
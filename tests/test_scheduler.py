@@ -0,0 +1,36 @@
+import time
+import unittest
+
+from resilience.deadline import deadline
+from scheduling.scheduler import TokenRateScheduler
+from utils.exception_handler import DeadlineExceededException
+
+MODEL_ID = "anthropic.claude-v2"
+
+
+class AdmissionDeadlineTest(unittest.TestCase):
+    def setUp(self):
+        ## One request per minute: after the first one, the next ones wait for the window
+        self.scheduler = TokenRateScheduler(requests_per_minute=1)
+        self.addCleanup(self.scheduler.shutdown)
+        self.scheduler.acquire(MODEL_ID, 10)
+
+    def waiting(self):
+        return self.scheduler.models[MODEL_ID].waiting
+
+    def test_admission_is_bounded_by_the_current_deadline(self):
+        started = time.monotonic()
+        with deadline(0.1):
+            with self.assertRaises(DeadlineExceededException):
+                self.scheduler.acquire(MODEL_ID, 10)
+        self.assertLess(time.monotonic() - started, 1.0)
+        self.assertEqual(self.waiting(), [])
+
+    def test_admission_timeout(self):
+        with self.assertRaises(DeadlineExceededException):
+            self.scheduler.acquire(MODEL_ID, 10, timeout=0.05)
+        self.assertEqual(self.waiting(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+import hashlib
+import json
+import unittest
+from io import BytesIO
+
+import numpy as np
+
+from caching.semantic_cache import SemanticCache
+from model_invocation.text.anthropic_claude import AnthropicClaudeTextGenerator, ClaudeParameters
+
+
+class FakeEmbedder:
+    """
+    Embeds every text as a random unit vector seeded by the text: distinct texts are far apart
+    """
+
+    def __init__(self) -> None:
+        self.texts = []
+
+    def embed(self, texts):
+        self.texts.extend(texts)
+        seeds = [int.from_bytes(hashlib.sha1(text.encode("utf-8")).digest()[:4], "big") for text in texts]
+        return [np.random.default_rng(seed).standard_normal(256) for seed in seeds]
+
+
+class FakeRuntimeClient:
+    def __init__(self) -> None:
+        self.bodies = []
+
+    def invoke_model(self, body, modelId, **kwargs):
+        self.bodies.append(json.loads(body))
+        completion = f"Completion {len(self.bodies)}"
+        return dict(body=BytesIO(json.dumps(dict(completion=completion)).encode("utf-8")))
+
+
+class FakeRetriever:
+    """
+    Adds different passages to every question, as a corpus being ingested would
+    """
+
+    def __init__(self) -> None:
+        self.calls = 0
+
+    def augment(self, model_id, prompt):
+        self.calls += 1
+        return f"Passage {self.calls}\n\nQuestion: {prompt}"
+
+
+class SemanticCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.embedder = FakeEmbedder()
+        self.runtime_client = FakeRuntimeClient()
+        self.cache = SemanticCache(self.embedder)
+
+    def generator(self, retriever=None):
+        return AnthropicClaudeTextGenerator(self.runtime_client, semantic_cache=self.cache, retriever=retriever)
+
+    def test_same_request_is_served_from_cache(self):
+        generator = self.generator()
+        first = generator.generate(dict(prompt="Why do we dream?"))
+        second = generator.generate(dict(prompt="Why do we dream?"))
+        self.assertEqual(first, second)
+        self.assertEqual(len(self.runtime_client.bodies), 1)
+
+    def test_inference_parameters_are_part_of_the_namespace(self):
+        generator = self.generator()
+        generator.generate(dict(prompt="Why do we dream?"))
+        for changes in (
+            dict(temperature=0.1),
+            dict(max_tokens_to_sample=1000),
+            dict(top_p=0.5),
+            dict(stop_sequences=["\n\nHuman:"]),
+        ):
+            with self.subTest(**changes):
+                before = len(self.runtime_client.bodies)
+                generator.generate(dict(prompt="Why do we dream?", **changes))
+                self.assertEqual(len(self.runtime_client.bodies), before + 1)
+        self.assertEqual(self.cache.stats()["hits"], 0)
+
+    def test_question_is_the_key_with_a_retriever(self):
+        retriever = FakeRetriever()
+        generator = self.generator(retriever)
+        generator.generate(dict(prompt="Why do we dream?"))
+        generator.generate(dict(prompt="Why do we dream?"))
+        self.assertEqual(len(self.runtime_client.bodies), 1)
+        self.assertEqual(self.cache.stats()["hits"], 1)
+        ## The model is invoked with the passages, the cache embeds the question alone
+        self.assertIn("Passage 1", self.runtime_client.bodies[0]["prompt"])
+        self.assertEqual(self.embedder.texts, ["Why do we dream?"] * 2)
+
+    def test_namespace_prefix(self):
+        params = ClaudeParameters(prompt="Why do we dream?")
+        shared = SemanticCache(self.embedder, namespace="faq")
+        self.assertTrue(shared.namespace_of(params).startswith("faq/anthropic.claude-v2/"))
+        self.assertNotEqual(shared.namespace_of(params), self.cache.namespace_of(params))
+        ## The prompt is the key within the namespace, not part of it
+        self.assertEqual(shared.namespace_of(params), shared.namespace_of(params.replace(prompt="Other")))
+
+
+if __name__ == "__main__":
+    unittest.main()
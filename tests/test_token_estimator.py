@@ -0,0 +1,47 @@
+import json
+import unittest
+from io import BytesIO
+
+from utils.exception_handler import BedrockException
+from utils.token_estimator import TokenCountingClient, TokenEstimator
+
+MODEL_ID_COHERE_EMBED = "cohere.embed-english-v3"
+## The largest batch accepted by Cohere Embed
+BATCH_SIZE = 96
+
+
+class FakeRuntimeClient:
+    def __init__(self) -> None:
+        self.bodies = []
+
+    def invoke_model(self, body, modelId, **kwargs):
+        self.bodies.append(body)
+        return dict(body=BytesIO(b"{}"), ResponseMetadata=dict(HTTPHeaders={}))
+
+
+class TokenCountingClientTest(unittest.TestCase):
+    def setUp(self):
+        self.runtime_client = FakeRuntimeClient()
+        self.client = TokenCountingClient(self.runtime_client, TokenEstimator())
+
+    def embed(self, texts):
+        body = json.dumps(dict(texts=texts, input_type="search_document", truncate="NONE"))
+        return self.client.invoke_model(body=body, modelId=MODEL_ID_COHERE_EMBED)
+
+    def test_full_embedding_batch_is_checked_per_text(self):
+        texts = [f"Short passage number {index} about why we dream at night." for index in range(BATCH_SIZE)]
+        ## Joined, the batch is well beyond the 512 token window of a single text
+        self.assertGreater(TokenEstimator().estimate(MODEL_ID_COHERE_EMBED, "\n".join(texts)), 512)
+
+        self.embed(texts)
+        self.assertEqual(len(self.runtime_client.bodies), 1)
+
+    def test_oversize_text_of_a_batch_is_rejected(self):
+        texts = ["A short text.", "word " * 2000]
+        with self.assertRaises(BedrockException):
+            self.embed(texts)
+        self.assertEqual(self.runtime_client.bodies, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+import tempfile
+import unittest
+
+import numpy as np
+
+from retrieval.vector_store import VectorStore
+
+DIMENSIONS = 8
+
+
+class Crash(Exception):
+    pass
+
+
+class CrashingState:
+    """
+    sqlite3 connection of a store, crashing when the digests of a batch are inserted: after the vectors and
+    the metadata were flushed, before the commit
+    """
+
+    def __init__(self, state) -> None:
+        self.state = state
+
+    def __getattr__(self, name):
+        return getattr(self.state, name)
+
+    def executemany(self, *args):
+        raise Crash()
+
+
+def batch(start, count):
+    vectors = np.random.default_rng(start).standard_normal((count, DIMENSIONS)).astype(np.float32)
+    records = [
+        dict(digest=f"digest-{row}", source="doc", chunk=row, text=f"chunk {row}") for row in range(start, start + count)
+    ]
+    return vectors, records
+
+
+def crash_on_append(store, vectors, records):
+    state = store.state
+    store.state = CrashingState(state)
+    try:
+        store.append(vectors, records)
+    except Crash:
+        pass
+    ## The process dies: nothing else is committed
+    store.vectors_file.close()
+    store.metadata_file.close()
+    state.close()
+
+
+class VectorStoreRecoveryTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def test_crash_between_flush_and_commit_keeps_the_digests(self):
+        store = VectorStore(self.directory.name)
+        store.append(*batch(0, 4))
+        crash_on_append(store, *batch(4, 3))
+
+        store = VectorStore(self.directory.name)
+        self.addCleanup(store.close)
+        self.assertEqual(len(store), 7)
+        ## A resumed ingestion skips the chunks of the flushed batch instead of storing them again
+        self.assertTrue(all(store.contains(f"digest-{row}") for row in range(7)))
+        self.assertEqual([record["row"] for record in store.records(range(7))], list(range(7)))
+
+        store.append(*batch(7, 2))
+        self.assertEqual(len(store), 9)
+        self.assertEqual(store.records([8])[0]["digest"], "digest-8")
+
+    def test_crash_in_the_first_batch(self):
+        crash_on_append(VectorStore(self.directory.name), *batch(0, 3))
+
+        store = VectorStore(self.directory.name)
+        self.addCleanup(store.close)
+        self.assertEqual(len(store), 3)
+        self.assertTrue(store.contains("digest-2"))
+        self.assertEqual(store.vectors().shape, (3, DIMENSIONS))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+import logging
+
+import boto3
+from botocore.config import Config
+
+## Instantiate Logger
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+# Client Default Values
+PROFILE_NAME = "bedrock-profile"
+MAX_POOL_CONNECTIONS = 10
+
+
+class BedrockClientFactory:
+    """
+    --> Builds the boto3 session and Amazon Bedrock clients.
+
+    The factory only holds plain configuration, so it can be pickled and sent to worker processes,
+    each of which builds its own session and clients (botocore clients must not be shared across fork).
+
+        1. profile_name:
+        AWS profile used to create the session. (default: bedrock-profile)
+
+        2. region_name:
+        AWS region of the Amazon Bedrock endpoints, defaults to the region of the profile.
+
+        3. endpoint_url:
+        Override of the bedrock-runtime endpoint, e.g. a local stand-in for tests.
+
+        4. max_pool_connections:
+        Size of the HTTP connection pool of the runtime client. (default: 10)
+
+        5. shared_credentials:
+        Resolve the credentials of the profile once per host and share them between processes through
+        a locked cache file (see utils.credential_cache), e.g. for a pool of workers assuming a role.
+
+        6. credential_cache_dir:
+        Directory of the shared credential cache, defaults to ~/.cache/amazon-bedrock-in-action.
+
+        7. retry_attempts:
+        Total attempts botocore makes per call, defaults to its own retry configuration. Use 1 when the
+        client is wrapped in a ResilientClient, which retries from a shared budget instead.
+
+        8. connect_timeout / read_timeout:
+        Seconds to open a connection / to wait for data on it, default to botocore's (60s). A DeadlineClient
+        cuts the read timeout of each request to its deadline; the connect timeout only comes from here.
+    """
+
+    def __init__(
+        self,
+        profile_name=PROFILE_NAME,
+        region_name=None,
+        endpoint_url=None,
+        max_pool_connections=MAX_POOL_CONNECTIONS,
+        shared_credentials=False,
+        credential_cache_dir=None,
+        retry_attempts=None,
+        connect_timeout=None,
+        read_timeout=None,
+    ) -> None:
+        self.profile_name = profile_name
+        self.region_name = region_name
+        self.endpoint_url = endpoint_url
+        self.max_pool_connections = max_pool_connections
+        self.shared_credentials = shared_credentials
+        self.credential_cache_dir = credential_cache_dir
+        self.retry_attempts = retry_attempts
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+
+    def session(self):
+        if self.shared_credentials:
+            from utils.credential_cache import CACHE_DIR, shared_session
+
+            return shared_session(self.profile_name, self.region_name, self.credential_cache_dir or CACHE_DIR)
+        ## Creating session with AWS profile
+        return boto3.Session(profile_name=self.profile_name, region_name=self.region_name)
+
+    def control_client(self, session=None):
+        """
+        bedrock – Contains control plane APIs for managing, training, and deploying models
+        """
+        session = session or self.session()
+        return session.client("bedrock")
+
+    def runtime_client(self, session=None):
+        """
+        bedrock-runtime – Contains runtime plane APIs for making inference requests for models hosted in Amazon Bedrock
+        """
+        session = session or self.session()
+        config = Config(max_pool_connections=self.max_pool_connections)
+        if self.retry_attempts is not None:
+            config = config.merge(Config(retries=dict(total_max_attempts=self.retry_attempts, mode="standard")))
+        if self.connect_timeout is not None:
+            config = config.merge(Config(connect_timeout=self.connect_timeout))
+        if self.read_timeout is not None:
+            config = config.merge(Config(read_timeout=self.read_timeout))
+        return session.client(
+            "bedrock-runtime",
+            endpoint_url=self.endpoint_url,
+            config=config,
+        )
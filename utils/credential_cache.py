@@ -0,0 +1,164 @@
+import datetime
+import fcntl
+import json
+import logging
+import os
+import tempfile
+from contextlib import contextmanager
+
+import boto3
+import botocore.session
+from botocore.credentials import CredentialProvider, Credentials, RefreshableCredentials
+
+## Instantiate Logger
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+# Credential Cache Default Values
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "amazon-bedrock-in-action")
+## Matches the advisory refresh window of botocore, so that a refresh it asks for gets new credentials
+REFRESH_AHEAD_SECONDS = 900
+## Seconds the refreshable credentials whose expiry botocore does not expose are shared, before being resolved again
+UNKNOWN_EXPIRY_SECONDS = 900
+
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+class SharedCredentialCache:
+    """
+    --> Temporary credentials of a profile, shared by all the processes of a host through a file:
+
+    The first process which needs credentials (or finds them about to expire) takes an exclusive lock,
+    resolves them once from the profile (e.g. one STS AssumeRole call) and writes them to the cache file,
+    readable by the user only. The other processes wait on the lock and read them, so a fleet of workers
+    starting together makes a single STS call instead of one per worker.
+
+    Credentials expiring within `refresh_ahead_seconds` are refreshed, ahead of their expiry. Credentials
+    without expiry (static access keys) are returned as they are and never written to the cache. Refreshable
+    credentials whose expiry is unknown are shared for UNKNOWN_EXPIRY_SECONDS only, never as static ones.
+    """
+
+    def __init__(self, profile_name=None, cache_dir=CACHE_DIR, refresh_ahead_seconds=REFRESH_AHEAD_SECONDS) -> None:
+        self.profile_name = profile_name
+        self.refresh_ahead_seconds = refresh_ahead_seconds
+        os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+        name = profile_name or "default"
+        self.path = os.path.join(cache_dir, f"credentials-{name}.json")
+        self.lock_path = f"{self.path}.lock"
+        self.resolutions = 0
+
+    @contextmanager
+    def _locked(self, exclusive):
+        with open(self.lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read(self):
+        """
+        Cached credentials metadata, or None when missing, unreadable or expiring within the refresh window
+        """
+        try:
+            with open(self.path, encoding="utf-8") as file:
+                metadata = json.load(file)
+        except (OSError, ValueError):
+            return None
+        expiry = datetime.datetime.fromisoformat(metadata["expiry_time"])
+        if (expiry - _now()).total_seconds() <= self.refresh_ahead_seconds:
+            return None
+        return metadata
+
+    def _write(self, metadata):
+        ## Written next to the cache file and renamed, so that readers never see a partial file
+        descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(self.path), prefix=".credentials-")
+        with os.fdopen(descriptor, "w", encoding="utf-8") as file:
+            json.dump(metadata, file)
+        os.replace(temporary, self.path)
+
+    def _resolve(self):
+        """
+        Resolve credentials from the profile, return their metadata (expiry_time None if they do not expire)
+        """
+        credentials = boto3.Session(profile_name=self.profile_name).get_credentials()
+        if credentials is None:
+            raise RuntimeError(f"No credentials found for profile {self.profile_name or 'default'}")
+        frozen = credentials.get_frozen_credentials()
+        self.resolutions += 1
+        expiry = None
+        if isinstance(credentials, RefreshableCredentials):
+            ## botocore has no public accessor for the expiry of refreshable credentials: its private attribute
+            ## is read when present, otherwise they are given a short lifetime
+            expiry = getattr(credentials, "_expiry_time", None)
+            if not isinstance(expiry, datetime.datetime):
+                logger.warning(
+                    f"Expiry of the credentials of {self.profile_name or 'default'} is unknown, "
+                    f"shared for {UNKNOWN_EXPIRY_SECONDS}s"
+                )
+                expiry = _now() + datetime.timedelta(seconds=self.refresh_ahead_seconds + UNKNOWN_EXPIRY_SECONDS)
+        return dict(
+            access_key=frozen.access_key,
+            secret_key=frozen.secret_key,
+            token=frozen.token,
+            expiry_time=expiry.isoformat() if expiry else None,
+        )
+
+    def fetch(self):
+        """
+        Credentials metadata (access_key, secret_key, token, expiry_time), from the cache when still fresh
+        """
+        with self._locked(exclusive=False):
+            metadata = self._read()
+        if metadata is not None:
+            return metadata
+
+        with self._locked(exclusive=True):
+            ## Another process may have refreshed them while this one waited for the lock
+            metadata = self._read()
+            if metadata is None:
+                metadata = self._resolve()
+                if metadata["expiry_time"] is not None:
+                    self._write(metadata)
+                    logger.info(f"Resolved credentials of {self.profile_name or 'default'}, shared in {self.path}")
+        return metadata
+
+    def credentials(self):
+        """
+        botocore credentials which refresh themselves through the shared cache
+        """
+        metadata = self.fetch()
+        if metadata["expiry_time"] is None:
+            return Credentials(metadata["access_key"], metadata["secret_key"], metadata["token"])
+        return RefreshableCredentials.create_from_metadata(
+            metadata=metadata, refresh_using=self.fetch, method=SharedCredentialProvider.METHOD
+        )
+
+
+class SharedCredentialProvider(CredentialProvider):
+    """
+    botocore credential provider backed by a SharedCredentialCache, placed first in the resolution chain
+    """
+
+    METHOD = "shared-credential-cache"
+    CANONICAL_NAME = "SharedCredentialCache"
+
+    def __init__(self, cache) -> None:
+        super().__init__()
+        self.cache = cache
+
+    def load(self):
+        return self.cache.credentials()
+
+
+def shared_session(profile_name=None, region_name=None, cache_dir=CACHE_DIR):
+    """
+    boto3 session of a profile whose credentials come from the shared cache
+    """
+    botocore_session = botocore.session.Session(profile=profile_name)
+    resolver = botocore_session.get_component("credential_provider")
+    ## First in the chain: with an explicit profile, botocore leaves the env provider out of it
+    resolver.providers.insert(0, SharedCredentialProvider(SharedCredentialCache(profile_name, cache_dir)))
+    return boto3.Session(botocore_session=botocore_session, region_name=region_name)
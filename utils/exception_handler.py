@@ -5,3 +5,19 @@ class BedrockException(Exception):
 class ImageException(Exception):
     def __init__(self, message):
         self.message = message
+
+class ValidationException(BedrockException):
+    ## Parameters rejected locally, before any request is sent
+    def __init__(self, message) -> None:
+        self.message = message
+
+class CircuitOpenException(BedrockException):
+    ## Invocation refused without calling the model, while its circuit breaker is open
+    def __init__(self, message, retry_after=0.0) -> None:
+        self.message = message
+        self.retry_after = retry_after
+
+class DeadlineExceededException(BedrockException):
+    ## Invocation cancelled once its deadline expired, before or while the response was read
+    def __init__(self, message) -> None:
+        self.message = message
@@ -0,0 +1,147 @@
+import itertools
+import json
+import logging
+import math
+import os
+import threading
+
+## Instantiate Logger
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+# Payload Logging Default Values, overridable through the environment
+MAX_PAYLOAD_CHARS = int(os.environ.get("BEDROCK_LOG_MAX_CHARS", "512"))
+PAYLOAD_SAMPLE_RATE = float(os.environ.get("BEDROCK_LOG_SAMPLE_RATE", "1.0"))
+LOG_FORMAT = os.environ.get("BEDROCK_LOG_FORMAT", "text")
+## Numeric lists at least this long are summarized as vectors
+MIN_VECTOR_LENGTH = 16
+MAX_LIST_ITEMS = 8
+VECTOR_HEAD = 4
+
+
+def _is_vector(value):
+    return (
+        isinstance(value, (list, tuple))
+        and len(value) >= MIN_VECTOR_LENGTH
+        and all(isinstance(item, (int, float)) for item in value[:VECTOR_HEAD])
+    )
+
+
+def _vector_summary(vector):
+    norm = math.hypot(*vector)
+    head = ", ".join(f"{item:.4g}" for item in vector[:VECTOR_HEAD])
+    return f"<vector dim={len(vector)} norm={norm:.4g} head=[{head}, ...]>"
+
+
+def _reduce(value, max_chars):
+    """
+    Replace vectors by their shape and norm, truncate long strings and long lists
+    """
+    if _is_vector(value):
+        return _vector_summary(value)
+    if hasattr(value, "shape") and hasattr(value, "dtype"):
+        return f"<array shape={tuple(value.shape)} dtype={value.dtype}>"
+    if isinstance(value, dict):
+        return {key: _reduce(item, max_chars) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        if value and _is_vector(value[0]):
+            return f"<{len(value)} vectors dim={len(value[0])}> first={_vector_summary(value[0])}"
+        reduced = [_reduce(item, max_chars) for item in value[:MAX_LIST_ITEMS]]
+        if len(value) > MAX_LIST_ITEMS:
+            reduced.append(f"... (+{len(value) - MAX_LIST_ITEMS} items)")
+        return reduced
+    if isinstance(value, bytes):
+        return f"<{len(value)} bytes>"
+    if isinstance(value, str) and len(value) > max_chars:
+        return f"{value[:max_chars]}... (+{len(value) - max_chars} chars)"
+    return value
+
+
+def summarize(value, max_chars=MAX_PAYLOAD_CHARS):
+    """
+    Short, bounded text form of a payload
+    """
+    reduced = _reduce(value, max_chars)
+    text = reduced if isinstance(reduced, str) else json.dumps(reduced, default=str)
+    if len(text) > max_chars:
+        return f"{text[:max_chars]}... (+{len(text) - max_chars} chars)"
+    return text
+
+
+class Payload:
+    """
+    Lazily summarized payload: the summary is only computed if the log record is actually emitted
+    """
+
+    __slots__ = ("value", "max_chars")
+
+    def __init__(self, value, max_chars=MAX_PAYLOAD_CHARS) -> None:
+        self.value = value
+        self.max_chars = max_chars
+
+    def __str__(self):
+        return summarize(self.value, self.max_chars)
+
+
+class PayloadSampler:
+    """
+    Deterministic 1-in-N sampling of payload logs, N = 1 / rate
+    """
+
+    def __init__(self, rate=PAYLOAD_SAMPLE_RATE) -> None:
+        self.interval = max(1, round(1 / rate)) if rate > 0 else 0
+        self.counter = itertools.count()
+        self.lock = threading.Lock()
+
+    def should_log(self):
+        if self.interval == 0:
+            return False
+        if self.interval == 1:
+            return True
+        with self.lock:
+            return next(self.counter) % self.interval == 0
+
+
+DEFAULT_SAMPLER = PayloadSampler()
+
+
+def log_payload(log, message, value, level=logging.INFO, sampler=DEFAULT_SAMPLER, **fields):
+    """
+    Log a (potentially huge) payload summarized, sampled and only formatted when emitted.
+    Keyword arguments are attached as structured fields of the record.
+    """
+    if not log.isEnabledFor(level) or not sampler.should_log():
+        return
+    log.log(level, "%s: %s", message, Payload(value), extra=dict(fields=fields))
+
+
+class StructuredFormatter(logging.Formatter):
+    """
+    JSON lines formatter: timestamp, level, logger, message and the structured fields of the record
+    """
+
+    def format(self, record):
+        entry = dict(
+            ts=round(record.created, 6),
+            level=record.levelname,
+            logger=record.name,
+            message=record.getMessage(),
+        )
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(fields)
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(log_format=LOG_FORMAT):
+    """
+    Switch the root handlers to JSON lines when BEDROCK_LOG_FORMAT=json
+    """
+    if log_format != "json":
+        return
+    formatter = StructuredFormatter()
+    for handler in logging.getLogger().handlers:
+        handler.setFormatter(formatter)
+
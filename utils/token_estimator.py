@@ -0,0 +1,348 @@
+import json
+import logging
+import threading
+
+import numpy as np
+
+from model_invocation.families import (
+    family_of,
+    prompt_of,
+    texts_of,
+    max_tokens_of,
+    set_max_tokens,
+)
+from model_invocation.streaming import INVOCATION_METRICS_KEY
+from utils.exception_handler import BedrockException
+
+## Instantiate Logger
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+# Response headers carrying the token counts of an invocation
+INPUT_TOKEN_HEADER = "x-amzn-bedrock-input-token-count"
+OUTPUT_TOKEN_HEADER = "x-amzn-bedrock-output-token-count"
+
+# Calibration Default Values
+## Prior tokens per character, word and request for each family, before any observation
+PRIOR_COEFFICIENTS = {
+    "titan-text": (0.22, 0.25, 1.0),
+    "titan-embed": (0.22, 0.25, 1.0),
+    "claude": (0.24, 0.20, 6.0),
+    "llama2": (0.26, 0.30, 2.0),
+    "jurassic2": (0.16, 0.25, 1.0),
+    "cohere-command": (0.21, 0.25, 1.0),
+    "cohere-embed": (0.21, 0.25, 1.0),
+    "default": (0.25, 0.25, 1.0),
+}
+## Weight of the prior relative to a single observation
+PRIOR_WEIGHT = 20.0
+## Forgetting factor applied to older observations at every new observation
+DECAY = 0.999
+## Multiplier applied to estimates before rejecting or clamping a request
+SAFETY_MARGIN = 1.1
+
+## Synthetic (characters, words) shapes used to express the prior as pseudo observations
+_PRIOR_SHAPES = ((40, 10), (400, 70), (1000, 160), (4000, 600))
+_FEATURE_SUBSETS = ([0, 1, 2], [0, 2], [1, 2], [0, 1], [0], [1], [2])
+
+
+def text_features(text):
+    """
+    Features of a text for the linear token model: characters, words and a constant
+    """
+    return (len(text), len(text.split()), 1.0)
+
+
+class _FamilyCalibration:
+    """
+    Least squares fit of tokens ~ a * characters + b * words + c, kept as running normal equations
+    so that every observation is an O(1) update and the coefficients are solved lazily.
+    Coefficients are constrained to be non-negative so that the fit never extrapolates to negative counts.
+    """
+
+    def __init__(self, prior, prior_weight, decay) -> None:
+        self.decay = decay
+        self.xtx = np.eye(3) * 1e-6
+        self.xty = np.zeros(3)
+        self.yty = 0.0
+        self.observations = 0
+
+        prior = np.asarray(prior, dtype=np.float64)
+        weight = prior_weight / len(_PRIOR_SHAPES)
+        for chars, words in _PRIOR_SHAPES:
+            x = np.array((chars, words, 1.0))
+            y = x @ prior
+            self.xtx += weight * np.outer(x, x)
+            self.xty += weight * x * y
+            self.yty += weight * y * y
+
+        self.coefficients = prior
+        self.dirty = False
+
+    def observe(self, features, tokens):
+        x = np.asarray(features, dtype=np.float64)
+        self.xtx *= self.decay
+        self.xty *= self.decay
+        self.yty *= self.decay
+        self.xtx += np.outer(x, x)
+        self.xty += x * tokens
+        self.yty += tokens * tokens
+        self.observations += 1
+        self.dirty = True
+
+    def solve(self):
+        if not self.dirty:
+            return self.coefficients
+
+        ## Non-negative least squares by trying every subset of the 3 features
+        best, best_error = None, None
+        for subset in _FEATURE_SUBSETS:
+            coefficients = np.zeros(3)
+            coefficients[subset] = np.linalg.solve(
+                self.xtx[np.ix_(subset, subset)], self.xty[subset]
+            )
+            if (coefficients < 0).any():
+                continue
+            error = (
+                self.yty
+                - 2 * coefficients @ self.xty
+                + coefficients @ self.xtx @ coefficients
+            )
+            if best_error is None or error < best_error:
+                best, best_error = coefficients, error
+
+        if best is not None:
+            self.coefficients = best
+        self.dirty = False
+        return self.coefficients
+
+
+class TokenEstimator:
+    """
+    --> Local token estimator for pre-flight sizing:
+
+    Estimates the number of tokens of a text for a model family without any network call, using a
+    linear model over the character and word counts of the text. Each family starts from a prior and
+    is re-fit from the token counts reported by Amazon Bedrock for completed invocations.
+
+    --> Usage:
+
+        1. estimate(model_id, text) / estimate_many(model_id, texts):
+        Estimated input tokens of one text, or of many texts at once as a numpy int array.
+
+        2. observe(model_id, text, tokens):
+        Calibrate the family of the model with the token count reported for a text.
+
+        3. max_output_tokens(model_id, text):
+        Tokens left for generation within the context window of the family.
+
+        4. check(model_id, text):
+        Raise BedrockException if the prompt cannot fit the context window of the family.
+    """
+
+    def __init__(
+        self, prior_weight=PRIOR_WEIGHT, decay=DECAY, safety_margin=SAFETY_MARGIN
+    ) -> None:
+        self.prior_weight = prior_weight
+        self.decay = decay
+        self.safety_margin = safety_margin
+        self.calibrations = {}
+        self.lock = threading.Lock()
+
+    def _calibration(self, model_id):
+        family = family_of(model_id)["name"]
+        calibration = self.calibrations.get(family)
+        if calibration is None:
+            calibration = _FamilyCalibration(
+                PRIOR_COEFFICIENTS.get(family, PRIOR_COEFFICIENTS["default"]),
+                self.prior_weight,
+                self.decay,
+            )
+            self.calibrations[family] = calibration
+        return calibration
+
+    def coefficients(self, model_id):
+        with self.lock:
+            return self._calibration(model_id).solve()
+
+    def estimate(self, model_id, text):
+        """
+        Estimated number of tokens of a text
+        """
+        a, b, c = self.coefficients(model_id)
+        chars, words, _ = text_features(text)
+        return max(1, int(round(a * chars + b * words + c)))
+
+    def estimate_many(self, model_id, texts):
+        """
+        Estimated number of tokens of every text, as a numpy int64 array
+        """
+        texts = list(texts)
+        features = np.empty((len(texts), 3), dtype=np.float64)
+        features[:, 0] = np.fromiter(map(len, texts), dtype=np.float64, count=len(texts))
+        features[:, 1] = np.fromiter(
+            (len(text.split()) for text in texts), dtype=np.float64, count=len(texts)
+        )
+        features[:, 2] = 1.0
+        estimates = np.rint(features @ self.coefficients(model_id)).astype(np.int64)
+        return np.maximum(estimates, 1)
+
+    def observe(self, model_id, text, tokens):
+        """
+        Re-fit the family of the model with the token count reported by Amazon Bedrock
+        """
+        with self.lock:
+            self._calibration(model_id).observe(text_features(text), tokens)
+
+    def max_output_tokens(self, model_id, text):
+        """
+        Tokens left for generation once the (margin adjusted) prompt is in the context window
+        """
+        context_window = family_of(model_id)["context_window"]
+        used = int(self.estimate(model_id, text) * self.safety_margin)
+        return max(0, context_window - used)
+
+    def check(self, model_id, text):
+        """
+        Reject a prompt which leaves no room for generation in the context window of the model family
+        """
+        context_window = family_of(model_id)["context_window"]
+        estimate = self.estimate(model_id, text)
+        if estimate * self.safety_margin >= context_window:
+            raise BedrockException(
+                f"Prompt of ~{estimate} tokens does not fit the {context_window} token context window of {model_id}"
+            )
+        return estimate
+
+    def stats(self):
+        with self.lock:
+            return {
+                family: dict(
+                    observations=calibration.observations,
+                    coefficients=[float(value) for value in calibration.solve()],
+                )
+                for family, calibration in self.calibrations.items()
+            }
+
+    def save(self, path):
+        """
+        Persist the calibration of every family to a JSON file
+        """
+        with self.lock:
+            state = {
+                family: dict(
+                    xtx=calibration.xtx.tolist(),
+                    xty=calibration.xty.tolist(),
+                    yty=calibration.yty,
+                    observations=calibration.observations,
+                )
+                for family, calibration in self.calibrations.items()
+            }
+        with open(path, "w") as file:
+            json.dump(state, file)
+
+    def load(self, path):
+        """
+        Restore the calibration saved by save()
+        """
+        with open(path) as file:
+            state = json.load(file)
+        with self.lock:
+            for family, values in state.items():
+                calibration = _FamilyCalibration(
+                    PRIOR_COEFFICIENTS.get(family, PRIOR_COEFFICIENTS["default"]),
+                    self.prior_weight,
+                    self.decay,
+                )
+                calibration.xtx = np.asarray(values["xtx"])
+                calibration.xty = np.asarray(values["xty"])
+                calibration.yty = values["yty"]
+                calibration.observations = values["observations"]
+                calibration.dirty = True
+                self.calibrations[family] = calibration
+
+
+class ObservedStream:
+    """
+    Iterate a response stream unchanged while picking up the invocation metrics of the final chunk
+    """
+
+    def __init__(self, stream, on_metrics) -> None:
+        self.stream = stream
+        self.on_metrics = on_metrics
+
+    def __iter__(self):
+        for event in self.stream:
+            chunk = event.get("chunk")
+            if chunk is not None:
+                data = chunk.get("bytes")
+                if INVOCATION_METRICS_KEY.encode() in data:
+                    metrics = json.loads(data.decode()).get(INVOCATION_METRICS_KEY)
+                    if metrics:
+                        self.on_metrics(metrics)
+            yield event
+
+    def close(self):
+        self.stream.close()
+
+
+class TokenCountingClient:
+    """
+    --> Drop-in wrapper of the bedrock-runtime client:
+
+    1. Pre-flight: rejects prompts which cannot fit the context window and clamps the requested
+    generation length (max_tokens_to_sample, maxTokenCount, max_gen_len...) to what is left of it.
+
+    2. Calibration: feeds the input token counts reported by Amazon Bedrock (response headers or the
+    invocation metrics of the last stream chunk) back into the TokenEstimator.
+    """
+
+    def __init__(self, client, estimator=None, preflight=True) -> None:
+        self.client = client
+        self.estimator = estimator or TokenEstimator()
+        self.preflight = preflight
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def _prepare(self, body, modelId):
+        request = json.loads(body)
+        prompt = prompt_of(modelId, request)
+        if not self.preflight:
+            return body, prompt
+
+        max_tokens = max_tokens_of(modelId, request)
+        ## The context window limits every text of a batch (Cohere embeddings), not the texts joined
+        for text in texts_of(modelId, request):
+            self.estimator.check(modelId, text)
+        available = self.estimator.max_output_tokens(modelId, prompt)
+        if max_tokens > available:
+            logger.info(
+                f"Clamping requested output of {max_tokens} tokens to {available} for {modelId}"
+            )
+            set_max_tokens(modelId, request, available)
+            body = json.dumps(request)
+        return body, prompt
+
+    def invoke_model(self, body, modelId, **kwargs):
+        body, prompt = self._prepare(body, modelId)
+        output = self.client.invoke_model(body=body, modelId=modelId, **kwargs)
+
+        headers = output.get("ResponseMetadata", {}).get("HTTPHeaders", {})
+        input_tokens = headers.get(INPUT_TOKEN_HEADER)
+        if input_tokens is not None and prompt:
+            self.estimator.observe(modelId, prompt, int(input_tokens))
+        return output
+
+    def invoke_model_with_response_stream(self, body, modelId, **kwargs):
+        body, prompt = self._prepare(body, modelId)
+        output = self.client.invoke_model_with_response_stream(
+            body=body, modelId=modelId, **kwargs
+        )
+
+        def on_metrics(metrics):
+            if "inputTokenCount" in metrics and prompt:
+                self.estimator.observe(modelId, prompt, int(metrics["inputTokenCount"]))
+
+        output["body"] = ObservedStream(output["body"], on_metrics)
+        return output
@@ -0,0 +1,116 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import BotoCoreError, ClientError
+
+## Instantiate Logger
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+# Warm-up Default Values
+CONNECTIONS = 2
+## Below the idle timeout of the service endpoints, so that pooled connections are not closed while idle
+KEEPALIVE_SECONDS = 45.0
+## Model id which does not exist: the request is signed and sent, and rejected without any inference
+PING_MODEL_ID = "warmup-ping"
+
+
+class ConnectionWarmer:
+    """
+    --> Warm-up of a bedrock-runtime client, in the background:
+
+    1. Resolves the credentials (profile, SSO or role) and signs a first request
+    2. Opens `connections` pooled connections to the runtime endpoint (DNS, TCP and TLS handshakes) by
+       sending that many concurrent pings, i.e. invocations of a model id which does not exist; they are
+       rejected by the service without running any model
+    3. Keeps the pooled connections alive: when the client made no call for `keepalive_seconds`,
+       the pings are sent again
+
+    Warm the raw client (before wrapping it in TokenCountingClient or ScheduledClient), so that the pings
+    are not counted as tokens or admitted by the scheduler; the wrappers share its connection pool.
+    """
+
+    def __init__(self, client, connections=CONNECTIONS, keepalive_seconds=KEEPALIVE_SECONDS) -> None:
+        self.client = client
+        self.connections = min(connections, client.meta.config.max_pool_connections)
+        self.keepalive_seconds = keepalive_seconds
+        self.last_activity = 0.0
+        self.warmed = threading.Event()
+        self.stopped = threading.Event()
+        self.thread = None
+        self.warmup_seconds = None
+
+        ## Any call made through the client counts as activity on its connections
+        client.meta.events.register("after-call.bedrock-runtime", self._on_call)
+
+    def _on_call(self, **kwargs):
+        self.last_activity = time.monotonic()
+
+    def _ping(self, _):
+        try:
+            self.client.invoke_model(
+                body=b"{}",
+                modelId=PING_MODEL_ID,
+                accept="application/json",
+                contentType="application/json",
+            )
+        except ClientError:
+            ## Expected: the model does not exist, the connection is open and back in the pool
+            pass
+
+    def ping(self):
+        """
+        Send one ping per connection concurrently, so that each one holds its own pooled connection
+        """
+        with ThreadPoolExecutor(max_workers=self.connections) as executor:
+            list(executor.map(self._ping, range(self.connections)))
+
+    def _run(self):
+        started = time.monotonic()
+        try:
+            self.ping()
+            self.warmup_seconds = time.monotonic() - started
+            logger.info(
+                f"Warmed up {self.connections} connections to {self.client.meta.endpoint_url} "
+                f"in {self.warmup_seconds:.2f}s"
+            )
+        except BotoCoreError as err:
+            logger.warning(f"Warm-up failed: {err}")
+        finally:
+            self.warmed.set()
+
+        if not self.keepalive_seconds:
+            return
+        while not self.stopped.wait(self.keepalive_seconds / 3):
+            if time.monotonic() - self.last_activity >= self.keepalive_seconds:
+                try:
+                    self.ping()
+                except BotoCoreError as err:
+                    logger.warning(f"Keepalive failed: {err}")
+
+    def start(self):
+        """
+        Warm up in the background, return immediately
+        """
+        self.thread = threading.Thread(target=self._run, name="bedrock-warmup", daemon=True)
+        self.thread.start()
+        return self
+
+    def wait(self, timeout=None):
+        """
+        Block until the warm-up completed, e.g. before a worker starts taking requests
+        """
+        return self.warmed.wait(timeout)
+
+    def stop(self):
+        self.stopped.set()
+        self.client.meta.events.unregister("after-call.bedrock-runtime", self._on_call)
+
+
+def warm_up(client, connections=CONNECTIONS, keepalive_seconds=KEEPALIVE_SECONDS):
+    """
+    Start warming up a bedrock-runtime client in the background and return the ConnectionWarmer
+    """
+    return ConnectionWarmer(client, connections, keepalive_seconds).start()
@@ -0,0 +1,184 @@
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image
+
+## Instantiate Logger
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+# Image Pool Default Values
+OUTPUT_DIR = "."
+START_METHOD = "spawn"
+QUALITY = 80
+## WebP at 80, JPEG at 85 and a WebP thumbnail fitting in 256x256
+RENDITIONS = "webp:80,jpeg:85,webp:75:256"
+## Images queued or being encoded per worker process; submit() waits beyond, so that memory stays bounded
+PENDING_PER_PROCESS = 2
+## 0 (fast) to 6 (smallest files): 6 takes about a second for 1024x1024, well under the time of a generation
+WEBP_METHOD = 6
+
+## Format name -> (PIL format, file extension)
+FORMATS = {
+    "webp": ("WEBP", "webp"),
+    "jpeg": ("JPEG", "jpg"),
+    "png": ("PNG", "png"),
+}
+
+
+class Rendition:
+    """
+    --> One encoding of the generated images:
+
+        1. format: webp, jpeg or png
+        2. quality: 1-100 (ignored for png, which is lossless)
+        3. max_size: the image is scaled down to fit in max_size x max_size, e.g. for thumbnails
+           (default: full size)
+    """
+
+    __slots__ = ("format", "quality", "max_size")
+
+    def __init__(self, format, quality=QUALITY, max_size=None) -> None:
+        if format not in FORMATS:
+            raise ValueError(f"Unknown image format {format!r}, use one of {', '.join(FORMATS)}")
+        if not 1 <= quality <= 100:
+            raise ValueError(f"Invalid quality {quality}, use 1-100")
+        self.format = format
+        self.quality = quality
+        self.max_size = max_size
+
+    @classmethod
+    def parse(cls, spec):
+        """
+        Rendition from "format[:quality[:max_size]]", e.g. "webp:80" or "jpeg:85:256"
+        """
+        parts = spec.strip().lower().split(":")
+        try:
+            return cls(
+                parts[0],
+                int(parts[1]) if len(parts) > 1 else QUALITY,
+                int(parts[2]) if len(parts) > 2 else None,
+            )
+        except (IndexError, ValueError) as err:
+            raise ValueError(f"Invalid rendition {spec!r}: {err}") from err
+
+    def path(self, output_dir, name):
+        suffix = f"-{self.max_size}" if self.max_size else ""
+        return os.path.join(output_dir, f"{name}{suffix}.{FORMATS[self.format][1]}")
+
+    def __repr__(self):
+        return f"Rendition({self.format!r}, {self.quality}, {self.max_size})"
+
+
+def parse_renditions(specs):
+    """
+    Renditions from a comma separated list of specs, see Rendition.parse()
+    """
+    return [Rendition.parse(spec) for spec in specs.split(",") if spec.strip()]
+
+
+def render(image, name, renditions, output_dir=OUTPUT_DIR):
+    """
+    Write every rendition of a decoded image as `name` in output_dir, return the paths written
+    """
+    paths = []
+    for rendition in renditions:
+        encoded = image
+        if rendition.max_size and max(image.size) > rendition.max_size:
+            encoded = image.copy()
+            ## Reduces by whole factors first, then resamples: much faster than resampling all the pixels
+            encoded.thumbnail((rendition.max_size, rendition.max_size), Image.Resampling.LANCZOS)
+        if rendition.format == "jpeg" and encoded.mode not in ("RGB", "L"):
+            encoded = encoded.convert("RGB")
+
+        if rendition.format == "webp":
+            options = dict(quality=rendition.quality, method=WEBP_METHOD)
+        elif rendition.format == "jpeg":
+            options = dict(quality=rendition.quality, optimize=True, progressive=True)
+        else:
+            options = dict(optimize=True)
+
+        path = rendition.path(output_dir, name)
+        encoded.save(path, FORMATS[rendition.format][0], **options)
+        paths.append(path)
+    return paths
+
+
+class ImagePostProcessor:
+    """
+    --> Conversion, resizing and encoding of generated images in worker processes:
+
+    submit() hands a decoded image to the pool and returns at once with a Future of the paths written, so
+    that the generation thread goes on with the next request while the renditions of the previous images
+    are encoded on the other cores: image throughput is bound by the model rather than by PIL. At most
+    `processes * PENDING_PER_PROCESS` images wait in the pool, beyond which submit() waits for a slot.
+
+    The workers are started with `spawn`: the script creating the pool must guard its entry point with
+    `if __name__ == "__main__":`.
+
+    --> Configuration:
+
+        1. renditions:
+        Renditions written for every image, a list of Rendition or a spec string. (default: RENDITIONS)
+
+        2. processes:
+        Number of worker processes. (default: number of cores)
+
+        3. output_dir:
+        Directory where the renditions are written. (default: current directory)
+    """
+
+    def __init__(self, renditions=RENDITIONS, processes=None, output_dir=OUTPUT_DIR, start_method=START_METHOD) -> None:
+        self.renditions = parse_renditions(renditions) if isinstance(renditions, str) else list(renditions)
+        self.processes = processes or os.cpu_count()
+        self.output_dir = output_dir
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.processes, mp_context=multiprocessing.get_context(start_method)
+        )
+        self.slots = threading.BoundedSemaphore(self.processes * PENDING_PER_PROCESS)
+        self.images = 0
+        self.failures = 0
+        self.lock = threading.Lock()
+
+    def submit(self, image, name):
+        """
+        Queue the renditions of a decoded PIL image, return a Future of their paths
+        """
+        self.slots.acquire()
+        try:
+            future = self.executor.submit(render, image, name, self.renditions, self.output_dir)
+        except BaseException:
+            self.slots.release()
+            raise
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future):
+        self.slots.release()
+        error = future.exception()
+        with self.lock:
+            self.images += 1
+            self.failures += error is not None
+        if error is not None:
+            logger.error(f"Image post-processing failed: {type(error).__name__}: {error}")
+        else:
+            logger.info(f"Renditions written: {', '.join(future.result())}")
+
+    def stats(self):
+        with self.lock:
+            return dict(images=self.images, failures=self.failures)
+
+    def close(self):
+        """
+        Wait for the images still in the pool, then stop the workers
+        """
+        self.executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
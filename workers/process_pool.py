@@ -0,0 +1,253 @@
+import base64
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+from model_invocation.streaming import StreamAccumulator, iter_chunks
+from utils.client_factory import BedrockClientFactory
+
+## Instantiate Logger
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+# Pool Default Values
+THREADS_PER_PROCESS = 4
+CHUNK_SIZE = 8
+START_METHOD = "spawn"
+OUTPUT_DIR = "."
+
+# Kinds of work items
+TASK_INVOKE = "invoke"
+TASK_STREAM = "stream"
+TASK_EMBED = "embed"
+TASK_IMAGES = "images"
+
+## Per-process state, built by the pool initializer in every worker process
+_runtime_client = None
+_threads = None
+_output_dir = OUTPUT_DIR
+
+
+class WorkItem:
+    """
+    One invocation for the pool: kind of work, model id, request body (dict) and an optional name
+    used for the files written by image work items.
+    """
+
+    __slots__ = ("kind", "model_id", "body", "name")
+
+    def __init__(self, kind, model_id, body, name=None) -> None:
+        self.kind = kind
+        self.model_id = model_id
+        self.body = body
+        self.name = name
+
+
+class WorkResult:
+    """
+    Outcome of a work item: result on success, error message otherwise
+    """
+
+    __slots__ = ("index", "result", "error")
+
+    def __init__(self, index, result=None, error=None) -> None:
+        self.index = index
+        self.result = result
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+def _init_worker(client_factory, threads_per_process, output_dir):
+    """
+    Build the session and runtime client owned by this worker process
+    """
+    global _runtime_client, _threads, _output_dir
+    _runtime_client = client_factory.runtime_client()
+    _threads = ThreadPoolExecutor(max_workers=threads_per_process)
+    _output_dir = output_dir
+
+
+def _invoke(client, item, output_dir):
+    output = client.invoke_model(
+        body=json.dumps(item.body),
+        modelId=item.model_id,
+        accept="application/json",
+        contentType="application/json",
+    )
+    return json.loads(output["body"].read())
+
+
+def _stream(client, item, output_dir):
+    output = client.invoke_model_with_response_stream(
+        body=json.dumps(item.body),
+        modelId=item.model_id,
+        accept="application/json",
+        contentType="application/json",
+    )
+    accumulator = StreamAccumulator().consume(iter_chunks(item.model_id, output["body"]))
+    return dict(
+        text=accumulator.text,
+        finish_reason=accumulator.finish_reason,
+        input_tokens=accumulator.input_tokens,
+        output_tokens=accumulator.output_tokens,
+    )
+
+
+def _embed(client, item, output_dir):
+    """
+    Return the embeddings as a float32 matrix, which crosses the process boundary as one buffer
+    """
+    response = _invoke(client, item, output_dir)
+    if "embeddings" in response:
+        return np.asarray(response["embeddings"], dtype=np.float32)
+    return np.asarray([response["embedding"]], dtype=np.float32)
+
+
+def _images(client, item, output_dir):
+    """
+    Decode and save the generated images in the worker, only the file paths are sent back
+    """
+    response = _invoke(client, item, output_dir)
+    error = response.get("error")
+    if error is not None:
+        raise RuntimeError(f"Image Generation Error: {error}")
+
+    if "artifacts" in response:
+        encoded_images = []
+        for artifact in response["artifacts"]:
+            if artifact["finishReason"] in ("ERROR", "CONTENT_FILTERED"):
+                raise RuntimeError(
+                    f"Error in Image Generation: {artifact['finishReason']}"
+                )
+            encoded_images.append(artifact["base64"])
+    else:
+        encoded_images = response.get("images")
+
+    name = item.name or "generated_image"
+    paths = []
+    for num_image, base64_image in enumerate(encoded_images, start=1):
+        image = Image.open(BytesIO(base64.b64decode(base64_image)))
+        path = os.path.join(output_dir, f"{name}-{num_image}.png")
+        image.save(path)
+        paths.append(path)
+    return paths
+
+
+_TASKS = {
+    TASK_INVOKE: _invoke,
+    TASK_STREAM: _stream,
+    TASK_EMBED: _embed,
+    TASK_IMAGES: _images,
+}
+
+
+def run_work_item(client, item, output_dir=OUTPUT_DIR):
+    """
+    Run a single work item with the given runtime client and return its result
+    """
+    return _TASKS[item.kind](client, item, output_dir)
+
+
+def _run_item(indexed_item):
+    index, item = indexed_item
+    try:
+        return WorkResult(index, result=run_work_item(_runtime_client, item, _output_dir))
+    except Exception as err:
+        return WorkResult(index, error=f"{type(err).__name__}: {err}")
+
+
+def _run_chunk(indexed_items):
+    """
+    Run a chunk of work items concurrently on the threads of this worker process
+    """
+    return list(_threads.map(_run_item, indexed_items))
+
+
+class BedrockProcessPool:
+    """
+    --> Multi-process execution of Amazon Bedrock invocations:
+
+    Every worker process builds its own session and bedrock-runtime client from the BedrockClientFactory
+    and runs a few invocations concurrently on threads, so that network waits overlap while JSON parsing,
+    base64 decoding and PIL encoding run in parallel across all cores. Work items are sent to the workers
+    in chunks and only compact results (parsed JSON, float32 matrices, file paths) are sent back.
+
+    --> Configuration:
+
+        1. client_factory:
+        BedrockClientFactory used by every worker process.
+
+        2. processes:
+        Number of worker processes. (default: number of cores)
+
+        3. threads_per_process:
+        Concurrent invocations within each worker process. (default: 4)
+
+        4. output_dir:
+        Directory where image work items are saved. (default: current directory)
+    """
+
+    def __init__(
+        self,
+        client_factory=None,
+        processes=None,
+        threads_per_process=THREADS_PER_PROCESS,
+        output_dir=OUTPUT_DIR,
+        start_method=START_METHOD,
+    ) -> None:
+        self.client_factory = client_factory or BedrockClientFactory()
+        self.processes = processes or os.cpu_count()
+        self.threads_per_process = threads_per_process
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.processes,
+            mp_context=multiprocessing.get_context(start_method),
+            initializer=_init_worker,
+            initargs=(self.client_factory, threads_per_process, output_dir),
+        )
+
+    def map(self, items, chunksize=CHUNK_SIZE):
+        """
+        Run every work item and yield the WorkResults in input order.
+        Items are consumed lazily with a bounded number of chunks in flight, so memory stays
+        constant no matter how many items are passed.
+        """
+        max_in_flight = self.processes * 2
+        indexed_items = enumerate(items)
+        pending = deque()
+
+        while True:
+            while len(pending) < max_in_flight:
+                chunk = list(itertools.islice(indexed_items, chunksize))
+                if not chunk:
+                    break
+                pending.append(self.executor.submit(_run_chunk, chunk))
+
+            if not pending:
+                return
+            yield from pending.popleft().result()
+
+    def run(self, items, chunksize=CHUNK_SIZE):
+        """
+        Run every work item and return the list of WorkResults in input order
+        """
+        return list(self.map(items, chunksize))
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()